@@ -0,0 +1,115 @@
+# throughput and latency of sci.store against local stand-ins of each
+# backend, run with 'make benchmark'. extra_info['bytes'] is the data
+# moved per round, so MB/s = bytes / mean / 1048576.
+
+import os
+
+import pytest
+
+SIZES = {'1k': 1024, '1m': 1048576, '16m': 16777216}
+LISTING = 500
+
+
+def _fill(stor, n, meta=True):
+    """ n small objects, every other one tagged """
+    for i in range(n):
+        stor.object_put('obj%05d' % i, b'x',
+            {'tag': 'even' if i % 2 == 0 else 'odd'} if meta else None)
+
+
+@pytest.mark.parametrize('size', list(SIZES))
+def test_object_put(benchmark, store, size):
+    data = os.urandom(SIZES[size])
+    benchmark.extra_info['bytes'] = len(data)
+    benchmark(store.object_put, 'put.dat', data)
+
+
+@pytest.mark.parametrize('size', list(SIZES))
+def test_object_get(benchmark, store, size):
+    data = os.urandom(SIZES[size])
+    store.object_put('get.dat', data)
+    benchmark.extra_info['bytes'] = len(data)
+    assert benchmark(store.object_get, 'get.dat') == data
+
+
+def test_object_get_small_many(benchmark, store):
+    """ latency bound: 100 small objects, one request each """
+    _fill(store, 100, meta=False)
+    names = ['obj%05d' % i for i in range(100)]
+    benchmark(lambda: [store.object_get(n) for n in names])
+
+
+def test_bucket_list(benchmark, store):
+    _fill(store, LISTING, meta=False)
+    assert len(benchmark(store.bucket_list)) == LISTING
+
+
+def test_bucket_list_filtered(benchmark, store):
+    """ one metadata request per object """
+    _fill(store, LISTING)
+    result = benchmark.pedantic(store.bucket_list, args=({'tag': 'even'},),
+        rounds=3)
+    assert len(result) == LISTING // 2
+
+
+@pytest.mark.parametrize('workers', [1, 8])
+def test_file_upload(benchmark, store, tmp_path, workers):
+    paths = _files(tmp_path, 32, 262144)
+    _workers(store, workers)
+    benchmark.extra_info['bytes'] = 32 * 262144
+    uploaded = benchmark.pedantic(store.file_upload, args=(paths,), rounds=3)
+    assert len(uploaded) == 32
+
+
+@pytest.mark.parametrize('workers', [1, 8])
+def test_file_download(benchmark, store, tmp_path, workers):
+    names = store.file_upload(_files(tmp_path, 32, 262144))
+    _workers(store, workers)
+    benchmark.extra_info['bytes'] = 32 * 262144
+    downloaded = benchmark.pedantic(store.file_download,
+        args=(names, str(tmp_path / 'down')), rounds=3,
+        setup=lambda: os.makedirs(tmp_path / 'down', exist_ok=True))
+    assert len(downloaded) == 32
+
+
+def test_json_roundtrip(benchmark, store):
+    records = [{'id': i, 'name': 'name%s' % i, 'value': i * 0.5}
+               for i in range(10000)]
+
+    def _roundtrip():
+        store.object_put_json('records.json', records)
+        return store.object_get_json('records.json')
+
+    assert benchmark(_roundtrip) == records
+
+
+def test_csv_roundtrip(benchmark, store):
+    rows = [{'id': str(i), 'name': 'name%s' % i, 'value': str(i * 0.5)}
+            for i in range(10000)]
+
+    def _roundtrip():
+        store.object_put_csv('records.csv', rows, dictwriter=True)
+        return list(store.object_iter_csv('records.csv'))
+
+    assert benchmark(_roundtrip) == rows
+
+
+def _files(folder, n, size):
+    """ n files of size random bytes below folder/up """
+    os.makedirs(folder / 'up', exist_ok=True)
+    paths = []
+    for i in range(n):
+        path = str(folder / 'up' / ('file%03d' % i))
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def _workers(stor, workers):
+    """ number of parallel transfers of file_upload/file_download """
+    stor.workers = workers
+    if hasattr(stor, 'service_threads'):
+        stor.close()
+        stor.service_threads.update(object_dd_threads=workers,
+                                    object_uu_threads=workers)
@@ -0,0 +1,67 @@
+# fixtures of the storage benchmarks: each backend runs against a local
+# stand-in, swift against swiftserver.py, s3 against moto (or MinIO if
+# SCI_BENCH_S3_ENDPOINT is set, e.g. http://127.0.0.1:9000 with the
+# credentials in the usual AWS environment variables)
+
+import os, sys, uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sci
+
+BACKENDS = ['memory', 'posix', 's3', 'swift']
+
+
+@pytest.fixture(scope='session')
+def swift_server(tmp_path_factory):
+    import swiftserver
+    server = swiftserver.start()
+    # token authentication, the token cache goes to a temporary home
+    env = {'OS_STORAGE_URL': server.storageurl, 'OS_AUTH_TOKEN': swiftserver.TOKEN,
+           'OS_TENANT_NAME': 'bench', 'OS_PASSWORD': '',
+           'HOME': str(tmp_path_factory.mktemp('home'))}
+    saved = {k: os.environ.get(k) for k in env}
+    os.environ.update(env)
+    yield server
+    for k, v in saved.items():
+        if v is None:
+            os.environ.pop(k, None)
+        else:
+            os.environ[k] = v
+    server.shutdown()
+
+
+@pytest.fixture(scope='session')
+def s3_endpoint():
+    """ None for moto, which intercepts all boto3 requests """
+    endpoint = os.getenv('SCI_BENCH_S3_ENDPOINT')
+    if endpoint:
+        yield endpoint
+        return
+    moto = pytest.importorskip('moto')
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    with moto.mock_aws():
+        yield None
+
+
+@pytest.fixture(params=BACKENDS)
+def store(request, tmp_path):
+    """ an empty store of each backend with the prefix 'bench' """
+    bucket = 'bench-%s' % uuid.uuid4().hex[:12]
+    if request.param == 'memory':
+        stor = sci.store.memory(bucket, 'bench')
+    elif request.param == 'posix':
+        stor = sci.store.posix(str(tmp_path / 'store'), 'bench')
+    elif request.param == 's3':
+        endpoint = request.getfixturevalue('s3_endpoint')
+        stor = sci.store.s3(bucket, 'bench', endpoint_url=endpoint)
+        stor.s3conn.create_bucket(Bucket=bucket)
+    else:
+        request.getfixturevalue('swift_server')
+        stor = sci.store.swift(bucket, 'bench')
+        stor.swiftconn.put_container(bucket)
+    yield stor
+    stor.close()
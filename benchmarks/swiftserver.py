@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+# minimal in-memory stand-in for the swift object storage api, just enough
+# for sci.store.swift: token auth, container listings with prefix,
+# delimiter, marker and limit, object GET (ranges, If-Match,
+# If-None-Match), HEAD, PUT (also chunked and static large objects),
+# POST and DELETE. Not a test double for swift's semantics in general.
+#
+# python benchmarks/swiftserver.py 8080 starts it on its own, then
+#   export OS_STORAGE_URL=http://127.0.0.1:8080/v1/AUTH_bench
+#   export OS_AUTH_TOKEN=bench OS_TENANT_NAME=bench
+
+import datetime, hashlib, http.server, json, sys, threading, urllib.parse
+
+TOKEN = 'bench'
+
+
+class SwiftHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes, without TCP_NODELAY small
+    # responses wait for the delayed ack of the client (40 ms)
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._handle(self._get)
+
+    def do_HEAD(self):
+        self._handle(self._get)
+
+    def do_PUT(self):
+        self._handle(self._put)
+
+    def do_POST(self):
+        self._handle(self._post)
+
+    def do_DELETE(self):
+        self._handle(self._delete)
+
+    def _handle(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        self.query = dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+        # /v1/<account>/<container>/<object>
+        parts = urllib.parse.unquote(url.path).split('/', 4)[3:]
+        body = self._body()
+        if self.headers.get('X-Auth-Token') != TOKEN:
+            return self._send(401)
+        container = parts[0] if parts and parts[0] else None
+        objname = parts[1] if len(parts) > 1 and parts[1] else None
+        if not container:
+            return self._send(204)
+        # single dict operations are atomic, so requests need no lock
+        return method(container, objname, body)
+
+    def _body(self):
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            data = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                if not size:
+                    self.rfile.readline()
+                    return bytes(data)
+                data += self.rfile.read(size)
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        if 'Content-Length' not in (headers or {}):
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD' and status not in (204, 304):
+            self.wfile.write(body)
+
+    def _get(self, container, objname, body):
+        objects = self.server.containers.get(container)
+        if objects is None:
+            return self._send(404)
+        if not objname:
+            return self._listing(objects)
+        obj = objects.get(objname)
+        if obj is None:
+            return self._send(404)
+        headers = {'Etag': obj['etag'], 'Content-Type': obj['type'],
+                   'Last-Modified': obj['modified'], 'Accept-Ranges': 'bytes'}
+        headers.update(obj['meta'])
+        if obj['manifest'] is not None:
+            headers['X-Static-Large-Object'] = 'True'
+            if self.query.get('multipart-manifest') == 'get':
+                data = json.dumps(obj['manifest']).encode()
+                return self._send(200, data, dict(headers, **{
+                    'Content-Type': 'application/json'}))
+        if self.headers.get('If-None-Match') == obj['etag']:
+            return self._send(304, headers=headers)
+        if self.headers.get('If-Match') not in (None, obj['etag']):
+            return self._send(412)
+        data = self._content(obj)
+        rng = self.headers.get('Range')
+        if rng:
+            start, end = rng.split('=', 1)[1].split('-')
+            if not start:
+                start, end = max(len(data) - int(end), 0), len(data) - 1
+            start, end = int(start), int(end) if end else len(data) - 1
+            if start >= len(data):
+                return self._send(416)
+            end = min(end, len(data) - 1)
+            headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end, len(data))
+            if self.command == 'HEAD':
+                headers['Content-Length'] = str(end - start + 1)
+            return self._send(206, data[start:end + 1], headers)
+        if self.command == 'HEAD':
+            headers['Content-Length'] = str(len(data))
+        return self._send(200, data, headers)
+
+    def _content(self, obj):
+        """ the data of an object, segments of a large object joined """
+        if obj['manifest'] is None:
+            return obj['data']
+        data = bytearray()
+        for seg in obj['manifest']:
+            container, name = seg['name'].lstrip('/').split('/', 1)
+            data += self.server.containers[container][name]['data']
+        return bytes(data)
+
+    def _listing(self, objects):
+        prefix = self.query.get('prefix', '')
+        delimiter = self.query.get('delimiter')
+        marker = self.query.get('marker', '')
+        limit = int(self.query.get('limit', 10000))
+        items = []
+        for name in sorted(list(objects)):
+            if not name.startswith(prefix):
+                continue
+            i = name.find(delimiter, len(prefix)) if delimiter else -1
+            if i > -1:
+                subdir = name[:i + len(delimiter)]
+                if subdir > marker and (not items or
+                        items[-1].get('subdir') != subdir):
+                    items.append({'subdir': subdir})
+            elif name > marker:
+                obj = objects[name]
+                items.append({'name': name, 'hash': obj['etag'],
+                    'bytes': obj['size'], 'content_type': obj['type'],
+                    'last_modified': obj['iso']})
+            if len(items) >= limit:
+                break
+        return self._send(200, json.dumps(items).encode(),
+                          {'Content-Type': 'application/json; charset=utf-8'})
+
+    def _put(self, container, objname, body):
+        if not objname:
+            self.server.containers.setdefault(container, {})
+            return self._send(201)
+        objects = self.server.containers.get(container)
+        if objects is None:
+            return self._send(404)
+        manifest = None
+        size = len(body)
+        etag = hashlib.md5(body).hexdigest()
+        if self.query.get('multipart-manifest') == 'put':
+            manifest = [{'name': seg['path'], 'hash': seg['etag'],
+                         'bytes': seg['size_bytes']} for seg in json.loads(body)]
+            size = sum(seg['bytes'] for seg in manifest)
+            etag = hashlib.md5(''.join(seg['hash'] for seg in manifest)
+                               .encode()).hexdigest()
+            body = b''
+        now = datetime.datetime.now(datetime.timezone.utc)
+        objects[objname] = {'data': body, 'size': size, 'etag': etag,
+            'manifest': manifest, 'meta': self._meta(),
+            'type': self.headers.get('Content-Type') or 'application/octet-stream',
+            'modified': now.strftime('%a, %d %b %Y %H:%M:%S GMT'),
+            'iso': now.strftime('%Y-%m-%dT%H:%M:%S.%f')}
+        return self._send(201, headers={'Etag': etag})
+
+    def _post(self, container, objname, body):
+        obj = self.server.containers.get(container, {}).get(objname)
+        if obj is None:
+            return self._send(404)
+        obj['meta'] = self._meta()
+        return self._send(202)
+
+    def _delete(self, container, objname, body):
+        objects = self.server.containers.get(container, {})
+        if objname not in objects:
+            return self._send(404)
+        del objects[objname]
+        return self._send(204)
+
+    def _meta(self):
+        return {k.lower(): v for k, v in self.headers.items()
+                if k.lower().startswith('x-object-meta-')}
+
+
+def start(port=0):
+    """
+    start the server in a background thread and return it, the storage
+    url is server.storageurl
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), SwiftHandler)
+    server.daemon_threads = True
+    server.containers = {}
+    server.storageurl = 'http://127.0.0.1:%s/v1/AUTH_bench' % server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    server = start(int(sys.argv[1]) if len(sys.argv) > 1 else 8080)
+    print('swift stand-in listening on %s' % server.storageurl)
+    threading.Event().wait()
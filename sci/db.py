@@ -2,100 +2,1193 @@
 # db: functions for DBMS (postgres, mysql, sqlite, mssql etc)
 #
 
-import os
+import itertools, os, threading
 
-class postgres:
+"""
+Simplified classes for accessing relational databases. Currently
+implemented for Postgres (psycopg2), MySQL/MariaDB (pymysql), MS SQL
+Server (pyodbc) and SQLite. All classes share the methods of _dbconn.
+"""
+
+class _dbconn:
     """
-    Examples:
-    mydb = mssql('the-bucket', 'virtual/sub/directory')
-    
-    the password should be stored in ~/.pgpass
+    Base class of the database classes. It implements the public methods
+    once on top of a connection pool, a backend creates the pool with
+    _getpool() in __init__ and may override _stream_cursor and _ping.
     """
-    def __init__(self, host, dbname, user, password, port=5432):
-        """ 
-        just pass in a bucket and an optional prefix. The prefix can be a 
-        single virtual folder such as 'subfolder' or a virtual folder 
-        such as 'folder/subfolder/subfolder'. Example:
-        mystor = SwiftStorage('the-bucket', 'virtual/sub/directory') 
+
+    pool = None
+    cache = None
+    batch_size = 10000
+    # placeholder of query parameters of the driver
+    marker = '%s'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
         """
-        import psycopg2
-    def execute(self, sqlstr):
+        close the idle connections of the pool
+        Example:
+        mydb.close()
+        -------------------------
+        The pool is shared by all objects of the same database in this
+        process, it opens new connections when it is used again.
+        """
+        if self.pool:
+            self.pool.close()
+
+    def invalidate(self, *tables):
+        """
+        drop cached results of queries that read from any of the tables
+        Examples:
+        mydb.invalidate('jobs', 'users')
+        -------------------------
+        mydb.invalidate()
+        -------------------------
+        without tables the whole result cache is dropped
+        """
+        if self.cache:
+            self.cache.invalidate(tables or None)
+
+    def execute(self, sqlstr, params=None):
+        """
+        execute a sql command on the database and commit it
+        Examples:
+        n = mydb.execute("delete from jobs where finished < '2020-01-01'")
+        -------------------------
+        mydb.execute('update jobs set state = %s where id = %s', ('done', 12))
+        -------------------------
+        returns the number of rows changed. params are passed to the
+        driver, which quotes them, the placeholder is %s for postgres and
+        mysql and ? for mssql and sqlite (see the marker attribute).
+        If the command fails the transaction is rolled back.
+        """
+        with self.pool.connection() as conn:
+            with self._cursor(conn, sqlstr) as cur:
+                self._execute(conn, cur, sqlstr, params)
+                conn.commit()
+                self._changed(sqlstr)
+                return cur.rowcount
+
+    def executemany(self, sqlstr, seq_of_params):
+        """
+        execute a sql command once for every set of parameters and commit
+        Example:
+        mydb.executemany('insert into jobs values (%s, %s)', [(1, 'a'), (2, 'b')])
+        -------------------------
+        all commands run in one transaction, use bulk_insert() to load
+        large amounts of data.
+        """
+        with self.pool.connection() as conn:
+            with self._cursor(conn, sqlstr) as cur:
+                cur.executemany(sqlstr, seq_of_params)
+                conn.commit()
+                self._changed(sqlstr)
+                return cur.rowcount
+
+    def fetch(self, sqlstr, params=None, stream=False, batch_size=None,
+            cache=True):
+        """
+        return the result of a SQL query as a list of dictionaries
+        Examples:
+        rows = mydb.fetch('select id, name from users')
+        print(rows[0]['name'])
+        -------------------------
+        rows = mydb.fetch('select * from users where id = %s', (42,))
+        -------------------------
+        for row in mydb.fetch('select * from pubmed', stream=True):
+            print(row['pmid'])
+        -------------------------
+        params are passed to the driver like in execute(). With stream=True
+        a generator is returned instead. It fetches batch_size rows at a
+        time (10000 by default) using a server side cursor where the
+        database supports it, so that results of any size are processed
+        with constant memory. The generator holds a connection of the
+        pool until it is exhausted or closed, a query that needs another
+        connection while all are held by streams of the same thread
+        raises a RuntimeError.
+        If the object was created with a result cache, the rows of an
+        earlier identical query are returned while they are younger than
+        cache_ttl, cache=False runs the query anyway. Streams are never
+        cached.
+        """
+        if stream:
+            return self._stream(sqlstr, params, batch_size or self.batch_size)
+        if not self.cache or not cache:
+            return self._fetch(sqlstr, params)
+        key = self.cache.key(sqlstr, params)
+        rows = self.cache.get(key)
+        if rows is None:
+            rows = self._fetch(sqlstr, params)
+            self.cache.put(key, _tables(sqlstr), rows)
+        return rows
+
+    def _fetch(self, sqlstr, params):
+        """ run a query and return all rows as dicts """
+        with self.pool.connection() as conn:
+            with self._cursor(conn, sqlstr) as cur:
+                self._execute(conn, cur, sqlstr, params)
+                rows = cur.fetchall()
+                columns = _columns(cur)
+                # end the read transaction, it would block vacuum
+                conn.commit()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def bulk_insert(self, table, rows, batch_size=None, columns=None):
+        """
+        insert many rows into a table with the fastest method of the database
+        Examples:
+        mydb.bulk_insert('jobs', [(1, 'align'), (2, 'sort')], columns=['id', 'name'])
+        -------------------------
+        mydb.bulk_insert('jobs', [{'id': 1, 'name': 'align'}])
+        -------------------------
+        with open('jobs.csv') as f:
+            mydb.bulk_insert('jobs', f)
+        -------------------------
+        rows is an iterable of tuples or dicts or an open CSV file (text or
+        binary) whose first line has the column names. columns defaults
+        to the keys of the first dict or the CSV header and can be left
+        out for tuples that fill all columns of the table. Rows are sent
+        in batches of batch_size (10000 by default) with COPY on postgres,
+        multi-row INSERTs on mysql, fast_executemany on mssql and
+        executemany on sqlite, all in one transaction. Returns the number
+        of rows inserted.
+        """
+        batch_size = batch_size or self.batch_size
+        columns, rows = _tuples(rows, columns)
+        count = 0
+        with self.pool.connection() as conn:
+            with self._bulk_settings(conn):
+                cur = conn.cursor()
+                try:
+                    while True:
+                        batch = list(itertools.islice(rows, batch_size))
+                        if not batch:
+                            break
+                        self._insert_batch(cur, table, columns, batch)
+                        count += len(batch)
+                    conn.commit()
+                finally:
+                    cur.close()
+        self.invalidate(table)
+        return count
+
+    def fetch_to_object(self, sqlstr, store, objname, params=None,
+            metadict=None, codec=None, batch_size=None, compression='zstd',
+            part_size=None, workers=4):
         """
-        execute a sql command on the database
+        write the result of a query to an object as csv, json lines or parquet
+        Examples:
+        n = mydb.fetch_to_object('select * from pubmed', mystor, 'pubmed.csv.zst')
+        -------------------------
+        mydb.fetch_to_object('select * from jobs where day = %s', mystor,
+            'jobs.parquet', params=('2021-03-01',))
+        -------------------------
+        The format follows the extension of objname: *.csv (with a header
+        line), *.jsonl, *.ndjson or *.json (one json object per line) or
+        *.parquet. csv and json objects named *.gz, *.zst or *.lz4 are
+        compressed, see store.object_put_json(). Parquet columns are
+        compressed with 'compression' and a row group is written per
+        batch, which requires pyarrow (pip install sci[parquet]).
+        The rows are read batch_size at a time like with fetch(stream=True)
+        and the next batch is fetched while the last one is written, the
+        store uploads parts of part_size bytes with 'workers' threads in
+        the background, so memory use does not depend on the result size.
+        Returns the number of rows.
         """
-    def fetch(self, sqlstr):
+        from .store import _codec
+        fmt = _format(objname)
+        batches = _prefetch(self._batches(sqlstr, params,
+            batch_size or self.batch_size))
+        count = 0
+        try:
+            if fmt == 'parquet':
+                with store.object_writer(objname, metadict, part_size=part_size,
+                        workers=workers) as f:
+                    count = _write_parquet(f, batches, compression)
+                return count
+            with store.object_writer(objname, metadict, text=True,
+                    part_size=part_size, workers=workers,
+                    codec=_codec(objname, codec)) as f:
+                for columns, rows in batches:
+                    count += len(rows)
+                    if fmt == 'csv':
+                        _write_csv(f, columns, rows, count == len(rows))
+                    else:
+                        _write_jsonl(f, columns, rows)
+        finally:
+            batches.close()
+        return count
+
+    def insert_from_object(self, table, store, objname, columns=None,
+            codec=None, batch_size=None):
+        """
+        insert the rows of a csv, json lines or parquet object into a table
+        Examples:
+        n = mydb.insert_from_object('pubmed', mystor, 'pubmed.csv.zst')
+        -------------------------
+        The formats are the ones of fetch_to_object(). csv objects need a
+        header line, empty csv fields are inserted as NULL. The object is
+        downloaded and decompressed in a background thread while the rows
+        are sent to the database with bulk_insert() in batches of
+        batch_size, so memory use does not depend on the object size.
+        Returns the number of rows.
+        """
+        batch_size = batch_size or self.batch_size
+        header, rows = _read_rows(store, objname, codec, batch_size)
+        rows = itertools.chain.from_iterable(_prefetch(_chunks(rows, batch_size)))
+        return self.bulk_insert(table, rows, batch_size, columns or header)
+
+    def _stream(self, sqlstr, params, batch_size):
+        """ generator of the rows of a query, see fetch() """
+        for columns, rows in self._batches(sqlstr, params, batch_size):
+            for row in rows:
+                yield dict(zip(columns, row))
+
+    def _batches(self, sqlstr, params, batch_size):
+        """ generator of the column names and lists of rows of a query """
+        with self.pool.connection() as conn:
+            cur = self._stream_cursor(conn, batch_size)
+            try:
+                _execute(cur, sqlstr, params)
+                columns = None
+                while True:
+                    rows = cur.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    if columns is None:
+                        # named cursors only know the columns after a fetch
+                        columns = _columns(cur)
+                    yield columns, rows
+                if columns is None and cur.description:
+                    # an empty result still has a csv header or schema
+                    yield _columns(cur), []
+                conn.commit()
+            finally:
+                cur.close()
+
+    def _cache_setup(self, key, cache, ttl, size):
+        """ result cache of fetch(), see postgres() """
+        if cache:
+            self.cache = _resultcache(repr(key), ttl, size,
+                None if cache is True else cache)
+
+    def _changed(self, sqlstr):
         """
-        return the result of a SQL query as a dictionary
+        invalidate cached results of the tables a command changes, a
+        query only changes the targets of the insert, update or delete
+        of a data modifying CTE (or SELECT INTO)
         """
+        words = sqlstr.split(None, 1)
+        if not self.cache or not words:
+            return
+        if words[0].lower() not in ('select', 'with'):
+            self.invalidate(*_tables(sqlstr))
+            return
+        targets = _targets(sqlstr)
+        if targets:
+            self.invalidate(*targets)
+
+    def _stream_cursor(self, conn, batch_size):
+        """ cursor that does not load the whole result at once """
+        return conn.cursor()
+
+    def _cursor(self, conn, sqlstr):
+        """ context manager with a cursor for sqlstr """
+        import contextlib
+        return contextlib.closing(conn.cursor())
+
+    def _execute(self, conn, cur, sqlstr, params):
+        """ execute a query, backends may use prepared statements here """
+        _execute(cur, sqlstr, params)
 
-class mysql:
+    def _insert_batch(self, cur, table, columns, batch):
+        """ insert a list of tuples """
+        cur.executemany(_insertsql(table, columns, len(batch[0]),
+            self.marker), batch)
+
+    def _bulk_settings(self, conn):
+        """ context manager with settings of the connection for bulk_insert """
+        import contextlib
+        return contextlib.nullcontext()
+
+    def _ping(self, conn):
+        """ raise an exception if the connection is broken """
+        cur = conn.cursor()
+        try:
+            cur.execute('select 1')
+            cur.fetchall()
+        finally:
+            cur.close()
+        conn.rollback()
+
+
+class postgres(_dbconn):
     """
-    Examples:
-    mystor = mssql('the-bucket', 'virtual/sub/directory')
+    Connect to a Postgres database
+    Example:
+    mydb = sci.db.postgres('dbhost', 'mydb', 'myuser')
+    rows = mydb.fetch('select * from jobs')
+    -------------------------
+    the password should be stored in ~/.pgpass (or ~/.sci/.dbpasswd)
     """
-    def __init__(self, host, dbname, user, password, port=3306):
-        """ 
-        just pass in a bucket and an optional prefix. The prefix can be a 
-        single virtual folder such as 'subfolder' or a virtual folder 
-        such as 'folder/subfolder/subfolder'. Example:
-        mystor = SwiftStorage('the-bucket', 'virtual/sub/directory') 
+    def __init__(self, host, dbname, user, password=None, port=5432,
+            pool_min=1, pool_max=10, health_interval=30, statement_cache=100,
+            cache=None, cache_ttl=300, cache_size=268435456):
         """
-        import PyMySQL
-    def execute(self, sqlstr):
+        Examples:
+        mydb = postgres('dbhost', 'mydb', 'myuser', port=5433)
+        -------------------------
+        Connections are kept in a pool that is shared by all postgres
+        objects of this database and user in the process. At least
+        pool_min connections stay open and at most pool_max are opened,
+        callers wait for a free connection beyond that. A connection
+        that was idle for more than health_interval seconds is tested
+        before it is reused and replaced if it is broken.
+        Queries with a tuple of params are prepared on the server, so
+        that they are parsed and planned only once per connection. The
+        last statement_cache of them are kept per connection, 0 turns
+        this off.
+        -------------------------
+        mydb = postgres('dbhost', 'mydb', 'myuser', cache=True, cache_ttl=600)
+        -------------------------
+        With cache=True the results of fetch() are kept in memory for
+        cache_ttl seconds, with a folder name as cache they are also
+        written to a sqlite file in that folder, which is shared by all
+        processes on the machine. Each tier holds up to cache_size bytes
+        and drops the least recently used results beyond that. Results
+        of a table are dropped when it is changed with execute(),
+        executemany() or bulk_insert() of this object; for changes made
+        elsewhere call invalidate(). mydb.cache.stats() returns the number
+        of hits and misses.
         """
-        execute a sql command on the database
+        import psycopg2
+        if password is None:
+            # psycopg2 falls back to ~/.pgpass if this is None too
+            password = _getdbpasswd(host, port, dbname, user)
+
+        def _connect():
+            return psycopg2.connect(host=host, dbname=dbname, user=user,
+                password=password, port=port)
+
+        key = ('postgres', host, port, dbname, user)
+        self.statement_cache = statement_cache
+        self.pool = _getpool(key, _connect, self._ping, pool_min, pool_max,
+            health_interval)
+        self._cache_setup(key, cache, cache_ttl, cache_size)
+
+    def _execute(self, conn, cur, sqlstr, params):
+        """ 
+        PREPARE the query on first use and EXECUTE it, other statements
+        such as DDL or SET cannot be prepared and are executed directly
         """
-    def fetch(self, sqlstr):
+        words = sqlstr.split(None, 1)
+        if not self.statement_cache or not isinstance(params, (tuple, list)) \
+                or '%(' in sqlstr or not words or words[0].lower() not in (
+                'select', 'insert', 'update', 'delete', 'values'):
+            return _execute(cur, sqlstr, params)
+        statements = self.pool.statements(conn, self.statement_cache)
+        name = statements.get(sqlstr)
+        if name is None:
+            if not statements:
+                # a new cache after a rollback or reconnect starts clean
+                cur.execute('DEALLOCATE ALL')
+            name = 'sci_%s' % next(_statement_ids)
+            cur.execute('PREPARE %s AS %s' % (name, _numbered(sqlstr)))
+            for old, oldname in statements.put(sqlstr, name):
+                cur.execute('DEALLOCATE %s' % oldname)
+        if params:
+            cur.execute('EXECUTE %s (%s)' % (name, ', '.join(['%s'] * len(params))),
+                params)
+        else:
+            cur.execute('EXECUTE %s' % name)
+
+    def _stream_cursor(self, conn, batch_size):
+        """ named (server side) cursor, rows are sent in batches """
+        import uuid
+        cur = conn.cursor(name='sci_%s' % uuid.uuid4().hex)
+        cur.itersize = batch_size
+        return cur
+
+    def _insert_batch(self, cur, table, columns, batch):
+        """ COPY the batch as CSV, which is much faster than INSERT """
+        import io
+        buf = io.StringIO()
+        buf.writelines(','.join(map(_copyvalue, row)) + '\n' for row in batch)
+        buf.seek(0)
+        cols = ' (%s)' % ', '.join(columns) if columns else ''
+        cur.copy_expert('COPY %s%s FROM STDIN WITH (FORMAT csv)' % (
+            table, cols), buf)
+
+class mysql(_dbconn):
+    """
+    Connect to a MySQL or MariaDB database
+    Example:
+    mydb = sci.db.mysql('dbhost', 'mydb', 'myuser', 'secret')
+    rows = mydb.fetch('select * from jobs')
+    -------------------------
+    the password can be stored in ~/.sci/.dbpasswd
+    """
+    def __init__(self, host, dbname, user, password=None, port=3306,
+            pool_min=1, pool_max=10, health_interval=30, cache=None,
+            cache_ttl=300, cache_size=268435456):
         """
-        return the result of a SQL query as a dictionary
+        Examples:
+        mydb = mysql('dbhost', 'mydb', 'myuser')
+        -------------------------
+        see postgres() for the connection pool and the result cache.
+        pymysql quotes params on the client, so there is no prepared
+        statement cache.
         """
+        import pymysql
+        if password is None:
+            password = _getdbpasswd(host, port, dbname, user) or ''
 
-class mssql:
+        def _connect():
+            return pymysql.connect(host=host, database=dbname, user=user,
+                password=password, port=port, charset='utf8mb4')
+
+        key = ('mysql', host, port, dbname, user)
+        self.pool = _getpool(key, _connect, self._ping, pool_min, pool_max,
+            health_interval)
+        self._cache_setup(key, cache, cache_ttl, cache_size)
+
+    def _stream_cursor(self, conn, batch_size):
+        """ unbuffered cursor, rows are read from the socket as needed """
+        import pymysql.cursors
+        return conn.cursor(pymysql.cursors.SSCursor)
+
+    # _insert_batch: pymysql's executemany already sends an INSERT ...
+    # VALUES as multi-row statements of up to max_allowed_packet bytes
+
+class mssql(_dbconn):
     """
-    Examples:
-    mystor = mssql('the-bucket', 'virtual/sub/directory')
+    Connect to a Microsoft SQL Server database
+    Example:
+    mydb = sci.db.mssql('dbhost', 'mydb', 'myuser', 'secret')
+    rows = mydb.fetch('select top 10 * from jobs')
+    -------------------------
+    the password can be stored in ~/.sci/.dbpasswd
     """
-    def __init__(self, host, dbname, user, password, port=1433):
-        """ 
-        just pass in a bucket and an optional prefix. The prefix can be a 
-        single virtual folder such as 'subfolder' or a virtual folder 
-        such as 'folder/subfolder/subfolder'. Example:
-        mystor = SwiftStorage('the-bucket', 'virtual/sub/directory') 
+    marker = '?'
+
+    def __init__(self, host, dbname, user, password=None, port=1433,
+            pool_min=1, pool_max=10, health_interval=30,
+            driver='ODBC Driver 17 for SQL Server', statement_cache=100,
+            cache=None, cache_ttl=300, cache_size=268435456):
+        """
+        Examples:
+        mydb = mssql('dbhost', 'mydb', 'myuser', driver='FreeTDS')
+        -------------------------
+        driver is the name of the installed ODBC driver, see postgres()
+        for the connection pool and the result cache. pyodbc prepares a query once and reuses
+        it while it executes the same sql on the same cursor, so one
+        cursor per query is kept for the last statement_cache queries.
         """
         import pyodbc
-    def execute(self, sqlstr):
+        if password is None:
+            password = _getdbpasswd(host, port, dbname, user) or ''
+        connstr = 'DRIVER={%s};SERVER=%s,%s;DATABASE=%s;UID=%s;PWD=%s' % (
+            driver, host, port, dbname, user, password)
+
+        def _connect():
+            return pyodbc.connect(connstr)
+
+        key = ('mssql', host, port, dbname, user)
+        self.statement_cache = statement_cache
+        self.pool = _getpool(key, _connect, self._ping, pool_min, pool_max,
+            health_interval)
+        self._cache_setup(key, cache, cache_ttl, cache_size)
+
+    def _cursor(self, conn, sqlstr):
+        """ the cursor that has sqlstr prepared """
+        import contextlib
+        if not self.statement_cache:
+            return contextlib.closing(conn.cursor())
+        statements = self.pool.statements(conn, self.statement_cache)
+        cur = statements.get(sqlstr)
+        if cur is None:
+            cur = conn.cursor()
+            for old, oldcur in statements.put(sqlstr, cur):
+                oldcur.close()
+        return contextlib.nullcontext(cur)
+
+    def _insert_batch(self, cur, table, columns, batch):
+        """ send the batch as one array of parameters, not row by row """
+        cur.fast_executemany = True
+        _dbconn._insert_batch(self, cur, table, columns, batch)
+
+class sqlite(_dbconn):
+    """
+    Open a local SQLite database
+    Example:
+    mydb = sci.db.sqlite('~/data/jobs.sqlite')
+    rows = mydb.fetch('select * from jobs')
+    """
+    marker = '?'
+
+    def __init__(self, dbname, pool_max=4, statement_cache=100, cache=None,
+            cache_ttl=300, cache_size=268435456):
         """
-        execute a sql command on the database
+        dbname is a file name of a local database.
+        use :memory: as filename to create the database in RAM
+        -------------------------
+        sqlite3 keeps the last statement_cache compiled queries of each
+        connection, see postgres() for the result cache.
+        -------------------------
+        Every connection to :memory: is a database of its own, so that
+        one is shared by all sqlite(':memory:') objects of a thread.
         """
-    def fetch(self, sqlstr):
+        import sqlite3
+        if dbname == ':memory:':
+            key = ('sqlite', dbname, threading.get_ident())
+            pool_max = 1
+        else:
+            dbname = os.path.abspath(os.path.expanduser(dbname))
+            key = ('sqlite', dbname)
+
+        def _connect():
+            # the pool hands a connection to one thread at a time
+            return sqlite3.connect(dbname, check_same_thread=False,
+                cached_statements=statement_cache)
+
+        self.pool = _getpool(key, _connect, self._ping, 1, pool_max, 300)
+        self._cache_setup(key, cache, cache_ttl, cache_size)
+
+    def _bulk_settings(self, conn):
         """
-        return the result of a SQL query as a dictionary
+        no fsync and a larger page cache while loading. temp_store is
+        left alone, changing it drops the temp tables of the connection
         """
+        import contextlib
+
+        @contextlib.contextmanager
+        def _settings():
+            saved = [(p, conn.execute('PRAGMA %s' % p).fetchone()[0])
+                     for p in ('synchronous', 'cache_size')]
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute('PRAGMA cache_size = -262144')
+            try:
+                yield
+            finally:
+                for p, value in saved:
+                    conn.execute('PRAGMA %s = %s' % (p, value))
 
-class sqlite:
+        return _settings()
+
+
+# connection pools of this process by connection parameters
+_pools = {}
+_poollock = threading.Lock()
+# names of prepared statements
+_statement_ids = itertools.count()
+
+def _getpool(key, connect, ping, min_size, max_size, health_interval):
     """
-    Examples:
-    mystor = mssql('the-bucket', 'virtual/sub/directory')
+    return the pool of connections for key, a forked process gets pools
+    of its own because connections cannot be shared with the parent
     """
-    def __init__(self, dbname):
-        """ 
-        dbname is a file name of a local database. 
-        use :memory: as filename to create the database in RAM 
+    key = (os.getpid(),) + key
+    with _poollock:
+        if key not in _pools:
+            _pools[key] = _pool(connect, ping, min_size, max_size,
+                health_interval)
+        return _pools[key]
+
+
+class _pool:
+    """
+    thread safe pool of database connections. min_size connections are
+    opened at once and kept open, at most max_size are open at any time.
+    A thread that asks for a connection while it holds all of them gets
+    a RuntimeError instead of waiting for itself forever.
+    """
+
+    def __init__(self, connect, ping, min_size, max_size, health_interval,
+            max_idle=300):
+        import time
+        self.connect = connect
+        self.ping = ping
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.health_interval = health_interval
+        self.max_idle = max_idle
+        self.idle = []
+        self.size = 0
+        self.cond = threading.Condition()
+        self.counts = {'opened': 0, 'reused': 0, 'broken': 0}
+        # thread that holds a connection by id of the connection
+        self.holders = {}
+        # prepared statements by id of the connection
+        self.caches = {}
+        for i in range(min(min_size, self.max_size)):
+            self.idle.append((self._open(), time.time()))
+            self.size += 1
+
+    def connection(self, timeout=None):
         """
-        import sqlite3
-    def execute(self, sqlstr):
+        context manager that takes a connection from the pool and puts
+        it back, the transaction is rolled back if the block raises
+        """
+        import contextlib
+
+        @contextlib.contextmanager
+        def _connection():
+            conn = self.acquire(timeout)
+            try:
+                yield conn
+            except BaseException:
+                broken = False
+                try:
+                    conn.rollback()
+                    self.reset(conn)
+                except Exception:
+                    broken = True
+                self.release(conn, broken)
+                raise
+            self.release(conn)
+
+        return _connection()
+
+    def acquire(self, timeout=None):
+        """ return an idle, a tested or a new connection """
+        import time
+        me = threading.get_ident()
+        with self.cond:
+            while not self.idle and self.size >= self.max_size:
+                if list(self.holders.values()).count(me) >= self.size:
+                    raise RuntimeError('all %s database connections are used '
+                        'by this thread, e.g. by a streaming fetch, increase '
+                        'pool_max or finish the stream first' % self.size)
+                if not self.cond.wait(timeout):
+                    raise TimeoutError('no free database connection '
+                        'after %s seconds' % timeout)
+            if not self.idle:
+                self.size += 1
+                conn = None
+            else:
+                conn, used = self.idle.pop()
+        if conn is not None:
+            healthy = time.time() - used < self.health_interval or \
+                self._healthy(conn)
+            with self.cond:
+                self.counts['reused' if healthy else 'broken'] += 1
+                if healthy:
+                    self.holders[id(conn)] = me
+            if healthy:
+                return conn
+            self._discard(conn)
+        try:
+            conn = self._open()
+            with self.cond:
+                self.holders[id(conn)] = me
+            return conn
+        except BaseException:
+            with self.cond:
+                self.size -= 1
+                self.cond.notify()
+            raise
+
+    def release(self, conn, broken=False):
+        """ put a connection back, broken connections are closed """
+        import time
+        now = time.time()
+        with self.cond:
+            self.holders.pop(id(conn), None)
+            if broken:
+                self.size -= 1
+                self._discard(conn)
+            else:
+                self.idle.append((conn, now))
+            # connections beyond min_size are closed when unused for long
+            while len(self.idle) > self.min_size and \
+                    now - self.idle[0][1] > self.max_idle:
+                self.size -= 1
+                self._discard(self.idle.pop(0)[0])
+            self.cond.notify()
+
+    def close(self):
+        """ close all idle connections """
+        with self.cond:
+            for conn, used in self.idle:
+                self._discard(conn)
+            self.size -= len(self.idle)
+            self.idle = []
+
+    def stats(self):
+        """
+        return the number of open and idle connections and how often
+        they were opened, reused or replaced because they were broken
         """
-        execute a sql command on the database
+        with self.cond:
+            return dict(self.counts, size=self.size, idle=len(self.idle))
+
+    def statements(self, conn, size):
+        """ the LRU cache of prepared statements of a connection """
+        cache = self.caches.get(id(conn))
+        if cache is None:
+            cache = self.caches[id(conn)] = _lru(size)
+        return cache
+
+    def reset(self, conn):
+        """
+        forget the prepared statements of a connection after a rollback,
+        the next query prepares them again. Cached cursors are closed.
         """
-    def fetch(self, sqlstr):
+        cache = self.caches.pop(id(conn), None)
+        for sqlstr, value in cache.items.items() if cache else ():
+            # mssql caches cursors, postgres the names of statements
+            if hasattr(value, 'close'):
+                _close(value)
+
+    def _discard(self, conn):
+        self.reset(conn)
+        _close(conn)
+
+    def _open(self):
+        conn = self.connect()
+        with self.cond:
+            self.counts['opened'] += 1
+        return conn
+
+    def _healthy(self, conn):
+        try:
+            self.ping(conn)
+            return True
+        except Exception:
+            return False
+
+
+def _tuples(rows, columns=None):
+    """
+    return the column names and an iterator of tuples for the rows of
+    bulk_insert: tuples, dicts or a CSV file object
+    """
+    import io
+    if hasattr(rows, 'read'):
+        if not isinstance(rows, io.TextIOBase):
+            rows = io.TextIOWrapper(rows, encoding='utf-8', newline='')
+        header, rows = _csvrows(rows)
+        return columns or header, rows
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return columns, iter(())
+    rows = itertools.chain([first], rows)
+    if isinstance(first, dict):
+        columns = columns or list(first)
+        return columns, (tuple(r.get(c) for c in columns) for r in rows)
+    return columns, (tuple(r) for r in rows)
+
+def _csvrows(handle):
+    """
+    header and generator of tuples of a csv text handle, empty fields
+    are None like with COPY
+    """
+    import csv
+    reader = csv.reader(handle)
+    header = next(reader, None)
+    return header, (tuple(v if v != '' else None for v in r) for r in reader)
+
+def _format(objname):
+    """ csv, jsonl or parquet after the extension of an object """
+    from .store import CODEC_EXTENSIONS
+    parts = objname.lower().split('.')
+    if parts[-1] in CODEC_EXTENSIONS:
+        parts.pop()
+    ext = parts[-1] if len(parts) > 1 else ''
+    if ext in ('jsonl', 'ndjson', 'json'):
+        return 'jsonl'
+    if ext in ('csv', 'parquet'):
+        return ext
+    raise ValueError('unknown format of %s, use *.csv, *.jsonl or *.parquet'
+        % objname)
+
+def _write_csv(f, columns, rows, header):
+    import csv
+    w = csv.writer(f)
+    if header:
+        w.writerow(columns)
+    w.writerows(rows)
+
+def _write_jsonl(f, columns, rows):
+    import json
+    f.writelines(json.dumps(dict(zip(columns, row)), default=str,
+        separators=(',', ':')) + '\n' for row in rows)
+
+def _write_parquet(f, batches, compression):
+    """ 
+    one row group per batch, the schema comes from the first batches, 
+    they are held back while a column has only NULLs so far
+    """
+    import pyarrow, pyarrow.parquet
+    writer = None
+    pending = []
+    count = 0
+
+    def _open(tables):
+        schema = pyarrow.unify_schemas([t.schema for t in tables])
+        writer = pyarrow.parquet.ParquetWriter(f, schema,
+            compression=compression)
+        for t in tables:
+            writer.write_table(t.cast(schema))
+        return writer
+
+    try:
+        for columns, rows in batches:
+            data = {c: [row[i] for row in rows] for i, c in enumerate(columns)}
+            if writer is None:
+                pending.append(pyarrow.Table.from_pydict(data))
+                types = pyarrow.unify_schemas([t.schema for t in pending]).types
+                if not any(pyarrow.types.is_null(t) for t in types):
+                    writer, pending = _open(pending), []
+            else:
+                writer.write_table(pyarrow.Table.from_pydict(data,
+                    schema=writer.schema))
+            count += len(rows)
+        if pending:
+            writer = _open(pending)
+    finally:
+        if writer:
+            writer.close()
+    return count
+
+def _read_rows(store, objname, codec, batch_size):
+    """ column names (None for json) and generator of rows of an object """
+    from .store import _texthandle
+    fmt = _format(objname)
+    if fmt == 'parquet':
+        import pyarrow.parquet
+        f = store.object_open(objname)
+        pf = pyarrow.parquet.ParquetFile(f)
+
+        def _parquet():
+            with f:
+                for batch in pf.iter_batches(batch_size):
+                    yield from zip(*(c.to_pylist() for c in batch.columns))
+
+        return pf.schema_arrow.names, _parquet()
+    handle = _texthandle(store._reader(objname, codec))
+    if fmt == 'csv':
+        return _csvrows(handle)
+
+    def _jsonl():
+        import json
+        for line in handle:
+            if line.strip():
+                yield json.loads(line)
+
+    return None, _jsonl()
+
+def _chunks(rows, size):
+    """ lists of up to size items """
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _prefetch(items, depth=2):
+    """
+    iterate over items in a background thread that stays up to depth
+    items ahead, so that producing the next item overlaps with using
+    the last one. Closing the generator stops the thread.
+    """
+    import queue
+    q = queue.Queue(depth)
+    stop = threading.Event()
+    end = object()
+
+    def _put(item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce():
+        try:
+            for item in items:
+                if not _put((item, None)):
+                    break
+            else:
+                _put((end, None))
+        except BaseException as e:
+            _put((end, e))
+        finally:
+            # releases the connection of a _batches generator
+            if hasattr(items, 'close'):
+                items.close()
+
+    threading.Thread(target=_produce, daemon=True).start()
+    try:
+        while True:
+            item, error = q.get()
+            if item is end:
+                if error:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+def _copyvalue(value):
+    """
+    CSV field for COPY: None is left empty and unquoted, which COPY reads
+    as NULL, everything but numbers is quoted so "" stays an empty string.
+    bytes use the hex format of bytea, dicts and lists are sent as json
+    """
+    import json
+    if value is None:
+        return ''
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return repr(value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\x' + bytes(value).hex()
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return '"%s"' % str(value).replace('"', '""')
+
+def _insertsql(table, columns, n, marker):
+    """ INSERT statement with n parameters """
+    cols = ' (%s)' % ', '.join(columns) if columns else ''
+    return 'INSERT INTO %s%s VALUES (%s)' % (table, cols,
+        ', '.join([marker] * n))
+
+class _lru:
+    """ dictionary that keeps the maxsize most recently used items """
+
+    def __init__(self, maxsize):
+        import collections
+        self.maxsize = maxsize
+        self.items = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, default=None):
+        if key not in self.items:
+            return default
+        self.items.move_to_end(key)
+        return self.items[key]
+
+    def put(self, key, value):
+        """ store an item and return the evicted (key, value) pairs """
+        self.items[key] = value
+        self.items.move_to_end(key)
+        evicted = []
+        while len(self.items) > self.maxsize:
+            evicted.append(self.items.popitem(last=False))
+        return evicted
+
+
+class _resultcache:
+    """
+    cache of query results with a TTL: an LRU dict of pickled results
+    in memory and optionally a sqlite file in folder that is shared
+    with other processes. Each result records the tables the query
+    reads, so that they can be dropped when a table changes.
+    """
+
+    def __init__(self, namespace, ttl, maxsize, folder=None):
+        import collections
+        self.namespace = namespace
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.items = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.counts = {'hits': 0, 'misses': 0, 'evictions': 0,
+                       'invalidations': 0}
+        self.conn = None
+        if folder:
+            import sqlite3
+            folder = os.path.expanduser(folder)
+            os.makedirs(folder, exist_ok=True)
+            self.conn = sqlite3.connect(os.path.join(folder, 'dbcache.sqlite'),
+                timeout=60, check_same_thread=False)
+            with self.conn:
+                self.conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                    'key TEXT PRIMARY KEY, namespace TEXT, tables TEXT, '
+                    'expires REAL, size INTEGER, atime REAL, data BLOB)')
+
+    def stats(self):
         """
-        return the result of a SQL query as a dictionary
+        return a dict with the number of hits, misses, evictions and
+        invalidations and the number and size of results in memory
         """
+        with self.lock:
+            return dict(self.counts, entries=len(self.items), size=self.size)
+
+    def key(self, sqlstr, params):
+        """ the same key for queries that differ only in whitespace """
+        import hashlib
+        return hashlib.sha1(repr((self.namespace, _normalize(sqlstr),
+            params)).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """ return the rows of a query or None """
+        import pickle, time
+        now = time.time()
+        with self.lock:
+            item = self.items.get(key)
+            if item and item[0] < now:
+                self._drop(key)
+                item = None
+            if item is None and self.conn:
+                row = self.conn.execute('SELECT expires, tables, data FROM '
+                    'results WHERE key = ? AND expires >= ?', (key, now)).fetchone()
+                if row:
+                    item = (row[0], set(row[1].strip(',').split(',')), row[2])
+                    self._keep(key, *item)
+                    with self.conn:
+                        self.conn.execute('UPDATE results SET atime = ? '
+                            'WHERE key = ?', (now, key))
+            if item is None:
+                self.counts['misses'] += 1
+                return None
+            self.items.move_to_end(key)
+            self.counts['hits'] += 1
+        return pickle.loads(item[2])
+
+    def put(self, key, tables, rows):
+        """ add the rows of a query """
+        import pickle, time
+        data = pickle.dumps(rows, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.maxsize:
+            return
+        now = time.time()
+        with self.lock:
+            self._keep(key, now + self.ttl, tables, data)
+            if self.conn:
+                with self.conn:
+                    self.conn.execute('INSERT OR REPLACE INTO results VALUES '
+                        '(?, ?, ?, ?, ?, ?, ?)', (key, self.namespace,
+                        ',%s,' % ','.join(tables), now + self.ttl, len(data),
+                        now, data))
+                self._evict(now)
+
+    def invalidate(self, tables=None):
+        """ drop the results that read from tables, all without tables """
+        with self.lock:
+            if tables is None:
+                keys = list(self.items)
+            else:
+                tables = {_tablename(t) for t in tables}
+                keys = [k for k, v in self.items.items() if v[1] & tables]
+            for key in keys:
+                self._drop(key)
+            self.counts['invalidations'] += len(keys)
+            if self.conn:
+                with self.conn:
+                    if tables is None:
+                        self.conn.execute('DELETE FROM results WHERE '
+                            'namespace = ?', (self.namespace,))
+                    for table in tables or ():
+                        self.conn.execute('DELETE FROM results WHERE '
+                            'namespace = ? AND tables LIKE ?',
+                            (self.namespace, '%%,%s,%%' % table))
+
+    def _keep(self, key, expires, tables, data):
+        """ store in memory and evict least recently used results """
+        if key in self.items:
+            self._drop(key)
+        self.items[key] = (expires, set(tables), data)
+        self.size += len(data)
+        while self.size > self.maxsize:
+            self._drop(next(iter(self.items)))
+            self.counts['evictions'] += 1
+
+    def _drop(self, key):
+        self.size -= len(self.items.pop(key)[2])
+
+    def _evict(self, now):
+        """ drop expired and least recently used results from the file """
+        with self.conn:
+            self.conn.execute('DELETE FROM results WHERE expires < ?', (now,))
+            total = self.conn.execute('SELECT SUM(size) FROM results'
+                ).fetchone()[0] or 0
+            if total <= self.maxsize:
+                return
+            for key, size in self.conn.execute('SELECT key, size FROM results '
+                    'ORDER BY atime').fetchall():
+                self.conn.execute('DELETE FROM results WHERE key = ?', (key,))
+                self.counts['evictions'] += 1
+                total -= size
+                if total <= self.maxsize:
+                    break
+
+
+def _normalize(sqlstr):
+    """ sql with runs of whitespace outside of quotes replaced by a blank """
+    import re
+    return re.sub(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|\s+""", lambda m:
+        ' ' if m.group(0)[0].isspace() else m.group(0), sqlstr).strip().rstrip(';').rstrip()
+
+def _tables(sqlstr):
+    """ names of the tables a sql statement reads or writes """
+    import re
+    return sorted({_tablename(t) for t in re.findall(r'\b(?:from|join|into|'
+        r'update|table)\s+([\w.$"`\[\]]+)', sqlstr, re.IGNORECASE)})
+
+def _targets(sqlstr):
+    """ names of the tables a sql statement inserts, updates or deletes """
+    import re
+    return sorted({_tablename(t) for t in re.findall(r'\b(?:into|update|'
+        r'delete\s+from)\s+([\w.$"`\[\]]+)', sqlstr, re.IGNORECASE)})
+
+def _tablename(table):
+    """ lower case table name without schema and quotes """
+    return table.split('.')[-1].strip('"`[]').lower()
+
+def _execute(cur, sqlstr, params):
+    """ execute with or without params, sqlite3 does not accept None """
+    if params is None:
+        cur.execute(sqlstr)
+    else:
+        cur.execute(sqlstr, params)
+
+def _numbered(sqlstr):
+    """
+    replace the %s placeholders of psycopg2 with $1, $2 .. of PREPARE and
+    %% with %, psycopg2 does the same inside quoted strings
+    """
+    import re
+    n = itertools.count(1)
+    return re.sub('%[s%]', lambda m: '%' if m.group(0) == '%%' else
+        '$%d' % next(n), sqlstr)
+
+def _columns(cur):
+    """ column names of the result of a cursor """
+    return [d[0] for d in cur.description]
+
+def _close(conn):
+    """ close a connection that may already be broken """
+    try:
+        conn.close()
+    except Exception:
+        pass
 
 def _getdbpasswd(host, port, dbname, user):
+    """
+    return the password from ~/.sci/.dbpasswd, a file with lines
+    host:port:dbname:user:password like ~/.pgpass, '*' matches any value
+    """
     passwd = os.path.join(os.path.expanduser("~"),'.sci','.dbpasswd')
     if not os.path.exists(passwd):
-        return None 
+        return None
     with open(passwd, 'r') as f:
-        host1,port1,dbname1,user1,password1 = f.readline().strip().split(':')
-
+        for line in f:
+            if not line.strip() or line.startswith('#'):
+                continue
+            host1,port1,dbname1,user1,password1 = line.strip().split(':', 4)
+            if all(a in ('*', str(b)) for a, b in ((host1, host),
+                    (port1, port), (dbname1, dbname), (user1, user))):
+                return password1
+    return None
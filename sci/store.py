@@ -5,227 +5,555 @@
 #   File a chunk of information that touches file system
 #   file_upload turns file into an object and file_download goes vice versa
 
-import os
+import os, io
 
 """
 Simplified classes for accessing object storage systems.
-Currently only implemented for Swift Storage.
-
-Current limitations: 
- - swift: object_put function limited to 5GB per object
+Currently implemented for Swift Storage, S3 (pip install sci[s3]), Google
+Cloud Storage (pip install sci[google]), Azure Blob (pip install sci[azure]),
+posix file systems and memory. All classes share the methods of _objstore.
+aio(store) offers the main methods of a store for asyncio.
 """
-class swift:
+
+# largest object swift accepts in a single request, larger objects
+# are uploaded in segments
+MAX_OBJECT_SIZE = 5368709120
+# segment size of static large objects uploaded by this module
+SEGMENT_SIZE = 104857600
+# checksum cache written to local folders by sync_up/sync_down
+SYNC_MANIFEST = '.sci_sync_manifest.json'
+# objects of the memory store by bucket name
+_memory_buckets = {}
+# compression codecs by object name extension and by the first bytes 
+# of compressed data
+CODEC_EXTENSIONS = {'gz': 'gzip', 'zst': 'zstd', 'lz4': 'lz4'}
+CODEC_MAGIC = {b'\x1f\x8b': 'gzip', b'\x28\xb5\x2f\xfd': 'zstd', 
+               b'\x04\x22\x4d\x18': 'lz4'}
+# http status codes of transient errors that are retried
+RETRY_STATUS = (408, 425, 429, 500, 502, 503, 504)
+# upper bounds in seconds of the request latency histogram of metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60, 300)
+
+class StoreError(Exception):
     """
+    raised when a storage operation fails, transient errors are only
+    raised after the retries of the retrypolicy of the store failed.
     Example:
-        mystor = sci.store.swift('the-bucket', 'virtual/sub/dir') 
-        my_objects = mystor.bucket_list()
+    try:
+        content = mystor.object_get('myobj.json')
+    except sci.store.StoreError as e:
+        print(e.op, e.status, e.attempts, e.__cause__)
     -------------------------
-    Initialize an Openstack Swift container/bucket. 
-    Data will be written to the root of the bucket unless the virtual dir
-    prefix is set.The prefix can be a single virtual folder such as 
-    'subfolder' or a virtual folder such as 'folder/subfolder/subfolder'.     
-    For authentication you need to have set some environment 
-    variables. This can either be OS_AUTH_URL, OS_TENANT_NAME, 
-    OS_USERNAME, OS_PASSWORD or OS_STORAGE_URL and OS_AUTH_TOKEN. 
-    If you have Swift Commander installed, a new auth token and
-    storage URL will be automatically stored in the ~/.swift
-    folder after you use the 'swc' command. 
+    status is the http status code of the last error (404 if the object
+    does not exist) or None for network errors, the original exception
+    of the backend is chained as __cause__.
+    """
+
+    def __init__(self, msg, status=None, op=None, attempts=1):
+        super().__init__(msg)
+        self.status = status
+        self.op = op
+        self.attempts = attempts
+
+
+class retrypolicy:
+    """
+    Retry policy applied to every request the storage classes send
+    Example:
+    policy = sci.store.retrypolicy(attempts=8, timeout={'get': 3600})
+    mystor = sci.store.swift('the-bucket', retry=policy)
+    print(policy.stats())
+    -------------------------
+    Transient errors (timeouts, dropped connections, http 408, 429 and
+    5xx such as 503 from an overloaded swift proxy) are retried up to
+    'attempts' times in total with exponential backoff and full jitter:
+    retry n waits a random time between 0 and
+    min(max_backoff, backoff * 2 ** n) seconds, so that many jobs do not
+    retry in lock step. No retry is started that would end later than
+    'timeout' seconds after the operation started. timeout is a number
+    or a dict by operation ('list', 'get', 'meta', 'put', 'download',
+    'upload') with an optional 'default'. request_timeout is the socket
+    timeout of a single request. Requests that cannot be repeated, such
+    as uploading from a stream that was already consumed, are not
+    retried. Errors that are not transient and retries that gave up
+    raise StoreError.
+    hook(event, op, attempt, error) is called for every 'retry' and
+    'failure' event, e.g. to log or count them. stats() returns the
+    number of calls, retries and failures by operation. Stores without
+    a policy of their own share the default policy _objstore.retry.
     """
 
-    def __init__(self, bucket, prefix=None):
+    def __init__(self, attempts=5, backoff=0.5, max_backoff=30, timeout=900,
+            request_timeout=60, hook=None):
+        import threading
+        self.attempts = max(attempts, 1)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.request_timeout = request_timeout
+        self.hook = hook
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def call(self, op, func, *args, idempotent=True, listener=None, **kwargs):
+        """
+        return func(*args, **kwargs), transient errors are retried if the
+        call is idempotent. listener is called like hook for this call.
+        """
+        import time
+        self._count(op, 'calls')
+        started = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return func(*args, **kwargs)
+            except StoreError:
+                # raised by a nested call that already retried
+                raise
+            except Exception as e:
+                time.sleep(self._delay(op, attempt, e, started, idempotent,
+                    listener))
+
+    async def acall(self, op, func, *args, idempotent=True, listener=None,
+            **kwargs):
+        """ same as call() for a coroutine function func, used by aio """
+        import asyncio, time
+        self._count(op, 'calls')
+        started = time.time()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                return await func(*args, **kwargs)
+            except StoreError:
+                raise
+            except Exception as e:
+                await asyncio.sleep(self._delay(op, attempt, e, started,
+                    idempotent, listener))
+
+    def stats(self):
+        """
+        return {op: {'calls': n, 'retries': n, 'failures': n}}
+        Example:
+        print(policy.stats()['get']['retries'])
+        """
+        with self.lock:
+            return {op: dict(counts) for op, counts in self.counts.items()}
+
+    def _delay(self, op, attempt, error, started, idempotent, listener):
         """ 
-        Examples:
-        mystor = swift('the-bucket', 'virtual/sub/directory')
-        my_objects = mystor.bucket_list()
-        my_filtered_objects = mystor.bucket_list({'proj': 'ABC', 'tag': 'new'})
-        dict = mystor.object_put('the-object', "THE CONTENT", {tag': 'new'})
-        obj = mystor.object_get('the-object')
-        j = mystor.object_get_json('the-object.json')
-        ret = mystor.object_meta_set('the-object', {'proj': 'XYZ'):
-        dict = mystor.object_meta_get('the-object')
+        return the seconds to wait before the next attempt or raise 
+        StoreError if the error is not retried 
         """
+        import time, random
+        timeout = self.timeout
+        if isinstance(timeout, dict):
+            timeout = timeout.get(op, timeout.get('default'))
+        delay = random.uniform(0, min(self.max_backoff,
+            self.backoff * 2 ** (attempt - 1)))
+        if not idempotent or not _retryable(error) or \
+                attempt >= self.attempts or (timeout is not None and
+                time.time() - started + delay > timeout):
+            self._event('failure', op, attempt, error, listener)
+            raise StoreError('%s failed after %d attempt(s): %s' % (
+                op, attempt, error), _error_status(error), op, attempt) \
+                from error
+        self._event('retry', op, attempt, error, listener)
+        return delay
+
+    def _count(self, op, key):
+        with self.lock:
+            counts = self.counts.setdefault(op,
+                {'calls': 0, 'retries': 0, 'failures': 0})
+            counts[key] += 1
+
+    def _event(self, event, op, attempt, error, listener=None):
+        self._count(op, 'retries' if event == 'retry' else 'failures')
+        for hook in (self.hook, listener):
+            if hook:
+                try:
+                    hook(event, op, attempt, error)
+                except Exception as e:
+                    print("Retry Hook Error: %s" % e)
+
+
+class metrics:
+    """
+    Collects request latency, bytes, errors, retries and cache hits of 
+    one or more stores by backend, bucket and operation
+    Example:
+    m = sci.store.metrics()
+    mystor = sci.store.swift('the-bucket')
+    mystor.metrics = m
+    mystor.file_upload(files)
+    print(m.to_prometheus())
+    m.dump('/var/lib/node_exporter/textfile/myjob.prom')
+    -------------------------
+    Operations are the request types of _objstore._call(): 'list' (one
+    page), 'get', 'meta', 'put', 'download', 'upload' and 'auth'.
+    Latency is recorded in a histogram with the upper bounds 
+    LATENCY_BUCKETS (seconds) and includes retries. bytes counts the 
+    data read by get and written by put, download and upload. The same 
+    metrics object can be shared by many stores and threads.
+    callback(backend, bucket, op, seconds, error) is called after every
+    request, e.g. to send traces somewhere else. stats() returns all
+    values as a list of dictionaries, to_json() and to_prometheus() 
+    return them as text and dump() writes them to a file.
+    """
 
-        import swiftclient, json
+    def __init__(self, callback=None):
+        import threading
+        self.callback = callback
+        self.ops = {}
+        self.lock = threading.Lock()
+
+    def call(self, store, op, func, *args, **kwargs):
+        """ call func with the retry policy of store and record it """
+        import time
+        key = (type(store).__name__, str(store.bucket), op)
+        started = time.perf_counter()
+        error = None
+        try:
+            return store.retry.call(op, func, *args,
+                listener=self._listener(key), **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._observe(key, time.perf_counter() - started, error)
+
+    async def acall(self, store, op, func, *args, **kwargs):
+        """ same as call() for a coroutine function func, used by aio """
+        import time
+        key = (type(store).__name__, str(store.bucket), op)
+        started = time.perf_counter()
+        error = None
+        try:
+            return await store.retry.acall(op, func, *args,
+                listener=self._listener(key), **kwargs)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            self._observe(key, time.perf_counter() - started, error)
+
+    def add(self, store, op, name, n=1):
+        """ 
+        add n to the counter name ('bytes', 'cache_hits' or 'cache_misses')
+        of an operation of store 
+        """
+        self._add((type(store).__name__, str(store.bucket), op), name, n)
 
-        sw_auth_version = 2
-        sw_authurl =  os.getenv("OS_AUTH_URL","")
-        sw_user = os.getenv("OS_USERNAME", "")
-        sw_key = os.getenv("OS_PASSWORD", "")
-        self.tenant = os.getenv("OS_TENANT_NAME", "")
-        self.storageurl = os.getenv("OS_STORAGE_URL","")
-        self.authtoken = os.getenv("OS_AUTH_TOKEN","")
-        if not sw_key and not self.authtoken:
-            #reading authtoken from file cache in ~/.swift folder
-            self.authtoken = self._get_set_token_file(sw_authurl)
-        self.optsauth = self._get_swift_options(sw_authurl,sw_user,sw_key)
+    def stats(self):
+        """
+        return a list of dictionaries, one per backend, bucket and operation
+        Example:
+        for s in m.stats():
+            print(s['backend'], s['op'], s['requests'], s['bytes'], s['seconds'])
+        -------------------------
+        histogram has the number of requests per latency bucket, the last
+        one counts requests slower than LATENCY_BUCKETS[-1].
+        """
+        with self.lock:
+            return [dict(values, backend=backend, bucket=bucket, op=op,
+                         histogram=list(values['histogram']))
+                    for (backend, bucket, op), values in sorted(self.ops.items())]
 
-        self.swiftconn = swiftclient.client.Connection(authurl=sw_authurl, user=sw_user, key=sw_key,  
-                auth_version=sw_auth_version, os_options=self.optsauth)
-        try:
-            self.storageurl, newauthtoken = self.swiftconn.get_auth()
-        except swiftclient.exceptions.ClientException as e:
-            print("Connection Error: %s" % e.msg)
-            self._exiterr()
+    def to_json(self):
+        """ return stats() and the histogram bounds as json text """
+        import json
+        return json.dumps({'latency_buckets': list(LATENCY_BUCKETS),
+                           'operations': self.stats()}, indent=2)
+
+    def to_prometheus(self, prefix='sci_store'):
+        """ return all values in the Prometheus text exposition format """
+        stats = self.stats()
+        lines = []
+        for name, text in (('requests', 'requests sent'),
+                           ('errors', 'requests that failed after retries'),
+                           ('retries', 'retried requests'),
+                           ('bytes', 'bytes transferred'),
+                           ('cache_hits', 'objects read from the local cache'),
+                           ('cache_misses', 'objects missing in the local cache')):
+            lines.append('# HELP %s_%s_total %s' % (prefix, name, text))
+            lines.append('# TYPE %s_%s_total counter' % (prefix, name))
+            for s in stats:
+                lines.append('%s_%s_total{%s} %s' % (prefix, name,
+                    _prometheus_labels(s), s[name]))
+        lines.append('# HELP %s_request_seconds request latency' % prefix)
+        lines.append('# TYPE %s_request_seconds histogram' % prefix)
+        for s in stats:
+            labels = _prometheus_labels(s)
+            count = 0
+            for bound, n in zip(list(LATENCY_BUCKETS) + ['+Inf'], s['histogram']):
+                count += n
+                lines.append('%s_request_seconds_bucket{%s,le="%s"} %s' % (
+                    prefix, labels, bound, count))
+            lines.append('%s_request_seconds_sum{%s} %s' % (prefix, labels,
+                s['seconds']))
+            lines.append('%s_request_seconds_count{%s} %s' % (prefix, labels,
+                s['requests']))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """
+        write to_prometheus() to a *.prom file or to_json() to other files
+        Example:
+        m.dump('~/metrics/job-%s.json' % os.getenv('SLURM_JOB_ID'))
+        -------------------------
+        The file is replaced atomically, so that collectors never read a 
+        partial file.
+        """
+        path = os.path.expanduser(path)
+        text = self.to_prometheus() if path.endswith('.prom') else self.to_json()
+        with open(path + '.tmp', 'w') as f:
+            f.write(text)
+        os.replace(path + '.tmp', path)
+
+    def _entry(self, key):
+        """ counters of (backend, bucket, op), the lock must be held """
+        if key not in self.ops:
+            self.ops[key] = {'requests': 0, 'errors': 0, 'retries': 0,
+                'bytes': 0, 'cache_hits': 0, 'cache_misses': 0,
+                'seconds': 0.0, 'histogram': [0] * (len(LATENCY_BUCKETS) + 1)}
+        return self.ops[key]
+
+    def _listener(self, key):
+        """ retry policy listener that counts the retries of key """
+        def _listener(event, op, attempt, error):
+            if event == 'retry':
+                self._add(key, 'retries', 1)
+        return _listener
+
+    def _add(self, key, name, n):
+        with self.lock:
+            self._entry(key)[name] += n
+
+    def _observe(self, key, seconds, error):
+        import bisect
+        with self.lock:
+            values = self._entry(key)
+            values['requests'] += 1
+            values['errors'] += 1 if error else 0
+            values['seconds'] += seconds
+            values['histogram'][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        if self.callback:
+            try:
+                self.callback(key[0], key[1], key[2], seconds, error)
+            except Exception as e:
+                print("Metrics Callback Error: %s" % e)
 
-        self.bucket = bucket
-        self.prefix = prefix
 
-        if self.authtoken != newauthtoken:
-            self.authtoken == newauthtoken
-            # writing new authtoken to file cache in ~/.swift folder
-            self._get_set_token_file(sw_authurl, newauthtoken)
-            
-        os.environ["OS_AUTH_TOKEN"] = self.authtoken
-        self.optsauth['os_auth_token'] = self.authtoken
-        self.optsauth['auth_token'] = self.authtoken
-        os.environ["OS_STORAGE_URL"] = self.authtoken
-        self.optsauth['os_storage_url'] = self.storageurl
-        self.optsauth['object_storage_url'] = self.storageurl
+class _objstore:
+    """
+    Base class of the storage classes. It implements the public methods,
+    i.e. serialization, caching, the metadata index, parallel transfers
+    and streaming, once on top of a few primitives each backend provides:
+    bucket_iter, _get, _get_stream, _get_range, _size, _meta_get,
+    _meta_set and _writer. Backends override _download_file, _upload_file
+    or object_put where they have a faster native way. A subclass sets
+    bucket, prefix, workers and part_size in __init__. All primitives
+    are called through _call() which applies the retrypolicy 'retry' 
+    and records the request in 'metrics' if it is set.
+    """
+
+    cache = None
+    metaindex = None
+    metrics = None
+    retry = retrypolicy()
+    workers = 8
+    part_size = 67108864
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
 
+    def close(self):
+        """
+        release threads and connections held by the store
+        Example:
+        mystor.close()
+        """
+        pass
 
     def bucket_list(self, filter=None):
         """
-        return a list of objects from the previously initialized bucket. 
+        return a list of objects from the previously initialized bucket.
         Example:
         my_filtered_objects = mystor.bucket_list({'proj': 'ABC', 'tag': 'new'})
         -------------------------
         This list can be a filtered list by passing in a dictionary of
-        key / value pairs as filter. 
+        key / value pairs as filter. Raises StoreError if the listing fails.
         """
-
         if self.bucket == None:
             return []
 
-        try:
-            listing = self.swiftconn.get_container(self.bucket,
-                                           prefix=self.prefix,
-                                           full_listing=True)
-        except swiftclient.exceptions.ClientException as e:
-            print("Bucket List Error: %s (%s, %s)" % (e.msg, e.http_status,  e.http_reason))
-            return []
+        items = list(self.bucket_iter())
 
-        newlist=[]
-        for item in listing[1]:
-            if item['content_type'] != 'application/directory' and \
-                not item['name'].startswith('.') and not '/.' in item['name']:
-                    if not filter:
-                        newlist.append(item["name"])
-                    else:
-                        meta = self.object_meta_get(item['name'])
-                        # is filter a full subset of meta
-                        if filter.items() <= meta.items():
-                            newlist.append(item["name"])
+        if not filter:
+            return [item["name"] for item in items]
 
-        #return [item["name"] for item in listing[1]]
+        newlist=[]
+        for item, meta in zip(items, self._listing_meta(items)):
+            # is filter a full subset of meta
+            if filter.items() <= meta.items():
+                newlist.append(item["name"])
         return newlist
 
+    def bucket_iter(self, prefix=None, delimiter=None, page_size=10000):
+        """
+        iterate over the objects in the bucket page by page
+        Example:
+        for item in mystor.bucket_iter():
+            print(item['name'], item['size'], item['etag'], item['last_modified'])
+        -------------------------
+        Unlike bucket_list() this does not wait for the complete listing,
+        each page of page_size objects is yielded as soon as it arrives.
+        Items are dictionaries with the keys name, size, etag,
+        last_modified and content_type. prefix defaults to the prefix of
+        the bucket. With a delimiter such as '/' objects in pseudo
+        sub folders are not listed, instead one item {'subdir': 'name/'}
+        is yielded per sub folder. Folder markers and objects starting
+        with '.' are skipped.
+        """
+        raise NotImplementedError
+
     def file_download(self, objnames, folder=None):
         """
-        Download a list of objects to files. If the list has a single object
-        the target "filepath" can be a file, otherwise the target will be a 
-        local folder, if "filepath" is omitted we copy to the current folder.
+        Download a list of objects to files. The objects are saved with
+        their full object name (including prefix) as path below a local
+        folder, if "folder" is omitted we copy to the current folder.
         Example:
         c = mystor.file_download(['prefix/f.txt'], 'fld/fld2') or
         c = mystor.file_download(['f.txt','g.txt'], 'fld') or
         c = mystor.file_download(['f.txt','g.txt']) or
         -------------------------
+        Objects are downloaded in parallel using 'workers' threads.
         returns a list of downloaded files or an empty list in a case of error
         """
-        # see https://docs.openstack.org/python-swiftclient/latest/service-api.html
-
-        import swiftclient.service 
 
         if self.bucket == None:
             return []
 
         objnames = self._fix_object_path(objnames)
 
-        startdir= os.getcwd()
         if folder:
             folder = os.path.expanduser(folder)
             if not os.path.exists(folder):
                 print('folder does not exist: %s' % folder)
                 return False
-            else:
-                os.chdir(folder)
-
-        currdir=os.getcwd()
-        downloaded_files = []
-        with swiftclient.service.SwiftService(options=self.optsauth) as sw:
-            try:
-                print("Downloading to '%s' ..." % currdir)
-                for r in sw.download(
-                        container=self.bucket,
-                        objects=objnames):
-                    if r['success']:
-                        if 'object' in r and 'path' in r:
-                            print("'%s' downloaded to '%s'" % (r['object'],r['path']))
-                            downloaded_files.append(os.path.join(currdir,r['path']))
-                    else:
-                        if 'object' in r and 'path' in r:
-                            print("'%s' download to '%s' failed" % (r['object'],r['path']))
-                        if 'error' in r and 'attempts' in r:
-                            print("  Error: '%s', attempts: %s" % (r['error'],r['attempts']))
-
-            except swiftclient.service.SwiftError as e:
-                print("Error:", e.value)
+        else:
+            folder = os.getcwd()
 
-        os.chdir(startdir)
-        return downloaded_files
+        print("Downloading to '%s' ..." % folder)
+        return self._download_files([(o, os.path.join(folder, o))
+            for o in objnames])
 
     def file_upload(self, filepaths, objname=None, metadict=None):
         """
-        Upload a list of files. If the list has a single entry it will be 
+        Upload a list of files. If the list has a single entry it will be
         copied to the target "prefix/objname", otherwise objname is ignored.
-        if "objname" is omitted, the object is called prefix/filename. 
+        if "objname" is omitted, the object is called prefix/filename.
         Example:
         c = mystor.file_upload(['fld/f.txt'], 'x.txt') or
         c = mystor.file_upload(['f.txt','g.txt'])
-        ------------------------- 
+        -------------------------
+        Files are uploaded in parallel and large files in parallel parts.
         returns a list of uploaded objects or an empty list in a case of error
         """
-        # see https://docs.openstack.org/python-swiftclient/latest/service-api.html
-        import swiftclient.service, getpass
 
         if self.bucket == None:
             return []
 
-        uploaded_objects = []
-        with swiftclient.service.SwiftService(options=self.optsauth) as sw:
-
-            objs = self._fix_file_paths(filepaths)
-            objs = [
-                swiftclient.service.SwiftUploadObject(
-                    #o, object_name=o.replace(
-                    #dir, 'my-%s-objects' % dir, 1)
-                    o, object_name=self._upload_object_name(o)
-                ) for o in objs
-            ]
-            # if there is only 1 file and target objname is set
-            if objname and len(objs) == 1:
-                objs[0].object_name=self._fix_object_path([objname])[0]
-
-            #for o in objs:
-            #    print("***",o.object_name,o.source)
-
-            for r in sw.upload(container=self.bucket, 
-                objects=objs, 
-                options={'segment_size':104857600,
-                        'use_slo':True,
-                        'meta': {'uploaded-by': getpass.getuser()},
-                        'segment_container':'.segments_'+self.bucket,
-                        'shuffle': True}):
-                if r['success']:
-                    if 'object' in r and 'status' in r:
-                        print("object '%s' %s." % (r['object'],r['status']))
-                        uploaded_objects.append(r['object'])
-                else:
-                    if 'object' in r:
-                        print("object '%s' upload failed" % r['object'])
-                    if 'error' in r:
-                        print("  Error: '%s'" % r['error'])
-        return uploaded_objects
+        # changing back to forward slashes (for windows)
+        files = [f.replace('\\','/') for f in filepaths]
+        targets = [(f, self._upload_object_name(f)) for f in files]
+        # if there is only 1 file and target objname is set
+        if objname and len(targets) == 1:
+            targets[0] = (targets[0][0], self._fix_object_path([objname])[0])
+
+        return self._upload_files(targets, metadict)
+
+    def sync_up(self, localdir):
+        """
+        Upload new and changed files from a local folder to prefix
+        Example:
+        uploaded = mystor.sync_up('~/analysis/run42')
+        -------------------------
+        Files are compared to the objects under prefix by size and the
+        checksum the store lists (an md5 based etag on swift and s3, md5
+        or crc32c on google and azure, size and modification time on
+        posix) and only files that differ are uploaded, similar to
+        rsync. Checksums of local files are cached in the file
+        .sci_sync_manifest.json in localdir and are only computed again
+        if size or modification time of a file change. Files and folders
+        starting with '.' are skipped.
+        returns a list of uploaded objects
+        """
+
+        if self.bucket == None:
+            return []
+
+        localdir = os.path.expanduser(localdir)
+        remote = self._sync_listing()
+        local = _sync_hashes(localdir, self._sync_etags, self._sync_kind(),
+            workers=self.workers)
+        targets = []
+        for rel, (size, etags) in sorted(local.items()):
+            item = remote.get(rel)
+            if item and item['size'] == size and \
+                    set(self._sync_remote(item)).intersection(etags):
+                continue
+            targets.append((os.path.join(localdir, rel), self._sync_objname(rel)))
+        if not targets:
+            return []
+        return self._upload_files(targets)
+
+    def sync_down(self, localdir):
+        """
+        Download new and changed objects under prefix to a local folder
+        Example:
+        downloaded = mystor.sync_down('~/analysis/run42')
+        -------------------------
+        The opposite of sync_up(), only objects that do not exist in
+        localdir or differ in size or checksum are downloaded.
+        returns a list of downloaded files
+        """
+
+        if self.bucket == None:
+            return []
 
+        localdir = os.path.expanduser(localdir)
+        if not os.path.exists(localdir):
+            os.makedirs(localdir)
+        remote = self._sync_listing()
+        sizes = {rel: item['size'] for rel, item in remote.items()}
+        kind = self._sync_kind()
+        local = _sync_hashes(localdir, self._sync_etags, kind, sizes,
+            workers=self.workers)
+        changed = []
+        for rel, item in sorted(remote.items()):
+            size, etags = local.get(rel, (None, ()))
+            if size != item['size'] or \
+                    not set(self._sync_remote(item)).intersection(etags):
+                changed.append(rel)
+        if not changed:
+            return []
+
+        paths = {os.path.join(localdir, *rel.split('/')): rel for rel in changed}
+        downloaded_files = self._download_files([(self._sync_objname(rel),
+            path) for path, rel in paths.items()])
+        # downloaded files have the checksum of the object, no need to hash
+        manifest = {}
+        for path in downloaded_files:
+            manifest[paths[path]] = (os.stat(path), kind,
+                self._sync_remote(remote[paths[path]]))
+        _sync_manifest_update(localdir, manifest)
+        return downloaded_files
 
     def object_get(self, objname):
         """
@@ -234,11 +562,11 @@ class swift:
         content = mystor.object_get('prefix/myobj.json') or
         content = mystor.object_get('myobj.json') or
         -------------------------
-        using a prefix path is optional and if no prefix 
-        is added we prepend the default prefix 
-        for tools using file handles (such as pandas) use 
+        using a prefix path is optional and if no prefix
+        is added we prepend the default prefix
+        for tools using file handles (such as pandas) use
         io.StringIO or io.BytesIO :
-        handle = io.StringIO(content.decode('utf-8')) 
+        handle = io.StringIO(content.decode('utf-8'))
            # or handle = io.BytesIO(content)
         dataframe = pd.read_csv(handle)
         """
@@ -246,24 +574,45 @@ class swift:
             return None
 
         objname = self._fix_object_path([objname])[0]
-        
-        content = self.swiftconn.get_object(self.bucket, objname)[1]
-        return content 
 
-    def object_get_json(self, objname):
-        """ 
-        load object into memory and de-serialize json 
+        if self.cache:
+            return self._object_get_cached(objname)
+        content = self._call('get', self._get, objname)[1]
+        self._metric('get', 'bytes', len(content))
+        return content
+
+    def object_get_json(self, objname, codec=None):
+        """
+        load object into memory and de-serialize json
         Example:
         j = mystor.object_get_json('prefix/myobj.json')
         print(json.dumps(j, indent=2))
+        -------------------------
+        Objects compressed with gzip, zstd or lz4 are decompressed, the
+        codec is detected from the extension (.gz, .zst, .lz4) or the 
+        first bytes of the object unless it is passed as codec. 
         """
         import json
-        content = self.object_get(objname)
+        content = _decompress(objname, self.object_get(objname), codec)
         return json.loads(content.decode('utf-8'))
 
-    def object_get_csv(self, objname, dictreader=True, dialect=None):
-        """ 
-        load swift object into memory and de-serialize csv 
+    def object_get_pickle(self, objname, codec=None):
+        """
+        load pickle object and de-serialize it
+        Example:
+        x = mystor.object_get_pickle('prefix/myobj.dat')
+        -------------------------
+        The object is decompressed and unpickled while it is downloaded, 
+        see object_get_json() for compressed objects. Only load pickle 
+        objects that you trust.
+        """
+        import pickle
+        with self._reader(objname, codec) as f:
+            return pickle.load(f)
+
+    def object_get_csv(self, objname, dictreader=True, dialect=None, codec=None):
+        """
+        load object into memory and de-serialize csv
         Examples:
         -----------------------------------------------------------------
         table = mystor.object_get_csv('prefix/myobj.csv')
@@ -279,162 +628,617 @@ class swift:
         -------------------------
         By default the function returns csv.DictReader object.
         The DictReader object has the attribute 'fieldnames' that returns
-        the csv header as a list. Optionally you can use csv.reader 
+        the csv header as a list. Optionally you can use csv.reader
         instead of csv.DictReader and a different dialect, such as 'excel'.
         If you do not want to use the internal python csv package you can
         use the io.StringIO function to create an io handle in memory that
         can be used instead of a file handle, e.g. for pandas:
         -------------------------
         content= self.object_get(objname)
-        handle = io.StringIO(content.decode('utf-8')) 
+        handle = io.StringIO(content.decode('utf-8'))
            # or handle = io.BytesIO(content)
         dataframe = pd.read_csv(handle)
+        -------------------------
+        see object_get_json() for compressed objects.
         """
-        import io, csv
-        content= self.object_get(objname)
+        import csv
+        content = self.object_get(objname)
         if not content:
             return None
+        content = _decompress(objname, content, codec)
         handle = io.StringIO(content.decode('utf-8'))
-        # sniffer does not seem to work here
-        #dialect = csv.Sniffer().sniff(handle.read(4096))
         if dictreader:
             if dialect:
-                table = csv.DictReader(handle, dialect)
-            else:
-                table = csv.DictReader(handle)
-        else:
+                return csv.DictReader(handle, dialect=dialect)
+            return csv.DictReader(handle)
+        if dialect:
+            return csv.reader(handle, dialect)
+        return csv.reader(handle)
+
+    def object_get_stream(self, objname, chunk_size=1048576):
+        """
+        Load the object in chunks of bytes without holding all in memory
+        Example:
+        for chunk in mystor.object_get_stream('prefix/huge.dat'):
+            f.write(chunk)
+        -------------------------
+        chunk_size is the number of bytes in each chunk yielded.
+        """
+        if self.bucket == None:
+            return
+
+        objname = self._fix_object_path([objname])[0]
+        for chunk in self._stream(objname, chunk_size):
+            yield chunk
+
+    def object_get_range(self, objname, start, end=None):
+        """
+        Load part of the object into memory
+        Example:
+        header = mystor.object_get_range('prefix/big.h5', 0, 512) or
+        footer = mystor.object_get_range('prefix/big.parquet', -65536)
+        -------------------------
+        returns the bytes from offset start up to but not including end,
+        like content[start:end]. A negative start without end returns
+        the last -start bytes of the object, with an end it counts from
+        the end of the object.
+        """
+        if self.bucket == None:
+            return None
+
+        objname = self._fix_object_path([objname])[0]
+        content = self._call('get', self._get_range, objname, start, end)
+        self._metric('get', 'bytes', len(content))
+        return content
+
+    def object_open(self, objname, blocksize=1048576, cache_blocks=32,
+            readahead=4):
+        """
+        Open the object as a read-only, seekable file without downloading it
+        Example:
+        import pyarrow.parquet as pq
+        with mystor.object_open('prefix/big.parquet') as f:
+            table = pq.read_table(f, columns=['id', 'name'])
+        -------------------------
+        Data is fetched with range requests in blocks of blocksize bytes
+        as it is read and the last cache_blocks blocks are kept in memory.
+        When reading sequentially 'readahead' additional blocks are
+        fetched with the same request. Useful for tools like pandas,
+        pyarrow or h5py that only need a few parts of a large file.
+        """
+        if self.bucket == None:
+            return None
+
+        objname = self._fix_object_path([objname])[0]
+        size = self._call('meta', self._size, objname)
+
+        def _get_range(start, end):
+            content = self._call('get', self._get_range, objname, start, end)
+            self._metric('get', 'bytes', len(content))
+            return content
+
+        return _rangereader(_get_range, size, blocksize, cache_blocks, readahead)
+
+    def object_iter_csv(self, objname, dictreader=True, dialect=None,
+            chunk_size=1048576, codec=None):
+        """
+        stream object and de-serialize csv row by row
+        Example:
+        for row in mystor.object_iter_csv('prefix/huge.csv.zst'):
+            print(row['name'])
+        -------------------------
+        Same as object_get_csv but the object is downloaded, decompressed
+        and decoded incrementally, memory use does not depend on the 
+        object size.
+        """
+        import csv
+        handle = _texthandle(self._reader(objname, codec, chunk_size))
+        if dictreader:
             if dialect:
-                table = csv.reader(handle, dialect)
-            else:
-                table = csv.reader(handle)
-        return table
+                return csv.DictReader(handle, dialect=dialect)
+            return csv.DictReader(handle)
+        if dialect:
+            return csv.reader(handle, dialect)
+        return csv.reader(handle)
+
+    def object_iter_json(self, objname, chunk_size=1048576, codec=None):
+        """
+        stream object and de-serialize a json array item by item
+        Example:
+        for person in mystor.object_iter_json('toolbox/pi_all.json'):
+            print(person['pi_dept'])
+        -------------------------
+        The elements of a top level json array are parsed incrementally
+        and yielded one at a time. Any other json document is yielded as
+        a single item. Compressed objects are decompressed on the fly.
+        """
+        handle = _texthandle(self._reader(objname, codec, chunk_size))
+        return _iter_json(handle, chunk_size)
 
     def object_meta_get(self, objname):
-        """ 
+        """
         retrieve custom metadata from object as a dictionary
-        Example: 
+        Example:
         dict = mystor.object_meta_get('myobj.json')
         -------------------------
-        The function will return a dictionary of metadata 
+        The function will return a dictionary of metadata
         """
         if self.bucket == None:
             return None
 
         objname = self._fix_object_path([objname])[0]
-        head = self.swiftconn.head_object(self.bucket,objname)
-        newhead = {}
-        for k,v in head.items():
-            if k.startswith('x-object-meta-'):
-                newhead[k.replace('x-object-meta-','')] = v
-        return newhead
+        return self._call('meta', self._meta_get, objname)
+
+    def object_meta_get_many(self, objnames, workers=None):
+        """
+        retrieve custom metadata of many objects using parallel requests
+        Example:
+        metas = mystor.object_meta_get_many(['a.json', 'b.json'], 16)
+        -------------------------
+        The function will return a list of metadata dictionaries in the
+        same order as objnames. By default the number of workers passed
+        to the store is used.
+        """
+        import concurrent.futures
+
+        if self.bucket == None:
+            return None
+
+        objnames = self._fix_object_path(objnames)
+        workers = min(workers or self.workers, len(objnames))
+
+        def _meta_get(objname):
+            return self._call('meta', self._meta_get, objname)
+
+        if workers < 2:
+            return [_meta_get(o) for o in objnames]
+
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            return list(pool.map(_meta_get, objnames))
 
     def object_meta_set(self, objname, metadict):
-        """ 
-        set custom metadata on existing object using a dictionary 
+        """
+        set custom metadata on existing object using a dictionary
         Example:
         dict = mystor.object_meta_set('myobj.json', {'key': 'val', 'x': 'y'})
         -------------------------
-        The function will return ????
+        The new metadata replaces all existing custom metadata.
         """
         if self.bucket == None:
             return None
-        objname = self._fix_object_path([objname])[0]
-        metadict = self._fix_metadict(metadict)
 
-        resp = dict()
-        #self.swiftconn.post_object(self.storageurl, token=self.authtoken, \
-        #    bucket=self.bucket, name="%s/%s" % (self.prefix,objname), \
-        #    headers=metadict, http_conn=None, response_dict=resp, service_token=None)
-        ret = self.swiftconn.post_object(self.bucket, objname, \
-            headers=metadict, response_dict=resp)
-        return resp
+        objname = self._fix_object_path([objname])[0]
+        return self._call('meta', self._meta_set, objname, metadict or {})
 
     def object_put(self, objname, content, metadict=None):
-        """ 
+        """
         save object to bucket under prefix and optionally set metadata dict.
         Example:
         mystor.object_put('myobj.dat', x, {'key': 'val', 'a': 'b'})
-
+        -------------------------
+        content can be bytes, str or a binary file object. Content larger
+        than part_size is uploaded in parallel parts, see object_writer()
         """
+        import shutil
 
         if self.bucket == None:
             return None
-        metadict = self._fix_metadict(metadict)
 
-        #self.swiftconn.put_object(self.storageurl, \
-        #    bucket=self.bucket, name="%s/%s" % (self.prefix,objname), \
-        #    contents=content, content_length=None, etag=None, chunk_size=None, \
-        #    content_type=None, headers=metadict, http_conn=None, proxy=None, \
-        #    query_string=None, response_dict=None, service_token=None)
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        with self.object_writer(objname, metadict) as f:
+            if hasattr(content, 'read'):
+                shutil.copyfileobj(content, f, 1048576)
+            else:
+                f.write(content)
+        return f.resp
 
-        objname = self._fix_object_path([objname])[0]
+    def object_writer(self, objname, metadict=None, text=False,
+            part_size=None, workers=4, codec=None, level=None):
+        """
+        open a file-like object that uploads everything written to it
+        Example:
+        with mystor.object_writer('prefix/huge.csv', text=True) as f:
+            csv.writer(f).writerows(rows)
+        print(f.resp)
+        -------------------------
+        Data is buffered until part_size bytes are written and each full
+        buffer is uploaded as a part while writing continues. Up to
+        'workers' parts are uploaded in parallel, so memory use is at
+        most (workers + 1) * part_size. On close the parts are combined
+        into the object, objects smaller than part_size are uploaded
+        with a single request. If the with block raises an exception the
+        upload is aborted and no object is created. part_size defaults
+        to the part_size of the store. text=True returns a utf-8 text
+        handle instead of a binary one. codec compresses the data with
+        'gzip', 'zstd' or 'lz4' at compression level 'level' while it is
+        written.
+        """
 
-        resp = dict()
-        ret = self.swiftconn.put_object(self.bucket, objname, content, \
-            response_dict=resp, headers=metadict)
-        return resp
+        if self.bucket == None:
+            return None
 
-    def object_put_json(self, objname, content, metadict=None):
-        """ 
+        objname = self._fix_object_path([objname])[0]
+        writer = self._writer(objname, metadict or {},
+            part_size or self.part_size, workers)
+        if codec:
+            writer = _codecwriter(writer, codec, level)
+        if text:
+            return _textwriter(writer, encoding='utf-8', newline='')
+        return writer
+
+    def object_put_json(self, objname, content, metadict=None, codec=None,
+            indent=None):
+        """
         save json object to bucket and optionally set metadata using a dict
         Example:
-        mystor.object_put('myobj.json', x, {'key': 'val', 'a': 'b'})
+        mystor.object_put_json('myobj.json', x, {'key': 'val', 'a': 'b'}) or
+        mystor.object_put_json('myobj.json.zst', x)
+        -------------------------
+        The json is written without whitespace unless indent is set. 
+        Objects named *.gz, *.zst or *.lz4 are compressed with gzip, zstd
+        or lz4 while they are written, or pass codec='gzip', 'zstd' or 
+        'lz4' to compress objects with other names. The object_get_* 
+        methods decompress them transparently.
         """
 
         import json
 
         if self.bucket == None:
-            return None        
-        j = json.dumps(content, indent=4)
-        return self.object_put(objname,j,metadict)
+            return None
+        with self.object_writer(objname, metadict, text=True,
+                codec=_codec(objname, codec)) as f:
+            json.dump(content, f, indent=indent,
+                separators=None if indent else (',', ':'))
+        return f.resp
 
-    def object_put_pickle(self, objname, content, metadict=None):
-        """ 
-        save pickle object to bucket and optionally set metadata using a dict. 
+    def object_put_pickle(self, objname, content, metadict=None, codec=None):
+        """
+        save pickle object to bucket and optionally set metadata using a dict.
         Example:
         mystor.object_put_pickle('myobj.dat', x, {'key': 'val', 'a': 'b'})
         Large Pickle objects can be faster than large json objects, however
-        they are proprietary Python data objects and cannot be used by R, etc.  
+        they are proprietary Python data objects and cannot be used by R, etc.
+        -------------------------
+        see object_put_json() for compression
         """
         import pickle
 
         if self.bucket == None:
-            return None        
-        p = pickle.dumps(content)
-        return self.object_put(objname,p,metadict)
+            return None
+        with self.object_writer(objname, metadict, 
+                codec=_codec(objname, codec)) as f:
+            pickle.dump(content, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return f.resp
 
-    def object_put_csv(self, objname, content, metadict=None, dictwriter=False, dialect=None):
-        """ 
+    def object_put_csv(self, objname, content, metadict=None, dictwriter=False, 
+            dialect=None, codec=None):
+        """
         save csv object to bucket and optionally set metadata using a dict
         Example:
         mystor.object_put_csv('myobj.csv', x, {'key': 'val', 'a': 'b'})
+        -------------------------
+        content is a list (or any iterable) of rows, with dictwriter=True
+        rows are dictionaries and the keys of the first row are written
+        as csv header. see object_put_json() for compression
         """
-        import io, csv
+        import csv
 
         if self.bucket == None:
             return None
 
-        handle = io.StringIO()
-        # sniffer does not seem to work here
-        #dialect = csv.Sniffer().sniff(handle.read(4096))
-        if dictwriter:
-            if dialect:
-                wr = csv.DictWriter(handle, dialect)
-                wr.writerows(content)
+        with self.object_writer(objname, metadict, text=True, 
+                codec=_codec(objname, codec)) as handle:
+            if dictwriter:
+                content = iter(content)
+                first = next(content, None)
+                if first is not None:
+                    if dialect:
+                        wr = csv.DictWriter(handle, list(first), dialect=dialect)
+                    else:
+                        wr = csv.DictWriter(handle, list(first))
+                    wr.writeheader()
+                    wr.writerow(first)
+                    wr.writerows(content)
             else:
-                wr = csv.DictWriter(handle)
-                wr.writerows(content)
-        else:
-            if dialect:
-                wr = csv.writer(handle, dialect)
+                if dialect:
+                    wr = csv.writer(handle, dialect)
+                else:
+                    wr = csv.writer(handle)
                 wr.writerows(content)
+
+        return handle.resp
+
+    def object_put_table(self, objname, table, metadict=None, 
+            compression='zstd'):
+        """
+        save a table as parquet object (or arrow for *.arrow / *.feather)
+        Example:
+        mystor.object_put_table('slurm/jobs.parquet', dataframe)
+        -------------------------
+        table is a pyarrow Table or a pandas DataFrame. Columns are 
+        compressed with 'compression' (zstd, snappy, gzip, lz4 or None).
+        Parquet is much smaller than csv and can be read column by column
+        with object_get_table(). Requires pyarrow (pip install sci[parquet])
+        """
+        import pyarrow
+
+        if self.bucket == None:
+            return None
+
+        if not isinstance(table, pyarrow.Table):
+            table = pyarrow.Table.from_pandas(table)
+        with self.object_writer(objname, metadict) as f:
+            if self._object_ext(objname) in ('arrow', 'feather'):
+                import pyarrow.ipc
+                options = pyarrow.ipc.IpcWriteOptions(compression=compression)
+                with pyarrow.ipc.new_file(f, table.schema, options=options) as w:
+                    w.write_table(table)
             else:
-                wr = csv.writer(handle)
-                wr.writerows(content)
+                import pyarrow.parquet
+                pyarrow.parquet.write_table(table, f, compression=compression)
+        return f.resp
+
+    def object_get_table(self, objname, columns=None):
+        """
+        load a parquet or arrow object as pyarrow Table 
+        Example:
+        table = mystor.object_get_table('slurm/jobs.parquet', ['user', 'cpus'])
+        dataframe = table.to_pandas()
+        -------------------------
+        The object is read with object_open(), so for parquet only the 
+        footer and the row groups of the requested columns are 
+        downloaded. Requires pyarrow (pip install sci[parquet])
+        """
+        if self.bucket == None:
+            return None
+
+        with self.object_open(objname) as f:
+            if self._object_ext(objname) in ('arrow', 'feather'):
+                import pyarrow.ipc
+                table = pyarrow.ipc.open_file(f).read_all()
+                return table.select(columns) if columns else table
+            import pyarrow.parquet
+            return pyarrow.parquet.read_table(f, columns=columns)
+
+    def _get(self, objname, etag=None):
+        """
+        return (etag, content) of an object, content is None if etag is
+        given and the object still has this etag
+        """
+        raise NotImplementedError
+
+    def _get_stream(self, objname, chunk_size):
+        """ yield the content of an object in chunks of chunk_size bytes """
+        raise NotImplementedError
+
+    def _get_range(self, objname, start, end):
+        """ return content[start:end] of an object, see object_get_range """
+        raise NotImplementedError
+
+    def _size(self, objname):
+        """ return the size of an object in bytes """
+        raise NotImplementedError
+
+    def _meta_get(self, objname):
+        """ return the custom metadata of an object as a dictionary """
+        raise NotImplementedError
+
+    def _meta_set(self, objname, metadict):
+        """ replace the custom metadata of an object """
+        raise NotImplementedError
+
+    def _writer(self, objname, metadict, part_size, workers):
+        """ return a _partwriter that creates the object on close """
+        raise NotImplementedError
+
+    def _call(self, op, func, *args, **kwargs):
+        """ 
+        call a primitive with the retry policy of the store, pass 
+        idempotent=False for requests that cannot be repeated
+        """
+        if self.metrics:
+            return self.metrics.call(self, op, func, *args, **kwargs)
+        return self.retry.call(op, func, *args, **kwargs)
+
+    def _metric(self, op, name, n=1):
+        """ count bytes or cache hits/misses of an operation in metrics """
+        if self.metrics:
+            self.metrics.add(self, op, name, n)
+
+    def _stream(self, objname, chunk_size):
+        """
+        _get_stream with retries until the first chunk arrived, later 
+        errors cannot be retried without repeating data
+        """
+        def _start():
+            chunks = iter(self._get_stream(objname, chunk_size))
+            return chunks, next(chunks, b'')
+
+        chunks, first = self._call('get', _start)
+        self._metric('get', 'bytes', len(first))
+        yield first
+        try:
+            for chunk in chunks:
+                self._metric('get', 'bytes', len(chunk))
+                yield chunk
+        except Exception as e:
+            raise StoreError('get failed while streaming: %s' % e,
+                _error_status(e), 'get') from e
+
+    def _reader(self, objname, codec=None, chunk_size=1048576):
+        """ 
+        binary file object that streams the object and decompresses it 
+        if it was compressed 
+        """
+        import itertools
+        chunks = iter(self.object_get_stream(objname, chunk_size))
+        first = next(chunks, b'')
+        handle = io.BufferedReader(_chunkreader(itertools.chain([first], chunks)))
+        codec = _codec(objname, codec, first)
+        if codec:
+            return _codec_open(codec, handle, 'rb')
+        return handle
+
+    def _index_setup(self, metaindex, cache, cache_size):
+        """ open the metadata index and object cache passed to __init__ """
+        if metaindex:
+            if metaindex == True:
+                metaindex = os.path.join('~', '.sci', 'metaindex.sqlite')
+            self.metaindex = _metaindex(metaindex)
+        if cache:
+            if cache == True:
+                cache = os.path.join('~', '.sci', 'cache')
+            self.cache = _objcache(cache, cache_size)
+
+    def _listing_meta(self, items):
+        """
+        return the custom metadata for each item of a bucket listing.
+        With a metaindex only objects that changed since the last listing
+        are retrieved from the store, all others are read from the index.
+        """
+        if not self.metaindex:
+            return self.object_meta_get_many([item['name'] for item in items])
+
+        known = self.metaindex.get(self.bucket, self.prefix)
+        changed = []
+        for item in items:
+            if known.get(item['name'], (None, None, None))[:2] != \
+                    (item['etag'], item['last_modified']):
+                changed.append(item)
+        rows = []
+        changedmeta = self.object_meta_get_many([item['name'] for item in changed])
+        for item, meta in zip(changed, changedmeta):
+            rows.append((item['name'], item['etag'], item['last_modified'], meta))
+        self.metaindex.put(self.bucket, rows)
+        self.metaindex.prune(self.bucket, self.prefix,
+            [item['name'] for item in items])
+
+        metas = {name: meta for name, (etag, modified, meta) in known.items()}
+        for name, etag, modified, meta in rows:
+            metas[name] = meta
+        return [metas[item['name']] for item in items]
+
+    def _object_get_cached(self, objname):
+        """
+        object_get using the local cache, the cached copy is only used
+        if a conditional request confirms that the etag did not change
+        """
+        etag = self.cache.etag(self.bucket, objname)
+        newetag, content = self._call('get', self._get, objname, etag)
+        if content is None:
+            content = self.cache.read(etag)
+            if content is not None:
+                self._metric('get', 'cache_hits')
+                return content
+            # evicted in the meantime by another process
+            newetag, content = self._call('get', self._get, objname)
+        self._metric('get', 'cache_misses')
+        self._metric('get', 'bytes', len(content))
+        self.cache.put(self.bucket, objname, newetag, content)
+        return content
+
+    def _download_files(self, targets):
+        """
+        download a list of (objname, path) tuples in parallel and
+        return the list of paths that were downloaded successfully
+        """
+        import concurrent.futures
+
+        def _download(target):
+            objname, path = target
+            try:
+                if os.path.dirname(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                self._call('download', self._download_file, objname, path)
+                return True
+            except Exception as e:
+                print("'%s' download to '%s' failed" % (objname, path))
+                print("  Error: '%s'" % e)
+                return False
+
+        downloaded_files = []
+        with concurrent.futures.ThreadPoolExecutor(max(self.workers, 1)) as pool:
+            for (objname, path), ok in zip(targets, pool.map(_download, targets)):
+                if ok:
+                    self._metric('download', 'bytes', os.path.getsize(path))
+                    print("'%s' downloaded to '%s'" % (objname, path))
+                    downloaded_files.append(path)
+        return downloaded_files
+
+    def _download_file(self, objname, path):
+        """ download a single object to path via a '.part' file """
+        tmp = path + '.part'
+        with open(tmp, 'wb') as f:
+            # retried as a whole by _download_files
+            for chunk in self._get_stream(objname, 1048576):
+                f.write(chunk)
+        os.replace(tmp, path)
+
+    def _upload_files(self, targets, metadict=None):
+        """
+        upload a list of (path, objname) tuples in parallel and return
+        the list of objects that were uploaded successfully
+        """
+        import concurrent.futures, getpass
+        meta = dict(metadict or {}, **{'uploaded-by': getpass.getuser()})
+
+        def _upload(target):
+            path, objname = target
+            try:
+                self._call('upload', self._upload_file, path, objname, meta)
+                self._metric('upload', 'bytes', os.path.getsize(path))
+                print("object '%s' uploaded." % objname)
+                return objname
+            except Exception as e:
+                print("object '%s' upload failed" % objname)
+                print("  Error: '%s'" % e)
+
+        with concurrent.futures.ThreadPoolExecutor(max(self.workers, 1)) as pool:
+            return [o for o in pool.map(_upload, targets) if o]
+
+    def _upload_file(self, path, objname, metadict):
+        """ upload a single file, large files in parallel parts """
+        import shutil
+        with open(path, 'rb') as f:
+            with self._writer(objname, metadict, self.part_size, 4) as w:
+                # counted as upload by _upload_files
+                w.metered = False
+                shutil.copyfileobj(f, w, 1048576)
+
+    def _sync_listing(self):
+        """
+        return {relative path: listing item} of all objects under prefix
+        """
+        prefix = self.prefix + '/' if self.prefix else ''
+        remote = {}
+        for item in self.bucket_iter(prefix):
+            rel = item['name'][len(prefix):]
+            if not rel.startswith('.'):
+                remote[rel] = item
+        return remote
+
+    def _sync_kind(self):
+        """ name of the checksums of _sync_etags, cached in the manifest """
+        return 'md5'
+
+    def _sync_etags(self, path):
+        """
+        checksums of a local file, one of them matches _sync_remote() of
+        the object if it has the same content. The etag of swift is the
+        md5 or for large objects the etag of a static large object.
+        """
+        return list(_file_etags(path))
 
-        buffer = handle.getvalue()
+    def _sync_remote(self, item):
+        """ checksums of a listing item to compare with _sync_etags """
+        return [item['etag'].strip('"')]
 
-        return self.object_put(objname,buffer,metadict)
+    def _sync_objname(self, rel):
+        """ object name of a path relative to the sync folder """
+        if not self.prefix:
+            return rel
+        return '%s/%s' % (self.prefix, rel)
 
     def _object_ext(self, name):
         """ get the object extention (like content type) """
@@ -443,31 +1247,24 @@ class swift:
             return ""
         return ext
 
-    def _exiterr(self):
-        import sys
-        sys.exit(1)
-    
     def _fix_object_path(self, objnames):
-        """ 
-        add object prefix to list of objects if needed 
-        """        
+        """
+        add object prefix to list of objects if needed
+        """
         newobjs=[]
         for o in objnames:
-            #print('######## o type', type(o), 0)
-            if o.find('/') > -1:
-                obj = o
+            if o.find('/') > -1 or not self.prefix:
+                newobjs.append(o)
             else:
-                if not self.prefix:
-                    obj = o
-                else:
-                    obj = "%s/%s" % (self.prefix,o)
-            newobjs.append(obj)                
+                newobjs.append("%s/%s" % (self.prefix,o))
         return newobjs
 
     def _upload_object_name(self, objname):
-        """ 
+        """
         add object prefix to single upload object
-        """        
+        """
+        if not self.prefix:
+            return os.path.basename(objname) if os.path.isabs(objname) else objname
         if objname.startswith(self.prefix+'/'):
             o = objname
         elif os.path.isabs(objname):
@@ -476,14 +1273,465 @@ class swift:
             o=self.prefix+'/'+objname
         return o.replace('//','/')
 
-    def _fix_file_paths(self, files):
+
+class swift(_objstore):
+    """
+    Example:
+        mystor = sci.store.swift('the-bucket', 'virtual/sub/dir') 
+        my_objects = mystor.bucket_list()
+    -------------------------
+    Initialize an Openstack Swift container/bucket. 
+    Data will be written to the root of the bucket unless the virtual dir
+    prefix is set.The prefix can be a single virtual folder such as 
+    'subfolder' or a virtual folder such as 'folder/subfolder/subfolder'.     
+    For authentication you need to have set some environment 
+    variables. This can either be OS_AUTH_URL, OS_TENANT_NAME, 
+    OS_USERNAME, OS_PASSWORD or OS_STORAGE_URL and OS_AUTH_TOKEN. 
+    If you have Swift Commander installed, a new auth token and
+    storage URL will be automatically stored in the ~/.swift
+    folder after you use the 'swc' command. 
+    """
+
+    tokens = None
+
+    def __init__(self, bucket, prefix=None, metaindex=None, workers=8,
+            cache=None, cache_size=10737418240, object_dd_threads=10,
+            object_uu_threads=10, segment_threads=10, token_lifetime=3000,
+            retry=None):
+        """ 
+        Examples:
+        mystor = swift('the-bucket', 'virtual/sub/directory')
+        my_objects = mystor.bucket_list()
+        my_filtered_objects = mystor.bucket_list({'proj': 'ABC', 'tag': 'new'})
+        dict = mystor.object_put('the-object', "THE CONTENT", {tag': 'new'})
+        obj = mystor.object_get('the-object')
+        j = mystor.object_get_json('the-object.json')
+        ret = mystor.object_meta_set('the-object', {'proj': 'XYZ'):
+        dict = mystor.object_meta_get('the-object')
+        -------------------------
+        metaindex=True keeps a local sqlite index of object metadata in
+        ~/.sci/metaindex.sqlite (or pass a file name) so that filtered 
+        bucket_list calls only retrieve metadata of objects whose etag or
+        last_modified date changed since the last listing.
+        workers is the number of parallel requests (each with its own 
+        connection) used to retrieve metadata of many objects.
+        cache=True keeps a copy of objects loaded with object_get and 
+        object_get_json/csv in ~/.sci/cache (or pass a folder name) of up 
+        to cache_size bytes. A cached copy is only used after swift 
+        confirms that the object did not change. mystor.cache.stats() 
+        returns the number of cache hits and misses.
+        file_upload and file_download share one swift service with 
+        object_uu_threads upload, object_dd_threads download and 
+        segment_threads segment threads. Call close() or use the object 
+        as context manager to shut it down:
+        with swift('the-bucket') as mystor:
+            mystor.file_upload(files)
+        With OS_PASSWORD the auth token is cached in ~/.swift and reused 
+        by all processes for token_lifetime seconds (keep it below the 
+        token expiry of keystone, 1 hour by default), so that hundreds of
+        jobs starting at once authenticate only once. A request that 
+        fails because the token expired early gets a new token and is 
+        retried.
+        retry is a retrypolicy for all requests, e.g. to retry longer 
+        when the proxy returns 503 under load. swiftclient's own retries
+        are turned off so that they are counted by the policy.
+        """
+
+        import swiftclient, json, threading
+
+        sw_auth_version = 2
+        sw_authurl =  os.getenv("OS_AUTH_URL","")
+        sw_user = os.getenv("OS_USERNAME", "")
+        sw_key = os.getenv("OS_PASSWORD", "")
+        self.tenant = os.getenv("OS_TENANT_NAME", "")
+        self.storageurl = os.getenv("OS_STORAGE_URL","")
+        self.authtoken = os.getenv("OS_AUTH_TOKEN","")
+        self.tokens = _tokencache(sw_authurl, self.tenant, token_lifetime)
+        if not sw_key and not self.authtoken:
+            #reading authtoken from file cache in ~/.swift folder
+            self.storageurl, self.authtoken = self.tokens.read()
+        self.optsauth = self._get_swift_options(sw_authurl,sw_user,sw_key)
+        if retry:
+            self.retry = retry
+
+        self.connargs = dict(authurl=sw_authurl, user=sw_user, key=sw_key,
+                auth_version=sw_auth_version, os_options=self.optsauth,
+                retries=0, timeout=self.retry.request_timeout)
+        if not sw_key:
+            # token authentication (OS_AUTH_TOKEN or the token of swc), 
+            # without a password keystone cannot be asked anyway
+            self.swiftconn = self._connection(self.storageurl, self.authtoken)
+        else:
+            self.swiftconn = self._connection()
+            try:
+                # a cached token is reused, keystone is only asked if needed
+                self.storageurl, self.authtoken = self._call('auth',
+                    self.swiftconn.get_auth)
+            except StoreError as e:
+                print("Connection Error: %s" % e.__cause__)
+                raise
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.workers = workers
+        self.threadlocal = threading.local()
+        self.threadconns = []
+        self.threadlock = threading.Lock()
+        self.swservice = None
+        self.service_threads = {'object_dd_threads': object_dd_threads,
+                                'object_uu_threads': object_uu_threads,
+                                'segment_threads': segment_threads}
+        self.part_size = SEGMENT_SIZE
+        self._index_setup(metaindex, cache, cache_size)
+
+        os.environ["OS_AUTH_TOKEN"] = self.authtoken
+        self.optsauth['os_auth_token'] = self.authtoken
+        self.optsauth['auth_token'] = self.authtoken
+        os.environ["OS_STORAGE_URL"] = self.storageurl
+        self.optsauth['os_storage_url'] = self.storageurl
+        self.optsauth['object_storage_url'] = self.storageurl
+
+    def close(self):
+        """ 
+        shut down the threads and connections of file_upload/file_download
+        Example:
+        mystor.close()
+        """
+        import threading
+        if self.swservice:
+            self.swservice.__exit__(None, None, None)
+            self.swservice = None
+        with self.threadlock:
+            conns, self.threadconns = self.threadconns, []
+            # threads get new connections if the store is used again
+            self.threadlocal = threading.local()
+        for conn in conns:
+            conn.close()
+        self.swiftconn.close()
+
+    def bucket_iter(self, prefix=None, delimiter=None, page_size=10000):
+        if self.bucket == None:
+            return
+
+        if prefix is None:
+            prefix = self.prefix
+        marker = None
+        while True:
+            page = self._call('list', self._thread_conn().get_container, 
+                self.bucket, marker=marker, limit=page_size, prefix=prefix, 
+                delimiter=delimiter)[1]
+            for item in self._listing_items(page):
+                yield item
+            if len(page) < page_size:
+                return
+            marker = page[-1].get('name', page[-1].get('subdir'))
+
+    def _listing_items(self, page):
+        """ convert a page of a container listing to bucket_iter items """
+        for item in page:
+            if 'subdir' in item:
+                yield {'subdir': item['subdir']}
+            elif item['content_type'] != 'application/directory' and \
+                not item['name'].startswith('.') and not '/.' in item['name']:
+                    yield {'name': item['name'], 'size': item['bytes'], 
+                        'etag': item['hash'], 
+                        'last_modified': item['last_modified'],
+                        'content_type': item['content_type']}
+
+    def object_put(self, objname, content, metadict=None):
+        """ 
+        save object to bucket under prefix and optionally set metadata dict.
+        Example:
+        mystor.object_put('myobj.dat', x, {'key': 'val', 'a': 'b'})
+        -------------------------
+        content larger than part_size and file objects or iterables,
+        whose size is not known, are uploaded in segments of part_size as a static 
+        large object, see object_writer()
+        """
+        import shutil
+
+        if self.bucket == None:
+            return None
+
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        if not isinstance(content, (bytes, bytearray)) or \
+                len(content) > self.part_size:
+            with self.object_writer(objname, metadict) as f:
+                if hasattr(content, 'read'):
+                    shutil.copyfileobj(content, f, self.part_size)
+                elif isinstance(content, (bytes, bytearray)):
+                    f.write(content)
+                else:
+                    # an iterable of chunks like swiftclient accepts
+                    for chunk in content:
+                        f.write(chunk)
+            return f.resp
+
+        metadict = self._fix_metadict(metadict)
+
+        #self.swiftconn.put_object(self.storageurl, \
+        #    bucket=self.bucket, name="%s/%s" % (self.prefix,objname), \
+        #    contents=content, content_length=None, etag=None, chunk_size=None, \
+        #    content_type=None, headers=metadict, http_conn=None, proxy=None, \
+        #    query_string=None, response_dict=None, service_token=None)
+
+        objname = self._fix_object_path([objname])[0]
+
+        resp = dict()
+        ret = self._call('put', self._thread_conn().put_object, self.bucket, 
+            objname, content, response_dict=resp, headers=metadict)
+        self._metric('put', 'bytes', len(content))
+        return resp
+
+    def _get(self, objname, etag=None):
+        import swiftclient
+        headers = {'If-None-Match': etag} if etag else None
+        try:
+            head, content = self._thread_conn().get_object(self.bucket, 
+                objname, headers=headers)
+        except swiftclient.exceptions.ClientException as e:
+            if not etag or e.http_status != 304:
+                raise
+            return etag, None
+        return head.get('etag'), content
+
+    def _get_stream(self, objname, chunk_size):
+        body = self._thread_conn().get_object(self.bucket, objname,
+            resp_chunk_size=chunk_size)[1]
+        try:
+            for chunk in body:
+                yield chunk
+        finally:
+            body.close()
+
+    def _get_range(self, objname, start, end):
+        if start < 0 and end is not None:
+            start = max(self._size(objname) + start, 0)
+        headers = {'Range': _range_header(start, end)}
+        return self._thread_conn().get_object(self.bucket, objname, 
+            headers=headers)[1]
+
+    def _size(self, objname):
+        head = self._thread_conn().head_object(self.bucket, objname)
+        return int(head['content-length'])
+
+    def _meta_get(self, objname):
+        head = self._thread_conn().head_object(self.bucket, objname)
+        return self._head_meta(head)
+
+    def _meta_set(self, objname, metadict):
+        resp = dict()
+        self._thread_conn().post_object(self.bucket, objname, 
+            headers=self._fix_metadict(metadict), response_dict=resp)
+        return resp
+
+    def _writer(self, objname, metadict, part_size, workers):
+        """ 
+        parts are uploaded as segments to the '.segments_<bucket>' 
+        container and combined by a static large object manifest 
+        """
+        return _swiftwriter(self, objname, self._fix_metadict(metadict),
+            part_size, workers)
+
+    def _service(self):
+        """ 
+        return the swift service used by file_upload/file_download, it is
+        created on first use and keeps its threads and connections 
+        until close() 
+        """
+        import swiftclient.service
+        if not self.swservice:
+            # failed requests are repeated by the retry policy
+            options = dict(self.optsauth, retries=0, **self.service_threads)
+            self.swservice = swiftclient.service.SwiftService(options=options)
+            self.swservice.__enter__()
+        return self.swservice
+
+    def _upload_files(self, targets, metadict=None):
+        """ 
+        upload a list of (path, objname) tuples in parallel, each file 
+        with the retry policy and metrics of the store, see _upload_file
+        """
+        if targets:
+            conn = self._thread_conn()
+            for container in (self.bucket, '.segments_' + self.bucket):
+                self._call('put', conn.put_container, container)
+        return super()._upload_files(targets, metadict)
+
+    def _upload_file(self, path, objname, metadict):
+        """ 
+        upload a single file using the shared swift service, large files
+        are uploaded as static large objects. A failure is raised so that
+        the retry policy can repeat the upload.
+        """
+        # see https://docs.openstack.org/python-swiftclient/latest/service-api.html
+        import swiftclient.service
+        obj = swiftclient.service.SwiftUploadObject(path, object_name=objname)
+        for r in self._service().upload(container=self.bucket, objects=[obj],
+                options={'segment_size': SEGMENT_SIZE,
+                    'use_slo': True,
+                    'meta': metadict,
+                    'segment_container': '.segments_' + self.bucket,
+                    'skip_container_put': True}):
+            if not r['success']:
+                raise r.get('error') or IOError('upload of %s failed' % objname)
+
+    def _download_file(self, objname, path):
+        """ 
+        download a single object to path via a '.part' file, resuming a 
+        previous partial download of the same object version 
+        """
+        conn = self._thread_conn()
+        head = conn.head_object(self.bucket, objname)
+        size = int(head['content-length'])
+        tmp = path + '.part'
+        if head.get('x-static-large-object', '').lower() == 'true':
+            self._download_segments(objname, tmp, size, head.get('etag'))
+        else:
+            self._download_resume(conn, objname, tmp, size, head.get('etag'))
+        if os.path.getsize(tmp) != size:
+            raise IOError('incomplete download, %s of %s bytes' % (
+                os.path.getsize(tmp), size))
+        os.replace(tmp, path)
+        if 'x-object-meta-mtime' in head:
+            mtime = float(head['x-object-meta-mtime'])
+            os.utime(path, (mtime, mtime))
+
+    def _download_resume(self, conn, objname, tmp, size, etag):
+        """ append the rest of the object to a partially downloaded file """
+        import swiftclient
+        if os.path.exists(tmp) and os.path.getsize(tmp) == size:
+            return
+        offset = os.path.getsize(tmp) if os.path.exists(tmp) else 0
+        if offset > size:
+            offset = 0
+        headers = None
+        if offset:
+            # If-Match fails if the object changed since the first attempt
+            headers = {'Range': 'bytes=%d-' % offset, 'If-Match': etag}
+        try:
+            body = conn.get_object(self.bucket, objname, 
+                resp_chunk_size=1048576, headers=headers)[1]
+        except swiftclient.exceptions.ClientException as e:
+            if not offset or e.http_status not in (412, 416):
+                raise
+            offset = 0
+            body = conn.get_object(self.bucket, objname, 
+                resp_chunk_size=1048576)[1]
+        with open(tmp, 'ab' if offset else 'wb') as f:
+            for chunk in body:
+                f.write(chunk)
+
+    def _download_segments(self, objname, tmp, size, etag):
+        """ 
+        download the segments of a static large object in parallel into 
+        their place in tmp. Finished segments are recorded in tmp.json 
+        so that a failed download can be resumed.
+        """
+        import json, threading, concurrent.futures
+        conn = self._thread_conn()
+        manifest = json.loads(conn.get_object(self.bucket, objname, 
+            query_string='multipart-manifest=get')[1])
+
+        statefile = tmp + '.json'
+        done = set()
+        if os.path.exists(tmp) and os.path.exists(statefile):
+            with open(statefile, 'r') as f:
+                state = json.load(f)
+            if state.get('etag') == etag:
+                done = set(state['done'])
+        if not done:
+            with open(tmp, 'wb') as f:
+                f.truncate(size)
+
+        offsets = []
+        offset = 0
+        for seg in manifest:
+            offsets.append(offset)
+            if seg.get('range'):
+                first, last = seg['range'].split('-')
+                offset += int(last) - int(first) + 1
+            else:
+                offset += seg['bytes']
+
+        lock = threading.Lock()
+
+        def _segment(i):
+            seg = manifest[i]
+            container, name = seg['name'].lstrip('/').split('/', 1)
+            headers = {'Range': 'bytes=%s' % seg['range']} if seg.get('range') else None
+            body = self._thread_conn().get_object(container, name, 
+                resp_chunk_size=1048576, headers=headers)[1]
+            with open(tmp, 'r+b') as f:
+                f.seek(offsets[i])
+                for chunk in body:
+                    f.write(chunk)
+            with lock:
+                done.add(i)
+                with open(statefile, 'w') as f:
+                    json.dump({'etag': etag, 'done': sorted(done)}, f)
+
+        todo = [i for i in range(len(manifest)) if i not in done]
+        threads = max(self.service_threads['segment_threads'], 1)
+        with concurrent.futures.ThreadPoolExecutor(threads) as pool:
+            list(pool.map(_segment, todo))
+        if os.path.exists(statefile):
+            os.remove(statefile)
+
+    def _head_meta(self, head):
+        """ extract custom metadata from the headers of a HEAD request """
+        newhead = {}
+        for k,v in head.items():
+            if k.startswith('x-object-meta-'):
+                newhead[k.replace('x-object-meta-','')] = v
+        return newhead
+
+    def _thread_conn(self):
+        """ 
+        return a swift connection owned by the calling thread, connections
+        are not thread safe and cannot be shared by worker threads. The
+        main thread uses swiftconn.
+        """
+        import threading
+        if threading.current_thread() is threading.main_thread():
+            return self.swiftconn
+        threadlocal = self.threadlocal
+        if not hasattr(threadlocal, 'swiftconn'):
+            threadlocal.swiftconn = self._connection(
+                preauthurl=self.swiftconn.url or self.storageurl,
+                preauthtoken=self.swiftconn.token or self.authtoken)
+            # close() closes the connections of all threads
+            with self.threadlock:
+                self.threadconns.append(threadlocal.swiftconn)
+        return threadlocal.swiftconn
+
+    def _connection(self, preauthurl=None, preauthtoken=None):
         """ 
-        changing back to forward slashes (for windows)
+        new swift connection that gets its token from the token cache. 
+        swiftclient calls get_auth again when a request fails with 401, 
+        then the token is refreshed (unless another process did that 
+        already) and swiftclient retries the request.
         """
-        newfiles=[]
-        for f in files:
-            newfiles.append(f.replace('\\','/'))
-        return newfiles
+        import swiftclient
+        conn = swiftclient.client.Connection(preauthurl=preauthurl,
+            preauthtoken=preauthtoken, **self.connargs)
+        if not self.tokens or not self.connargs.get('key'):
+            # token authentication, there is no password to get a new one
+            return conn
+        authenticate = conn.get_auth
+        used = [preauthtoken]
+
+        def _get_auth(stale=None):
+            # a token that was used before expired or was rejected, aio
+            # passes the token that it used itself
+            conn.url, conn.token = self.tokens.get(authenticate,
+                stale=stale or used[0])
+            used[0] = conn.token
+            return conn.url, conn.token
+
+        conn.get_auth = _get_auth
+        return conn
 
     def _fix_metadict(self, metadict):
         """ ensure that x-object-meta prefix is added to all metadata keys """
@@ -539,349 +1787,2235 @@ class swift:
                   'variables. (e.g. execute "read -s OS_PASSWORD")')
         return options
 
-    def _get_set_token_file(self, authurl, newauthtoken=None):
-        import urllib.parse
-        homedir = os.path.expanduser("~")        
-        host = urllib.parse.urlparse(authurl).netloc
-        authtokenfile = os.path.join(homedir,'.swift','auth_token_%s_v2_%s' % (host,self.tenant))
-        storageurlfile = os.path.join(homedir,'.swift','storageurl_%s_v2_%s' % (host,self.tenant))
-
-        if newauthtoken:
-            if not os.path.exists(os.path.join(homedir,'.swift')):
-                os.mkdir(os.path.join(homedir,'.swift'))
-            if os.path.exists(authtokenfile):
-                os.remove(authtokenfile)
-            with open(authtokenfile, 'w') as f:
-                f.write(newauthtoken)
-            with open(storageurlfile, 'w') as f:
-                f.write(self.storageurl)
-            return ""
-        else:
-            if os.path.exists(authtokenfile):
-                with open(authtokenfile, 'r') as f:
-                    self.authtoken = f.readline().strip()
-                with open(storageurlfile, 'r') as f:
-                    self.storageurl = f.readline().strip()
-                return self.authtoken
-            else:
-                return ""
 
+def _file_etags(path, segment_size=SEGMENT_SIZE):
+    """ 
+    return (md5, slo_etag) of a local file. slo_etag is the etag swift 
+    reports for the file if it was uploaded as static large object in 
+    segments of segment_size, the md5 of the concatenated segment md5s
+    """
+    import hashlib
+    md5, segments = _file_segments(path, segment_size)
+    return md5.hexdigest(), hashlib.md5(''.join(s.hexdigest() 
+        for s in segments).encode()).hexdigest()
+
+
+def _file_segments(path, segment_size):
+    """ return the md5 of a file and the md5s of its segments """
+    import hashlib
+    md5 = hashlib.md5()
+    segments = []
+    with open(path, 'rb') as f:
+        while True:
+            seg = hashlib.md5()
+            n = 0
+            while n < segment_size:
+                chunk = f.read(min(1048576, segment_size - n))
+                if not chunk:
+                    break
+                md5.update(chunk)
+                seg.update(chunk)
+                n += len(chunk)
+            if not n:
+                break
+            segments.append(seg)
+            if n < segment_size:
+                break
+    return md5, segments
+
+
+def _sync_hashes(localdir, etags, kind, sizes=None, workers=8):
+    """
+    return {relative path: (size, checksums)} for files in localdir, 
+    etags(path) returns the checksums of a file of the given kind. 
+    Checksums are reused from the manifest in localdir if size and mtime 
+    of a file did not change. If sizes is given, only files with the 
+    same size as in sizes are hashed, all others get no checksums.
+    """
+    import json, concurrent.futures
+    mfile = os.path.join(localdir, SYNC_MANIFEST)
+    manifest = {}
+    if os.path.exists(mfile):
+        with open(mfile, 'r') as f:
+            manifest = json.load(f)
+
+    files = {}
+    for root, dirs, names in os.walk(localdir):
+        dirs[:] = [d for d in dirs if not d.startswith('.')]
+        for name in names:
+            if name.startswith('.'):
+                continue
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, localdir).replace('\\','/')
+            files[rel] = os.stat(path)
+
+    result = {}
+    tohash = []
+    for rel, st in files.items():
+        entry = _sync_entry(manifest.get(rel))
+        if entry and entry[0] == st.st_size and entry[1] == st.st_mtime \
+                and entry[2] == kind:
+            result[rel] = (st.st_size, entry[3])
+        elif sizes is not None and sizes.get(rel) != st.st_size:
+            result[rel] = (st.st_size, ())
+        else:
+            tohash.append(rel)
+
+    with concurrent.futures.ThreadPoolExecutor(max(workers, 1)) as pool:
+        checksums = pool.map(lambda rel: etags(os.path.join(localdir, rel)), tohash)
+        newentries = {}
+        for rel, sums in zip(tohash, checksums):
+            result[rel] = (files[rel].st_size, sums)
+            newentries[rel] = (files[rel], kind, sums)
+    _sync_manifest_update(localdir, newentries, keep=files)
+    return result
+
+
+def _sync_entry(entry):
+    """ 
+    [size, mtime, kind, checksums] of a manifest entry, older manifests 
+    have [size, mtime, md5, slo_etag]
+    """
+    if entry and len(entry) == 4 and not isinstance(entry[3], list):
+        return [entry[0], entry[1], 'md5', [entry[2], entry[3]]]
+    return entry
 
 
-class s3:
+def _sync_manifest_update(localdir, entries, keep=None):
+    """ 
+    add {relative path: (stat, kind, checksums)} entries to the manifest
+    in localdir, if keep is given, entries for other files are removed
     """
-    Initialize an s3 bucket using a certain profile
-    Data will be written to the root of the bucket unless the virtual dir
-    prefix is set.The prefix can be a single virtual folder such as 
-    'subfolder' or a virtual folder such as 'folder/subfolder/subfolder'.     
-    Example:
-        mystor = sci.store.s3('the-bucket', 'virtual/dir', 'profile') 
-        my_objects = mystor.bucket_list()
+    import json
+    mfile = os.path.join(localdir, SYNC_MANIFEST)
+    manifest = {}
+    if os.path.exists(mfile):
+        with open(mfile, 'r') as f:
+            manifest = json.load(f)
+    if keep is not None:
+        manifest = {rel: e for rel, e in manifest.items() if rel in keep}
+    if not entries and keep is None:
+        return
+    for rel, (st, kind, sums) in entries.items():
+        manifest[rel] = [st.st_size, st.st_mtime, kind, list(sums)]
+    with open(mfile + '.tmp', 'w') as f:
+        json.dump(manifest, f)
+    os.replace(mfile + '.tmp', mfile)
+
+
+class _chunkreader(io.RawIOBase):
+    """ 
+    read-only file object over an iterator of bytes chunks, 
+    e.g. a streaming http response 
     """
 
-    def __init__(self, bucket, prefix=None, profile='default'):
-        """ 
-        Examples:
-        mystor = s3('the-bucket', 'virtual/sub/directory')
-        """
-        self.s3conn = "s3"
-        self.bucket = bucket
-        self.prefix = prefix
-
-    def bucket_list(self, filter=None):
-        """
-        return a list of objects from the previously initialized bucket. 
-        This list can be a filtered list by passing in a dictionary of
-        key / value pairs as filter. 
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buf = b''
 
-        Example:
-        my_filtered_objects = mystor.bucket_list({'proj': 'ABC', 'tag': 'new'})
-        """
+    def readable(self):
+        return True
 
-        if self.bucket == None:
-            return []
+    def readinto(self, b):
+        while not self.buf:
+            try:
+                self.buf = next(self.chunks)
+            except StopIteration:
+                return 0
+        n = min(len(b), len(self.buf))
+        b[:n] = self.buf[:n]
+        self.buf = self.buf[n:]
+        return n
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+        super().close()
+
+
+def _texthandle(chunks, encoding='utf-8'):
+    """ 
+    incrementally decoding text file handle over bytes chunks or over 
+    a binary file object 
+    """
+    if not hasattr(chunks, 'read'):
+        chunks = io.BufferedReader(_chunkreader(chunks))
+    return io.TextIOWrapper(chunks, encoding=encoding, newline='')
 
-        try:
-            listing = self.s3conn.get_container(self.bucket,
-                                           prefix=self.prefix,
-                                           full_listing=True)
-        except:
-            return []
 
-        newlist=[]
-        for item in listing[1]:
-            if item['content_type'] != 'application/directory' and \
-                not item['name'].startswith('.') and not '/.' in item['name']:
-                    if not filter:
-                        newlist.append(item["name"])
-                    else:
-                        meta = self.object_meta_get(item['name'])
-                        # is filter a full subset of meta
-                        if filter.items() <= meta.items():
-                            newlist.append(item["name"])
+def _codec(objname, codec=None, head=None):
+    """ 
+    return the compression codec of an object, codec if it is given or 
+    else the one matching the extension of objname or its first bytes 
+    """
+    if codec:
+        if codec not in CODEC_EXTENSIONS.values():
+            raise ValueError('unknown codec: %s' % codec)
+        return codec
+    ext = objname.split('.')[-1]
+    if ext in CODEC_EXTENSIONS:
+        return CODEC_EXTENSIONS[ext]
+    if head:
+        for magic, name in CODEC_MAGIC.items():
+            if head.startswith(magic):
+                return name
+    return None
+
+
+def _codec_open(codec, fileobj, mode, level=None):
+    """ 
+    compressing (mode 'wb') or decompressing (mode 'rb') file object 
+    over fileobj, closing it does not close fileobj 
+    """
+    if codec == 'gzip':
+        import gzip
+        return gzip.GzipFile(fileobj=fileobj, mode=mode, 
+            compresslevel=6 if level is None else level)
+    if codec == 'zstd':
+        import zstandard
+        if mode == 'rb':
+            return zstandard.ZstdDecompressor().stream_reader(fileobj, 
+                read_across_frames=True, closefd=False)
+        return zstandard.ZstdCompressor(level=3 if level is None else 
+            level).stream_writer(fileobj, closefd=False)
+    if codec == 'lz4':
+        import lz4.frame
+        return lz4.frame.LZ4FrameFile(fileobj, mode=mode, 
+            compression_level=0 if level is None else level)
+    raise ValueError('unknown codec: %s' % codec)
+
+
+def _decompress(objname, content, codec=None):
+    """ decompress the content of an object if it was compressed """
+    codec = _codec(objname, codec, content[:4])
+    if not codec:
+        return content
+    with _codec_open(codec, io.BytesIO(content), 'rb') as f:
+        return f.read()
+
+
+def _iter_json(handle, chunk_size=1048576):
+    """
+    yield the elements of a json array read incrementally from a text 
+    file handle, any other json document is yielded as a whole
+    """
+    import json
+    decoder = json.JSONDecoder()
+    buf, pos, eof = '', 0, False
+
+    def _read():
+        # read at least as much as we have buffered to avoid re-parsing 
+        # large elements over and over 
+        nonlocal buf, pos, eof
+        chunk = handle.read(max(chunk_size, len(buf) - pos))
+        eof = not chunk
+        buf, pos = buf[pos:] + chunk, 0
+
+    def _peek():
+        # next non-whitespace character or '' at end of input
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\n\r':
+                pos += 1
+            if pos < len(buf) or eof:
+                return buf[pos:pos+1]
+            _read()
+
+    if _peek() != '[':
+        yield json.loads(buf[pos:] + handle.read())
+        return
+    pos += 1
+    if _peek() == ']':
+        return
+    while True:
+        _peek()
+        while True:
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+                # a number at the end of the buffer may be incomplete
+                if end < len(buf) or eof:
+                    break
+            except ValueError:
+                if eof:
+                    raise
+            _read()
+        yield item
+        pos = end
+        c = _peek()
+        if c == ']':
+            return
+        if c != ',':
+            raise ValueError('Expecting , or ] in json array: %r' % buf[pos:pos+20])
+        pos += 1
+
+
+def _b64(digest):
+    """ base64 string of a binary checksum or None """
+    import base64
+    if not digest:
+        return None
+    return base64.b64encode(bytes(digest)).decode()
+
+
+def _posix_etag(st):
+    """ etag of a file derived from modification time and size """
+    return '%x-%x' % (st.st_mtime_ns, st.st_size)
+
+
+def _range_header(start, end=None):
+    """ 
+    http Range header value for python style slice [start:end], a suffix 
+    range has no end so a negative start with an end must be resolved 
+    against the object size first
+    """
+    if start < 0 and end is not None:
+        raise ValueError('negative start %d with end %d' % (start, end))
+    if start < 0:
+        return 'bytes=%d' % start
+    if end is None:
+        return 'bytes=%d-' % start
+    return 'bytes=%d-%d' % (start, end - 1)
+
+
+def _prometheus_labels(stats):
+    """ backend, bucket and op labels of a metrics.stats() item """
+    return ','.join('%s="%s"' % (k, str(stats[k]).replace('\\', '\\\\').replace(
+        '"', '\\"')) for k in ('backend', 'bucket', 'op'))
+
+
+def _error_status(e):
+    """ http status code of an exception raised by a backend or None """
+    if isinstance(e, FileNotFoundError):
+        return 404
+    # swiftclient, azure, google api_core
+    for attr in ('http_status', 'status_code', 'code'):
+        status = getattr(e, attr, None)
+        if isinstance(status, int):
+            return status
+    response = getattr(e, 'response', None)
+    if isinstance(response, dict):
+        # botocore
+        return response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+    return getattr(response, 'status_code', None)
+
+
+def _retryable(e):
+    """ True for transient errors such as 503 or a dropped connection """
+    status = _error_status(e)
+    if status is not None:
+        return status in RETRY_STATUS
+    if isinstance(e, (ConnectionError, TimeoutError)):
+        return True
+    # network errors of requests, urllib3, botocore and azure-core
+    for cls in type(e).__mro__:
+        if 'Timeout' in cls.__name__ or 'ConnectionError' in cls.__name__ or \
+                cls.__name__ in ('ProtocolError', 'ChunkedEncodingError',
+                'IncompleteRead', 'ServiceRequestError', 'ServiceResponseError'):
+            return True
+    return False
+
+
+class _rangereader(io.RawIOBase):
+    """ 
+    read-only seekable file object that fetches blocks of a remote object 
+    on demand using get_range(start, end) and keeps an LRU block cache
+    """
 
-        #return [item["name"] for item in listing[1]]
-        return newlist
+    def __init__(self, get_range, size, blocksize, cache_blocks, readahead):
+        import collections
+        self.get_range = get_range
+        self.size = size
+        self.blocksize = blocksize
+        self.cache_blocks = max(cache_blocks, readahead + 1)
+        self.readahead = readahead
+        self.cache = collections.OrderedDict()
+        self.lastblock = None
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.pos = offset
+        elif whence == io.SEEK_CUR:
+            self.pos += offset
+        elif whence == io.SEEK_END:
+            self.pos = self.size + offset
+        else:
+            raise ValueError('invalid whence (%r)' % whence)
+        self.pos = max(self.pos, 0)
+        return self.pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.pos
+        b = bytearray(max(min(size, self.size - self.pos), 0))
+        n = self.readinto(b)
+        return bytes(b[:n])
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        n = 0
+        while n < len(view) and self.pos < self.size:
+            i = self.pos // self.blocksize
+            block = self._block(i)
+            offset = self.pos - i * self.blocksize
+            chunk = block[offset:offset + len(view) - n]
+            view[n:n + len(chunk)] = chunk
+            n += len(chunk)
+            self.pos += len(chunk)
+        return n
+
+    def _block(self, i):
+        if i in self.cache:
+            self.cache.move_to_end(i)
+            self.lastblock = i
+            return self.cache[i]
+        # read ahead only if the file is read sequentially
+        count = 1
+        if self.lastblock is not None and i == self.lastblock + 1:
+            count += self.readahead
+        lastblock = (self.size - 1) // self.blocksize
+        count = min(count, lastblock - i + 1)
+        start = i * self.blocksize
+        end = min((i + count) * self.blocksize, self.size)
+        data = self.get_range(start, end)
+        for j in range(count):
+            self.cache[i + j] = data[j * self.blocksize:(j + 1) * self.blocksize]
+            self.cache.move_to_end(i + j)
+        while len(self.cache) > self.cache_blocks:
+            self.cache.popitem(last=False)
+        self.lastblock = i
+        return self.cache[i]
+
+
+class _partwriter(io.BufferedIOBase):
+    """ 
+    writable file object that uploads in parts of part_size bytes while
+    data is written, with up to 'workers' parts uploading in parallel. 
+    Backends implement _put_single, _start, _put_part, _finish and _abort.
+    """
 
-    def object_get(self, objname):
-        """ load the object into memory """
-        if self.bucket == None:
-            return None
-        raw = self.swiftconn.get_object(self.bucket, objname)[1]
-        return raw 
-        #raw = lzma.decompress(compressed)
-        #data = json.loads(raw.decode("utf-8"))
-        # do something with the data ...
-
-    def object_get_json(self, objname):
-        """ load object into memory and de-serialize json """
-        raw = self.object_get(objname)
-        return json.loads(raw.decode()) #json.loads(raw.decode("utf-8"))
-
-    def object_get_csv(self, objname):
-        """ load object into memory and convert to csv """
-        raw = self.object_get(objname)
-        return json.loads(raw.decode()) #json.loads(raw.decode("utf-8"))
+    metered = True
+
+    def __init__(self, store, objname, metadict, part_size, workers):
+        self.store = store
+        self.objname = objname
+        self.metadict = metadict
+        self.part_size = part_size
+        self.workers = max(workers, 1)
+        self.size = 0
+        self.buf = bytearray()
+        self.pool = None
+        self.futures = []
+        self.resp = None
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        if self.closed:
+            raise ValueError('write to closed object writer')
+        self.buf += b
+        self.size += len(b)
+        while len(self.buf) >= self.part_size:
+            self._upload_part(bytes(self.buf[:self.part_size]))
+            del self.buf[:self.part_size]
+        return len(b)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if not self.futures:
+                self.resp = self.store._call('put', self._put_single,
+                    bytes(self.buf))
+            else:
+                if self.buf:
+                    self._upload_part(bytes(self.buf))
+                self.resp = self.store._call('put', self._finish,
+                    [f.result() for f in self.futures])
+        except BaseException:
+            self.abort()
+            raise
+        if self.metered:
+            self.store._metric('put', 'bytes', self.size)
+        self.buf = bytearray()
+        if self.pool:
+            self.pool.shutdown()
+        super().close()
+
+    def abort(self):
+        """ stop uploading and remove parts that were already uploaded """
+        import concurrent.futures
+        if self.closed:
+            return
+        self.buf = bytearray()
+        for f in self.futures:
+            f.cancel()
+        concurrent.futures.wait(self.futures)
+        if self.pool:
+            parts = [f.result() for f in self.futures 
+                if not f.cancelled() and not f.exception()]
+            try:
+                self._abort(parts)
+            except Exception as e:
+                print("Upload Cleanup Error: %s" % e)
+            self.pool.shutdown()
+        super().close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
+
+    def _upload_part(self, data):
+        import concurrent.futures
+        if not self.pool:
+            self.store._call('put', self._start)
+            self.pool = concurrent.futures.ThreadPoolExecutor(self.workers)
+        # wait for a free worker so that memory use stays bounded
+        running = [f for f in self.futures if not f.done()]
+        if len(running) >= self.workers:
+            concurrent.futures.wait(running, 
+                return_when=concurrent.futures.FIRST_COMPLETED)
+        self.futures.append(self.pool.submit(self.store._call, 'put',
+            self._put_part, len(self.futures), data))
+
+
+class _swiftwriter(_partwriter):
+    """ 
+    object writer that uploads parts as segments of a static large 
+    object, returned by swift.object_writer()
+    """
 
-    def object_meta_get(self, objname):
-        """ retrieve custom metadata from object as a dictionary """
-        if self.bucket == None:
-            return None
-        head = self.s3conn.head_object(self.bucket,objname)
- 
-    def object_meta_set(self, objname, metadict):
-        """ set custom metadata on existing object using a dictionary """
+    def __init__(self, store, objname, metadict, part_size, workers):
+        import time
+        super().__init__(store, objname, metadict, part_size, workers)
+        self.segcontainer = '.segments_' + store.bucket
+        self.segprefix = '%s/slo/%f/%s' % (objname, time.time(), part_size)
 
-        if self.bucket == None:
-            return None
+    def _put_single(self, data):
+        resp = dict()
+        self.store._thread_conn().put_object(self.store.bucket, self.objname, 
+            data, headers=self.metadict, response_dict=resp)
+        return resp
 
-        ret = self.s3conn.post_object(self.bucket, "%s/%s" % (self.prefix,objname))        
+    def _start(self):
+        self.store._thread_conn().put_container(self.segcontainer)
 
-    def object_put(self, objname, content, metadict=None):
-        """ save object to bucket and optionally set metadata using a dict """
+    def _put_part(self, index, data):
+        segname = '%s/%08d' % (self.segprefix, index)
+        etag = self.store._thread_conn().put_object(self.segcontainer,
+            segname, data)
+        return {'path': '/%s/%s' % (self.segcontainer, segname),
+                'etag': etag, 'size_bytes': len(data)}
 
-        if self.bucket == None:
-            return None
+    def _finish(self, parts):
+        import json
+        resp = dict()
+        self.store._thread_conn().put_object(self.store.bucket, self.objname, 
+            json.dumps(parts), headers=self.metadict,
+            query_string='multipart-manifest=put', response_dict=resp)
+        return resp
 
-        ret = self.s3conn.put_object(self.bucket, "%s/%s" % (self.prefix,objname), content, \
-            response_dict=resp, headers=metadict)
+    def _abort(self, parts):
+        for part in parts:
+            self.store._thread_conn().delete_object(self.segcontainer, 
+                part['path'].split('/', 2)[2])
 
-    def _object_ext(self, name):
-        """ get the object extention (like content type) """
-        ext = name.split(".")[-1]
-        if ext == name:
-            return ""
-        return ext
 
+class _s3writer(_partwriter):
+    """ 
+    object writer that uploads parts of an s3 multipart upload, 
+    returned by s3.object_writer()
+    """
+
+    def _put_single(self, data):
+        return self.store.s3conn.put_object(Bucket=self.store.bucket, 
+            Key=self.objname, Body=data, Metadata=self.metadict)
+
+    def _start(self):
+        self.upload_id = self.store.s3conn.create_multipart_upload(
+            Bucket=self.store.bucket, Key=self.objname, 
+            Metadata=self.metadict)['UploadId']
+
+    def _put_part(self, index, data):
+        resp = self.store.s3conn.upload_part(Bucket=self.store.bucket, 
+            Key=self.objname, UploadId=self.upload_id, PartNumber=index + 1,
+            Body=data)
+        return {'PartNumber': index + 1, 'ETag': resp['ETag']}
 
-class google:
+    def _finish(self, parts):
+        return self.store.s3conn.complete_multipart_upload(
+            Bucket=self.store.bucket, Key=self.objname, 
+            UploadId=self.upload_id, MultipartUpload={'Parts': parts})
+
+    def _abort(self, parts):
+        self.store.s3conn.abort_multipart_upload(Bucket=self.store.bucket, 
+            Key=self.objname, UploadId=self.upload_id)
+
+
+class _gswriter(_partwriter):
+    """ 
+    object writer for google cloud storage, parts are uploaded as 
+    temporary objects and composed into the final object on close,
+    returned by google.object_writer()
     """
-    Initialize a Google cloud bucket using a certain profile
+
+    def __init__(self, store, objname, metadict, part_size, workers):
+        import uuid
+        super().__init__(store, objname, metadict, part_size, workers)
+        # hidden from bucket_list and bucket_iter until they are removed
+        self.partprefix = '.parts/%s/%s' % (objname, uuid.uuid4().hex)
+
+    def _put_single(self, data):
+        blob = self.store.gsbucket.blob(self.objname)
+        blob.metadata = self.metadict
+        blob.upload_from_string(data)
+        return blob.metadata
+
+    def _start(self):
+        pass
+
+    def _put_part(self, index, data):
+        blob = self.store.gsbucket.blob('%s/%08d' % (self.partprefix, index))
+        blob.upload_from_string(data)
+        return blob
+
+    def _finish(self, parts):
+        blob = self.store.gsbucket.blob(self.objname)
+        blob.metadata = self.metadict
+        # a compose request accepts at most 32 source objects
+        blob.compose(parts[:32])
+        for i in range(32, len(parts), 31):
+            blob.compose([blob] + parts[i:i + 31])
+        self._abort(parts)
+        return blob.metadata
+
+    def _abort(self, parts):
+        self.store.gsbucket.delete_blobs(parts, on_error=lambda blob: None)
+
+
+class _azwriter(_partwriter):
+    """ 
+    object writer for azure that stages each part as a block of a 
+    block blob and commits the block list on close, 
+    returned by azure.object_writer()
+    """
+
+    def __init__(self, store, objname, metadict, part_size, workers):
+        import hashlib, uuid
+        super().__init__(store, objname, metadict, part_size, workers)
+        self.blobclient = store.container.get_blob_client(objname)
+        self.blockprefix = uuid.uuid4().hex
+        # azure computes no md5 for blobs made of blocks
+        self.md5 = hashlib.md5()
+
+    def write(self, b):
+        n = super().write(b)
+        self.md5.update(b)
+        return n
+
+    def _put_single(self, data):
+        return self.blobclient.upload_blob(data, overwrite=True, 
+            metadata=self.metadict)
+
+    def _start(self):
+        pass
+
+    def _put_part(self, index, data):
+        import base64
+        blockid = base64.b64encode(('%s-%08d' % (self.blockprefix, 
+            index)).encode()).decode()
+        self.blobclient.stage_block(blockid, data)
+        return blockid
+
+    def _finish(self, parts):
+        from azure.storage.blob import BlobBlock, ContentSettings
+        return self.blobclient.commit_block_list([BlobBlock(block_id=b) 
+            for b in parts], metadata=self.metadict,
+            content_settings=ContentSettings(
+                content_md5=bytearray(self.md5.digest())))
+
+    def _abort(self, parts):
+        # uncommitted blocks are discarded by azure after a week
+        pass
+
+
+class _posixwriter(_partwriter):
+    """ 
+    object writer for posix that writes parts at their offset into a
+    hidden temporary file which is renamed on close, 
+    returned by posix.object_writer()
+    """
+
+    def __init__(self, store, objname, metadict, part_size, workers):
+        super().__init__(store, objname, metadict, part_size, workers)
+        self.path = store._path(objname)
+        self.tmp = store._tmppath(objname)
+
+    def _put_single(self, data):
+        os.makedirs(os.path.dirname(self.tmp), exist_ok=True)
+        try:
+            with open(self.tmp, 'wb') as f:
+                f.write(data)
+        except BaseException:
+            self._abort([])
+            raise
+        return self._finish([])
+
+    def _start(self):
+        os.makedirs(os.path.dirname(self.tmp), exist_ok=True)
+        open(self.tmp, 'wb').close()
+
+    def _put_part(self, index, data):
+        with open(self.tmp, 'r+b') as f:
+            f.seek(index * self.part_size)
+            f.write(data)
+        return len(data)
+
+    def _finish(self, parts):
+        os.replace(self.tmp, self.path)
+        self.store._meta_write(self.objname, self.metadict)
+        return {'etag': _posix_etag(os.stat(self.path))}
+
+    def _abort(self, parts):
+        if os.path.exists(self.tmp):
+            os.remove(self.tmp)
+
+
+class _memwriter(_partwriter):
+    """ 
+    object writer that joins the parts in memory on close, 
+    returned by memory.object_writer()
+    """
+
+    def _put_single(self, data):
+        return self.store._store(self.objname, data, self.metadict)
+
+    def _start(self):
+        pass
+
+    def _put_part(self, index, data):
+        return data
+
+    def _finish(self, parts):
+        return self.store._store(self.objname, b''.join(parts), self.metadict)
+
+    def _abort(self, parts):
+        pass
+
+
+class _codecwriter(io.BufferedIOBase):
+    """ 
+    writable file object that compresses data into an object writer,
+    returned by object_writer(codec=...)
+    """
+
+    def __init__(self, writer, codec, level=None):
+        self.writer = writer
+        self.stream = _codec_open(codec, writer, 'wb', level)
+
+    @property
+    def resp(self):
+        return self.writer.resp
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        return self.stream.write(b)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.stream.close()
+            self.writer.close()
+        except BaseException:
+            self.writer.abort()
+            raise
+        super().close()
+
+    def abort(self):
+        """ stop uploading and remove parts that were already uploaded """
+        self.writer.abort()
+        super().close()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type:
+            self.abort()
+        else:
+            self.close()
+
+
+class _textwriter(io.TextIOWrapper):
+    """ text mode object writer, aborts the upload on exceptions """
+
+    @property
+    def resp(self):
+        return self.buffer.resp
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type:
+            self.buffer.abort()
+        else:
+            self.close()
+
+
+class _objcache:
+    """
+    Local content addressed cache of objects with LRU eviction. 
+    Objects are stored in files named after their etag, a sqlite 
+    index maps bucket and object name to the etag and tracks size and 
+    last access of each file.
+    """
+
+    def __init__(self, folder, maxsize):
+        import sqlite3, threading
+        self.folder = os.path.expanduser(folder)
+        self.maxsize = maxsize
+        self.counts = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self.lock = threading.Lock()
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        self.conn = sqlite3.connect(os.path.join(self.folder, 'index.sqlite'),
+            timeout=60, check_same_thread=False)
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS objects ('
+                'bucket TEXT, name TEXT, etag TEXT, PRIMARY KEY (bucket, name))')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS files ('
+                'etag TEXT PRIMARY KEY, size INTEGER, atime REAL)')
+
+    def stats(self):
+        """ return a dict with the number of hits, misses and evictions """
+        return dict(self.counts)
+
+    def etag(self, bucket, name):
+        """ return the etag of the cached copy of an object or None """
+        with self.lock:
+            row = self.conn.execute('SELECT etag FROM objects WHERE bucket = ? '
+                'AND name = ?', (bucket, name)).fetchone()
+        return row[0] if row else None
+
+    def read(self, etag):
+        """ return the cached content for etag or None if it was evicted """
+        import time
+        with self.lock:
+            try:
+                with open(self._path(etag), 'rb') as f:
+                    content = f.read()
+            except OSError:
+                return None
+            with self.conn:
+                self.conn.execute('UPDATE files SET atime = ? WHERE '
+                    'etag = ?', (time.time(), etag))
+            self.counts['hits'] += 1
+        return content
+
+    def put(self, bucket, name, etag, content):
+        """ add an object to the cache and evict old files if needed """
+        import time, tempfile
+        with self.lock:
+            self.counts['misses'] += 1
+            if not etag or len(content) > self.maxsize:
+                return
+            path = self._path(etag)
+            fd, tmp = tempfile.mkstemp(dir=self.folder)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp, path)
+            with self.conn:
+                self.conn.execute('INSERT OR REPLACE INTO objects VALUES '
+                    '(?, ?, ?)', (bucket, name, etag))
+                self.conn.execute('INSERT OR REPLACE INTO files VALUES '
+                    '(?, ?, ?)', (etag, len(content), time.time()))
+            self._evict()
+
+    def _evict(self):
+        total = self.conn.execute('SELECT SUM(size) FROM files').fetchone()[0]
+        if total <= self.maxsize:
+            return
+        for etag, size in self.conn.execute('SELECT etag, size FROM files '
+                'ORDER BY atime').fetchall():
+            with self.conn:
+                self.conn.execute('DELETE FROM files WHERE etag = ?', (etag,))
+                self.conn.execute('DELETE FROM objects WHERE etag = ?', (etag,))
+            try:
+                os.remove(self._path(etag))
+            except OSError:
+                pass
+            self.counts['evictions'] += 1
+            total -= size
+            if total <= self.maxsize:
+                break
+
+    def _path(self, etag):
+        return os.path.join(self.folder, etag.strip('"'))
+
+
+class _tokencache:
+    """
+    Swift auth token and storage url shared by all processes of a user 
+    through the token files in ~/.swift that Swift Commander uses too. 
+    A cached token is reused for 'lifetime' seconds after the token file 
+    was written. Refreshing holds an exclusive lock on a lock file so 
+    that of many jobs starting at once only one authenticates and the 
+    others reuse its token.
+    """
+
+    def __init__(self, authurl, tenant, lifetime, folder=None):
+        import urllib.parse
+        self.folder = os.path.expanduser(folder or os.path.join('~', '.swift'))
+        host = urllib.parse.urlparse(authurl).netloc
+        self.tokenfile = os.path.join(self.folder, 'auth_token_%s_v2_%s' % (host, tenant))
+        self.urlfile = os.path.join(self.folder, 'storageurl_%s_v2_%s' % (host, tenant))
+        self.lifetime = lifetime
+
+    def read(self, maxage=None):
+        """ return the cached (storage url, token) or ('', '') """
+        import time
+        try:
+            if maxage is not None and \
+                    time.time() - os.path.getmtime(self.tokenfile) > maxage:
+                return '', ''
+            with open(self.tokenfile, 'r') as f:
+                token = f.readline().strip()
+            with open(self.urlfile, 'r') as f:
+                url = f.readline().strip()
+        except OSError:
+            return '', ''
+        return url, token
+
+    def get(self, authenticate, stale=None):
+        """ 
+        return (storage url, token), the cached token unless it expired or
+        is the stale token that was rejected, otherwise the result of 
+        authenticate() which is written to the cache
+        """
+        url, token = self.read(self.lifetime)
+        if token and token != stale:
+            return url, token
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder, exist_ok=True)
+        with open(self.tokenfile + '.lock', 'a') as lock:
+            self._lock(lock)
+            # another process may have refreshed the token while we waited
+            url, token = self.read(self.lifetime)
+            if token and token != stale:
+                return url, token
+            url, token = authenticate()
+            self._write(self.urlfile, url)
+            # the token file is written last, its mtime is the token age
+            self._write(self.tokenfile, token)
+        return url, token
+
+    def _lock(self, f):
+        """ 
+        wait for an exclusive lock on an open file, it is released when 
+        the file is closed. There is no locking on windows. 
+        """
+        try:
+            import fcntl
+        except ImportError:
+            return
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+    def _write(self, path, value):
+        """ atomically replace a file that only the user can read """
+        tmp = '%s.%s.tmp' % (path, os.getpid())
+        with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 
+                0o600), 'w') as f:
+            f.write(value)
+        os.replace(tmp, path)
+
+
+class _metaindex:
+    """
+    Local sqlite index of custom object metadata keyed by bucket and 
+    object name. Each entry stores the etag and last_modified date of 
+    the object at the time the metadata was read so that a container 
+    listing can tell which entries are still current.
+    """
+
+    def __init__(self, dbfile):
+        import sqlite3, threading
+        dbfile = os.path.expanduser(dbfile)
+        folder = os.path.dirname(dbfile)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        # many jobs may share one index, wait for locks instead of failing
+        self.conn = sqlite3.connect(dbfile, timeout=60, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.conn:
+            self.conn.execute('CREATE TABLE IF NOT EXISTS objmeta ('
+                'bucket TEXT, name TEXT, etag TEXT, last_modified TEXT, '
+                'meta TEXT, PRIMARY KEY (bucket, name))')
+
+    def get(self, bucket, prefix=None):
+        """ 
+        return {name: (etag, last_modified, metadict)} for all indexed 
+        objects in bucket that start with prefix
+        """
+        import json
+        prefix = prefix or ''
+        with self.lock:
+            rows = self.conn.execute('SELECT name, etag, last_modified, meta '
+                'FROM objmeta WHERE bucket = ? AND substr(name, 1, ?) = ?',
+                (bucket, len(prefix), prefix)).fetchall()
+        return {name: (etag, modified, json.loads(meta)) 
+            for name, etag, modified, meta in rows}
+
+    def put(self, bucket, rows):
+        """ add or replace a list of (name, etag, last_modified, metadict) """
+        import json
+        if not rows:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO objmeta '
+                'VALUES (?, ?, ?, ?, ?)', [(bucket, name, etag, modified, 
+                json.dumps(meta)) for name, etag, modified, meta in rows])
+
+    def prune(self, bucket, prefix, names):
+        """ remove entries under prefix that are not in the list of names """
+        prefix = prefix or ''
+        with self.lock:
+            cur = self.conn.execute('SELECT name FROM objmeta WHERE bucket = ? '
+                'AND substr(name, 1, ?) = ?', (bucket, len(prefix), prefix))
+            gone = set(name for (name,) in cur).difference(names)
+        if not gone:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany('DELETE FROM objmeta WHERE bucket = ? '
+                'AND name = ?', [(bucket, name) for name in gone])
+
+
+class s3(_objstore):
+    """
+    Initialize an s3 bucket using a certain profile
     Data will be written to the root of the bucket unless the virtual dir
-    prefix is set.The prefix can be a single virtual folder such as 
-    'subfolder' or a virtual folder such as 'folder/subfolder/subfolder'.     
+    prefix is set.The prefix can be a single virtual folder such as
+    'subfolder' or a virtual folder such as 'folder/subfolder/subfolder'.
     Example:
-        mystor = sci.store.google('the-bucket', 'virtual/dir', 'profile') 
+        mystor = sci.store.s3('the-bucket', 'virtual/dir', 'profile')
         my_objects = mystor.bucket_list()
+    -------------------------
+    Credentials are read from the profile in ~/.aws/credentials or the
+    usual AWS environment variables. Requires the boto3 package.
     """
 
-    def __init__(self, bucket, prefix=None, profile='default'):
-        """ 
+    def __init__(self, bucket, prefix=None, profile='default',
+            endpoint_url=None, part_size=67108864, workers=8,
+            metaindex=None, cache=None, cache_size=10737418240, retry=None):
+        """
         Examples:
         mystor = s3('the-bucket', 'virtual/sub/directory')
+        mystor = s3('the-bucket', endpoint_url='http://localhost:9000')
+        -------------------------
+        endpoint_url can point to other s3 compatible services such
+        as MinIO. Objects larger than part_size are transferred as
+        multipart uploads/ranged downloads using 'workers' parallel
+        requests per object. A single client (and its connection pool)
+        is shared by all methods and threads. metaindex, cache and retry
+        work as described in swift().
         """
-        self.s3conn = "s3"
+        import boto3, botocore.config, boto3.s3.transfer
+
+        if retry:
+            self.retry = retry
+        session = boto3.session.Session()
+        if profile != 'default' or 'default' in session.available_profiles:
+            session = boto3.session.Session(profile_name=profile)
+        # requests are retried by the retry policy instead of botocore
+        self.s3conn = session.client('s3', endpoint_url=endpoint_url,
+            config=botocore.config.Config(max_pool_connections=max(workers*2, 10),
+                retries={'total_max_attempts': 1},
+                connect_timeout=self.retry.request_timeout,
+                read_timeout=self.retry.request_timeout))
+        self.transfer = boto3.s3.transfer.TransferConfig(
+            multipart_threshold=part_size, multipart_chunksize=part_size,
+            max_concurrency=workers, use_threads=True)
         self.bucket = bucket
         self.prefix = prefix
+        self.part_size = part_size
+        self.workers = workers
+        self._index_setup(metaindex, cache, cache_size)
 
-    def bucket_list(self, filter=None):
-        """
-        return a list of objects from the previously initialized bucket. 
-        This list can be a filtered list by passing in a dictionary of
-        key / value pairs as filter. 
+    def bucket_iter(self, prefix=None, delimiter=None, page_size=1000):
+        if self.bucket == None:
+            return
+
+        if prefix is None:
+            prefix = self.prefix
+        args = {'Bucket': self.bucket, 'MaxKeys': page_size}
+        if prefix:
+            args['Prefix'] = prefix
+        if delimiter:
+            args['Delimiter'] = delimiter
+        while True:
+            page = self._call('list', self.s3conn.list_objects_v2, **args)
+            for item in page.get('CommonPrefixes', []):
+                yield {'subdir': item['Prefix']}
+            for item in page.get('Contents', []):
+                name = item['Key']
+                if not name.endswith('/') and \
+                    not name.startswith('.') and not '/.' in name:
+                        yield {'name': name, 'size': item['Size'],
+                            'etag': item['ETag'].strip('"'),
+                            'last_modified': item['LastModified'].isoformat(),
+                            'content_type': None}
+            if not page.get('IsTruncated'):
+                return
+            args['ContinuationToken'] = page['NextContinuationToken']
 
+    def object_put(self, objname, content, metadict=None):
+        """
+        save object to bucket under prefix and optionally set metadata dict.
         Example:
-        my_filtered_objects = mystor.bucket_list({'proj': 'ABC', 'tag': 'new'})
+        mystor.object_put('myobj.dat', x, {'key': 'val', 'a': 'b'})
+        -------------------------
+        content larger than part_size is uploaded in parallel parts
         """
-
         if self.bucket == None:
-            return []
-
+            return None
+        objname = self._fix_object_path([objname])[0]
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        if isinstance(content, (bytes, bytearray)) and len(content) <= self.part_size:
+            resp = self._call('put', self.s3conn.put_object, Bucket=self.bucket,
+                Key=objname, Body=content, Metadata=metadict or {})
+            self._metric('put', 'bytes', len(content))
+            return resp
+        if isinstance(content, (bytes, bytearray)):
+            # each attempt reads the content from the start
+            resp = self._call('put', lambda: self.s3conn.upload_fileobj(
+                io.BytesIO(content), self.bucket, objname,
+                ExtraArgs={'Metadata': metadict or {}}, Config=self.transfer))
+            self._metric('put', 'bytes', len(content))
+            return resp
+        # a stream that was partly sent cannot be sent again
+        return self._call('put', self.s3conn.upload_fileobj, content,
+            self.bucket, objname, ExtraArgs={'Metadata': metadict or {}},
+            Config=self.transfer, idempotent=False)
+
+    def _get(self, objname, etag=None):
+        import botocore.exceptions
+        args = {'Bucket': self.bucket, 'Key': objname}
+        if etag:
+            args['IfNoneMatch'] = etag
         try:
-            listing = self.s3conn.get_container(self.bucket,
-                                           prefix=self.prefix,
-                                           full_listing=True)
-        except:
-            return []
+            resp = self.s3conn.get_object(**args)
+        except botocore.exceptions.ClientError as e:
+            if not etag or e.response['Error']['Code'] not in ('304', 'NotModified'):
+                raise
+            return etag, None
+        return resp['ETag'], resp['Body'].read()
+
+    def _get_stream(self, objname, chunk_size):
+        body = self.s3conn.get_object(Bucket=self.bucket, Key=objname)['Body']
+        try:
+            for chunk in body.iter_chunks(chunk_size):
+                yield chunk
+        finally:
+            body.close()
 
-        newlist=[]
-        for item in listing[1]:
-            if item['content_type'] != 'application/directory' and \
-                not item['name'].startswith('.') and not '/.' in item['name']:
-                    if not filter:
-                        newlist.append(item["name"])
-                    else:
-                        meta = self.object_meta_get(item['name'])
-                        # is filter a full subset of meta
-                        if filter.items() <= meta.items():
-                            newlist.append(item["name"])
+    def _get_range(self, objname, start, end):
+        if start < 0 and end is not None:
+            start = max(self._size(objname) + start, 0)
+        return self.s3conn.get_object(Bucket=self.bucket, Key=objname,
+            Range=_range_header(start, end))['Body'].read()
 
-        #return [item["name"] for item in listing[1]]
-        return newlist
+    def _size(self, objname):
+        return self.s3conn.head_object(Bucket=self.bucket,
+            Key=objname)['ContentLength']
 
-    def object_get(self, objname):
-        """ load the object into memory """
-        if self.bucket == None:
-            return None
-        raw = self.swiftconn.get_object(self.bucket, objname)[1]
-        return raw 
-        #raw = lzma.decompress(compressed)
-        #data = json.loads(raw.decode("utf-8"))
-        # do something with the data ...
-
-    def object_get_json(self, objname):
-        """ load object into memory and de-serialize json """
-        raw = self.object_get(objname)
-        return json.loads(raw.decode()) #json.loads(raw.decode("utf-8"))
-
-    def object_get_csv(self, objname):
-        """ load object into memory and convert to csv """
-        raw = self.object_get(objname)
-        return json.loads(raw.decode()) #json.loads(raw.decode("utf-8"))
+    def _meta_get(self, objname):
+        return self.s3conn.head_object(Bucket=self.bucket, Key=objname)['Metadata']
 
-    def object_meta_get(self, objname):
-        """ retrieve custom metadata from object as a dictionary """
+    def _meta_set(self, objname, metadict):
+        """
+        s3 cannot change metadata in place, the object is copied onto
+        itself (in parallel parts for large objects) with the new metadata
+        """
+        head = self.s3conn.head_object(Bucket=self.bucket, Key=objname)
+        extra = {'Metadata': metadict, 'MetadataDirective': 'REPLACE'}
+        if head.get('ContentType'):
+            extra['ContentType'] = head['ContentType']
+        return self.s3conn.copy({'Bucket': self.bucket, 'Key': objname},
+            self.bucket, objname, ExtraArgs=extra, Config=self.transfer)
+
+    def _writer(self, objname, metadict, part_size, workers):
+        """ parts of a multipart upload, part_size must be at least 5MB """
+        return _s3writer(self, objname, metadict, part_size, workers)
+
+    def _download_file(self, objname, path):
+        """ download via a '.part' file, path is only replaced when complete """
+        tmp = path + '.part'
+        self.s3conn.download_file(self.bucket, objname, tmp,
+            Config=self.transfer)
+        os.replace(tmp, path)
+
+    def _upload_file(self, path, objname, metadict):
+        self.s3conn.upload_file(path, self.bucket, objname,
+            ExtraArgs={'Metadata': metadict}, Config=self.transfer)
+
+    def _sync_kind(self):
+        return 's3-%d' % self.part_size
+
+    def _sync_etags(self, path):
+        """
+        md5 and the etag of a multipart upload in parts of part_size,
+        the md5 of the concatenated binary part md5s and the part count
+        """
+        import hashlib
+        md5, parts = _file_segments(path, self.part_size)
+        multipart = hashlib.md5(b''.join(p.digest() for p in parts))
+        return [md5.hexdigest(), '%s-%d' % (multipart.hexdigest(), len(parts))]
+
+
+class google(_objstore):
+    """
+    Initialize a Google cloud bucket using a certain profile
+    Data will be written to the root of the bucket unless the virtual dir
+    prefix is set.The prefix can be a single virtual folder such as
+    'subfolder' or a virtual folder such as 'folder/subfolder/subfolder'.
+    Example:
+        mystor = sci.store.google('the-bucket', 'virtual/dir', 'profile')
+        my_objects = mystor.bucket_list()
+    -------------------------
+    Requires the google-cloud-storage package. Set STORAGE_EMULATOR_HOST
+    to use a local emulator such as fake-gcs-server.
+    """
+
+    def __init__(self, bucket, prefix=None, profile='default',
+            part_size=33554432, workers=8, metaindex=None, cache=None,
+            cache_size=10737418240, retry=None):
+        """
+        Examples:
+        mystor = google('the-bucket', 'virtual/sub/directory')
+        mystor = google('the-bucket', profile='~/keys/service-account.json')
+        -------------------------
+        profile is either 'default' (application default credentials),
+        a service account key file or the name of a project. Objects
+        larger than part_size are uploaded as parallel composite uploads
+        and downloaded in parallel slices using 'workers' requests.
+        A single client is shared by all methods and threads.
+        metaindex, cache and retry work as described in swift(), the 
+        client library additionally retries some requests on its own.
+        """
+        from google.cloud import storage
+
+        if retry:
+            self.retry = retry
+        keyfile = os.path.expanduser(profile)
+        if profile != 'default' and os.path.isfile(keyfile):
+            self.gsconn = storage.Client.from_service_account_json(keyfile)
+        elif profile != 'default':
+            self.gsconn = storage.Client(project=profile)
+        else:
+            self.gsconn = storage.Client()
+        self.gsbucket = self.gsconn.bucket(bucket)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+        self.workers = workers
+        self._index_setup(metaindex, cache, cache_size)
+
+    def bucket_iter(self, prefix=None, delimiter=None, page_size=1000):
         if self.bucket == None:
-            return None
-        head = self.s3conn.head_object(self.bucket,objname)
- 
-    def object_meta_set(self, objname, metadict):
-        """ set custom metadata on existing object using a dictionary """
+            return
+
+        if prefix is None:
+            prefix = self.prefix
+
+        def _page(token):
+            blobs = self.gsconn.list_blobs(self.bucket, prefix=prefix,
+                delimiter=delimiter, page_size=page_size, page_token=token)
+            return next(blobs.pages, []), blobs.next_page_token
+
+        token = None
+        while True:
+            # a failed page is requested again with the same page token
+            page, token = self._call('list', _page, token)
+            for subdir in sorted(page.prefixes):
+                yield {'subdir': subdir}
+            for blob in page:
+                name = blob.name
+                if not name.endswith('/') and \
+                    not name.startswith('.') and not '/.' in name:
+                        yield {'name': name, 'size': blob.size,
+                            'etag': blob.etag,
+                            'last_modified': blob.updated.isoformat(),
+                            'content_type': blob.content_type,
+                            'md5': blob.md5_hash, 'crc32c': blob.crc32c}
+            if not token:
+                return
+
+    def _blob(self, objname):
+        """ return a blob with its properties loaded """
+        blob = self.gsbucket.blob(objname)
+        blob.reload()
+        return blob
+
+    def _get(self, objname, etag=None):
+        """ large objects are downloaded in parallel slices """
+        import concurrent.futures
+        blob = self._blob(objname)
+        if etag and blob.etag == etag:
+            return etag, None
+        if blob.size <= self.part_size:
+            return blob.etag, blob.download_as_bytes(
+                if_generation_match=blob.generation)
+
+        def _slice(start):
+            return blob.download_as_bytes(start=start,
+                end=min(start + self.part_size, blob.size) - 1,
+                if_generation_match=blob.generation)
+
+        starts = range(0, blob.size, self.part_size)
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as pool:
+            return blob.etag, b''.join(pool.map(_slice, starts))
+
+    def _get_stream(self, objname, chunk_size):
+        with self.gsbucket.blob(objname).open('rb', chunk_size=chunk_size) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def _get_range(self, objname, start, end):
+        blob = self.gsbucket.blob(objname)
+        if start < 0:
+            blob.reload()
+            start = max(blob.size + start, 0)
+        return blob.download_as_bytes(start=start,
+            end=None if end is None else end - 1)
+
+    def _size(self, objname):
+        return self._blob(objname).size
+
+    def _meta_get(self, objname):
+        return self._blob(objname).metadata or {}
+
+    def _meta_set(self, objname, metadict):
+        blob = self._blob(objname)
+        # keys set to None are removed by a patch request
+        meta = {k: None for k in (blob.metadata or {})}
+        meta.update(metadict)
+        blob.metadata = meta
+        blob.patch()
+        return blob.metadata
+
+    def _writer(self, objname, metadict, part_size, workers):
+        """
+        parts are uploaded as temporary objects that are composed into
+        the final object and removed on close
+        """
+        return _gswriter(self, objname, metadict, part_size, workers)
+
+    def _download_file(self, objname, path):
+        """
+        large objects are downloaded in parallel slices, all via a '.part'
+        file that replaces path when it is complete
+        """
+        from google.cloud.storage import transfer_manager
+        blob = self._blob(objname)
+        tmp = path + '.part'
+        if blob.size > self.part_size:
+            transfer_manager.download_chunks_concurrently(blob, tmp,
+                chunk_size=self.part_size, worker_type='thread',
+                max_workers=self.workers)
+        else:
+            blob.download_to_filename(tmp)
+        os.replace(tmp, path)
 
+    def _sync_kind(self):
+        return 'google'
+
+    def _sync_etags(self, path):
+        """
+        base64 md5 and crc32c like md5Hash and crc32c of google, composed
+        objects only have a crc32c
+        """
+        import base64, hashlib, google_crc32c
+        md5 = hashlib.md5()
+        crc = google_crc32c.Checksum()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1048576), b''):
+                md5.update(chunk)
+                crc.update(chunk)
+        return ['md5:' + base64.b64encode(md5.digest()).decode(),
+                'crc32c:' + base64.b64encode(crc.digest()).decode()]
+
+    def _sync_remote(self, item):
+        return ['%s:%s' % (k, item[k]) for k in ('md5', 'crc32c') 
+            if item.get(k)]
+
+
+class azure(_objstore):
+    """
+    Initialize an Azure blob container using a certain profile
+    Data will be written to the root of the bucket unless the virtual dir
+    prefix is set.The prefix can be a single virtual folder such as
+    'subfolder' or a virtual folder such as 'folder/subfolder/subfolder'.
+    Example:
+        mystor = sci.store.azure('the-bucket', 'virtual/dir', 'profile')
+        my_objects = mystor.bucket_list()
+    -------------------------
+    Requires the azure-storage-blob package.
+    """
+
+    def __init__(self, bucket, prefix=None, profile='default',
+            part_size=8388608, workers=8, metaindex=None, cache=None,
+            cache_size=10737418240, retry=None):
+        """
+        Examples:
+        mystor = azure('the-container', 'virtual/sub/directory')
+        -------------------------
+        The storage account connection string is read from the
+        environment variable AZURE_STORAGE_CONNECTION_STRING or, for other
+        profiles, from AZURE_STORAGE_CONNECTION_STRING_<PROFILE>. Use
+        'UseDevelopmentStorage=true' for the Azurite emulator. Blobs
+        larger than part_size are uploaded as blocks and downloaded
+        in slices using 'workers' parallel requests. A single client
+        is shared by all methods and threads. metaindex, cache and retry
+        work as described in swift().
+        """
+        from azure.storage.blob import BlobServiceClient
+
+        if retry:
+            self.retry = retry
+        envvar = 'AZURE_STORAGE_CONNECTION_STRING'
+        if profile != 'default':
+            envvar = '%s_%s' % (envvar, profile.upper())
+        connstr = os.getenv(envvar, "")
+        if not connstr:
+            print("Please set environment variable %s" % envvar)
+        self.azconn = BlobServiceClient.from_connection_string(connstr,
+            max_single_put_size=part_size, max_block_size=part_size,
+            max_single_get_size=part_size, max_chunk_get_size=part_size,
+            retry_total=0, connection_timeout=self.retry.request_timeout,
+            read_timeout=self.retry.request_timeout)
+        self.container = self.azconn.get_container_client(bucket)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+        self.workers = workers
+        self._index_setup(metaindex, cache, cache_size)
+
+    def bucket_iter(self, prefix=None, delimiter=None, page_size=1000):
         if self.bucket == None:
-            return None
+            return
 
-        ret = self.s3conn.post_object(self.bucket, "%s/%s" % (self.prefix,objname))        
+        if prefix is None:
+            prefix = self.prefix
+        if delimiter:
+            blobs = self.container.walk_blobs(name_starts_with=prefix,
+                delimiter=delimiter, results_per_page=page_size)
+        else:
+            blobs = self.container.list_blobs(name_starts_with=prefix,
+                results_per_page=page_size)
+
+        def _page(token):
+            pages = blobs.by_page(continuation_token=token)
+            return list(next(pages, [])), pages.continuation_token
+
+        token = None
+        while True:
+            # a failed page is requested again with the same token
+            page, token = self._call('list', _page, token)
+            for blob in page:
+                name = blob.name
+                if not hasattr(blob, 'size'):
+                    yield {'subdir': name}
+                elif not name.endswith('/') and \
+                    not name.startswith('.') and not '/.' in name:
+                        yield {'name': name, 'size': blob.size,
+                            'etag': blob.etag.strip('"'),
+                            'last_modified': blob.last_modified.isoformat(),
+                            'content_type': blob.content_settings.content_type,
+                            'md5': _b64(blob.content_settings.content_md5)}
+            if not token:
+                return
 
     def object_put(self, objname, content, metadict=None):
-        """ save object to bucket and optionally set metadata using a dict """
-
+        """
+        save object to bucket under prefix and optionally set metadata dict.
+        Example:
+        mystor.object_put('myobj.dat', x, {'key': 'val', 'a': 'b'})
+        -------------------------
+        content larger than part_size is uploaded as blocks in parallel
+        """
         if self.bucket == None:
             return None
+        objname = self._fix_object_path([objname])[0]
+        # a stream that was partly sent cannot be sent again
+        resp = self._call('put', self.container.upload_blob, objname, content,
+            overwrite=True, metadata=self._fix_metadict(metadict),
+            max_concurrency=self.workers,
+            idempotent=isinstance(content, (bytes, bytearray, str)))
+        if isinstance(content, (bytes, bytearray, str)):
+            self._metric('put', 'bytes', len(content))
+        return resp
 
-        ret = self.s3conn.put_object(self.bucket, "%s/%s" % (self.prefix,objname), content, \
-            response_dict=resp, headers=metadict)
+    def _get(self, objname, etag=None):
+        """ large blobs are downloaded in parallel slices """
+        from azure.core import MatchConditions
+        from azure.core.exceptions import ResourceNotModifiedError
+        try:
+            if etag:
+                download = self.container.download_blob(objname, etag=etag,
+                    match_condition=MatchConditions.IfModified,
+                    max_concurrency=self.workers)
+            else:
+                download = self.container.download_blob(objname,
+                    max_concurrency=self.workers)
+        except ResourceNotModifiedError:
+            return etag, None
+        return download.properties.etag, download.readall()
 
-    def _object_ext(self, name):
-        """ get the object extention (like content type) """
-        ext = name.split(".")[-1]
-        if ext == name:
-            return ""
-        return ext
+    def _get_stream(self, objname, chunk_size):
+        """
+        the blob is read in ranges of chunk_size bytes, the later ranges
+        only while its etag is the one of the first range
+        """
+        from azure.core import MatchConditions
+        download = self.container.download_blob(objname, offset=0,
+            length=chunk_size)
+        size = int(download.properties.content_range.rsplit('/', 1)[1])
+        etag = download.properties.etag
+        chunk = download.readall()
+        if chunk:
+            yield chunk
+        for offset in range(chunk_size, size, chunk_size):
+            yield self.container.download_blob(objname, offset=offset,
+                length=chunk_size, etag=etag,
+                match_condition=MatchConditions.IfNotModified).readall()
+
+    def _get_range(self, objname, start, end):
+        if start < 0:
+            start = max(self._size(objname) + start, 0)
+        length = None if end is None else end - start
+        return self.container.download_blob(objname, offset=start,
+            length=length).readall()
+
+    def _size(self, objname):
+        return self.container.get_blob_client(objname).get_blob_properties().size
+
+    def _meta_get(self, objname):
+        metadata = self.container.get_blob_client(objname).get_blob_properties().metadata
+        return self._unfix_metadict(metadata)
+
+    def _meta_set(self, objname, metadict):
+        return self.container.get_blob_client(objname).set_blob_metadata(
+            self._fix_metadict(metadict))
+
+    def _writer(self, objname, metadict, part_size, workers):
+        """ parts are staged as blocks and committed on close """
+        return _azwriter(self, objname, self._fix_metadict(metadict),
+            part_size, workers)
+
+    def _download_file(self, objname, path):
+        """ download via a '.part' file, path is only replaced when complete """
+        tmp = path + '.part'
+        with open(tmp, 'wb') as f:
+            self.container.download_blob(objname,
+                max_concurrency=self.workers).readinto(f)
+        os.replace(tmp, path)
+
+    def _upload_file(self, path, objname, metadict):
+        """
+        the md5 is set explicitly, azure only computes it for blobs that
+        are uploaded with a single request
+        """
+        from azure.storage.blob import ContentSettings
+        md5 = _file_segments(path, SEGMENT_SIZE)[0]
+        with open(path, 'rb') as f:
+            self.container.upload_blob(objname, f, overwrite=True,
+                metadata=self._fix_metadict(metadict),
+                content_settings=ContentSettings(
+                    content_md5=bytearray(md5.digest())),
+                max_concurrency=self.workers)
+
+    def _sync_kind(self):
+        return 'md5-base64'
+
+    def _sync_etags(self, path):
+        """ base64 md5 like the content md5 of a blob """
+        return [_b64(_file_segments(path, SEGMENT_SIZE)[0].digest())]
 
+    def _sync_remote(self, item):
+        return [item['md5']] if item.get('md5') else []
 
- 
-class azure:
+    def _fix_metadict(self, metadict):
+        """
+        azure metadata keys must be valid C# identifiers, '-' is stored
+        as '_2d' and '_' as '_5f' so that _unfix_metadict can restore
+        the original keys, e.g. 'uploaded-by' becomes 'uploaded_2dby'
+        """
+        import re
+        if not metadict:
+            return {}
+        return {re.sub('[-_]', lambda m: '_%02x' % ord(m.group()), k): v
+            for k, v in metadict.items()}
+
+    def _unfix_metadict(self, metadict):
+        """ the original keys of metadata set with _fix_metadict """
+        import re
+        return {re.sub('_(2d|5f)', lambda m: chr(int(m.group(1), 16)), k): v
+            for k, v in (metadict or {}).items()}
+
+
+class posix(_objstore):
     """
-    Initialize an s3 bucket using a certain profile
-    Data will be written to the root of the bucket unless the virtual dir
-    prefix is set.The prefix can be a single virtual folder such as 
-    'subfolder' or a virtual folder such as 'folder/subfolder/subfolder'.     
+    Initialize a folder on a posix file system (local disk, NFS, scratch)
+    Data will be written to the root of the folder unless the virtual dir
+    prefix is set.The prefix can be a single sub folder such as
+    'subfolder' or a path such as 'folder/subfolder/subfolder'.
     Example:
-        mystor = sci.store.azure('the-bucket', 'virtual/dir', 'profile') 
+        mystor = sci.store.posix('/fh/scratch/delete30/lab', 'virtual/dir')
         my_objects = mystor.bucket_list()
+    -------------------------
+    Objects are files below the folder, so code written for swift or s3
+    runs unchanged on local storage. Custom metadata is kept in json
+    files in the hidden folder .sci_meta and etags are derived from size
+    and modification time of a file (like web servers do) instead of
+    its content.
     """
 
-    def __init__(self, bucket, prefix=None, profile='default'):
-        """ 
+    def __init__(self, bucket, prefix=None, part_size=67108864, workers=8,
+            retry=None):
+        """
         Examples:
-        mystor = s3('the-bucket', 'virtual/sub/directory')
+        mystor = posix('~/scratch', 'virtual/sub/directory')
+        -------------------------
+        bucket is the root folder and is created if it does not exist.
+        Writers and uploads write parts of part_size bytes in parallel
+        into a hidden temporary file that is renamed when complete.
+        retry works as described in swift(), e.g. for timeouts of NFS.
         """
-        self.s3conn = "s3"
+        if retry:
+            self.retry = retry
         self.bucket = bucket
+        self.folder = os.path.abspath(os.path.expanduser(bucket))
         self.prefix = prefix
+        self.part_size = part_size
+        self.workers = workers
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
 
-    def bucket_list(self, filter=None):
+    def bucket_iter(self, prefix=None, delimiter=None, page_size=10000):
         """
-        return a list of objects from the previously initialized bucket. 
-        This list can be a filtered list by passing in a dictionary of
-        key / value pairs as filter. 
-
+        iterate over the files below the folder in object name order
         Example:
-        my_filtered_objects = mystor.bucket_list({'proj': 'ABC', 'tag': 'new'})
+        for item in mystor.bucket_iter():
+            print(item['name'], item['size'], item['etag'], item['last_modified'])
+        -------------------------
+        see _objstore.bucket_iter(), any delimiter is treated as '/' and
+        page_size is ignored.
         """
+        if self.bucket == None:
+            return
+
+        if prefix is None:
+            prefix = self.prefix
+        prefix = prefix or ''
+        start = prefix.rsplit('/', 1)[0] if '/' in prefix else ''
+        for item in self._walk(start, prefix, delimiter):
+            yield item
+
+    def _walk(self, rel, prefix, delimiter):
+        """ yield listing items below the sub folder rel """
+        import datetime, mimetypes
+        try:
+            entries = list(os.scandir(self._path(rel) if rel else self.folder))
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        # a folder 'a' sorts like the object names 'a/...' below it
+        entries.sort(key=lambda e: e.name + '/' if e.is_dir() else e.name)
+        for entry in entries:
+            if entry.name.startswith('.'):
+                continue
+            name = '%s/%s' % (rel, entry.name) if rel else entry.name
+            if entry.is_dir():
+                if (name + '/').startswith(prefix):
+                    if delimiter:
+                        yield {'subdir': name + '/'}
+                        continue
+                elif not prefix.startswith(name + '/'):
+                    continue
+                for item in self._walk(name, prefix, delimiter):
+                    yield item
+            elif name.startswith(prefix):
+                st = entry.stat()
+                yield {'name': name, 'size': st.st_size,
+                    'etag': _posix_etag(st),
+                    'last_modified': datetime.datetime.fromtimestamp(
+                        st.st_mtime, datetime.timezone.utc).isoformat(),
+                    'content_type': mimetypes.guess_type(name)[0]}
+
+    def _get(self, objname, etag=None):
+        with open(self._path(objname), 'rb') as f:
+            newetag = _posix_etag(os.fstat(f.fileno()))
+            if etag == newetag:
+                return etag, None
+            return newetag, f.read()
+
+    def _get_stream(self, objname, chunk_size):
+        with open(self._path(objname), 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def _get_range(self, objname, start, end):
+        with open(self._path(objname), 'rb') as f:
+            start, end, step = slice(start, end).indices(os.fstat(f.fileno()).st_size)
+            f.seek(start)
+            return f.read(max(end - start, 0))
+
+    def _size(self, objname):
+        return os.path.getsize(self._path(objname))
+
+    def _meta_get(self, objname):
+        import json
+        if not os.path.exists(self._path(objname)):
+            raise FileNotFoundError(objname)
+        try:
+            with open(self._metapath(objname), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _meta_set(self, objname, metadict):
+        if not os.path.exists(self._path(objname)):
+            raise FileNotFoundError(objname)
+        self._meta_write(objname, metadict)
+        return metadict
+
+    def _writer(self, objname, metadict, part_size, workers):
+        """ parts are written at their offset into a temporary file """
+        return _posixwriter(self, objname, metadict, part_size, workers)
+
+    def _download_file(self, objname, path):
+        import shutil
+        shutil.copy2(self._path(objname), path + '.part')
+        os.replace(path + '.part', path)
+
+    def _upload_file(self, path, objname, metadict):
+        import shutil
+        tmp = self._tmppath(objname)
+        os.makedirs(os.path.dirname(tmp), exist_ok=True)
+        try:
+            shutil.copyfile(path, tmp)
+            # keep the modification time like downloads do, the etag
+            # of the object is then the one of the file (see sync_up)
+            st = os.stat(path)
+            os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+            os.replace(tmp, self._path(objname))
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self._meta_write(objname, metadict)
+
+    def _sync_kind(self):
+        return 'posix'
+
+    def _sync_etags(self, path):
+        """ size and modification time, there are no content checksums """
+        return [_posix_etag(os.stat(path))]
+
+    def _meta_write(self, objname, metadict):
+        """ store the metadata of a new or changed object """
+        import json
+        metapath = self._metapath(objname)
+        if not metadict:
+            if os.path.exists(metapath):
+                os.remove(metapath)
+            return
+        os.makedirs(os.path.dirname(metapath), exist_ok=True)
+        with open(metapath + '.tmp', 'w') as f:
+            json.dump(metadict, f)
+        os.replace(metapath + '.tmp', metapath)
+
+    def _path(self, objname):
+        """ file system path of an object """
+        parts = objname.split('/')
+        if '..' in parts:
+            raise ValueError('invalid object name: %s' % objname)
+        return os.path.join(self.folder, *parts)
+
+    def _metapath(self, objname):
+        return os.path.join(self.folder, '.sci_meta', *objname.split('/')) + '.json'
+
+    def _tmppath(self, objname):
+        """ hidden temporary file next to the object, skipped by listings """
+        import uuid
+        path = self._path(objname)
+        return os.path.join(os.path.dirname(path), '.%s.%s.part' % (
+            os.path.basename(path), uuid.uuid4().hex))
+
+
+class memory(_objstore):
+    """
+    Initialize a bucket that keeps all objects in memory
+    Data will be written to the root of the bucket unless the virtual dir
+    prefix is set.The prefix can be a single virtual folder such as
+    'subfolder' or a virtual folder such as 'folder/subfolder/subfolder'.
+    Example:
+        mystor = sci.store.memory('scratch', 'virtual/dir')
+        mystor.object_put_json('x.json', {'a': 1})
+    -------------------------
+    Objects live until the python process ends and are shared by all
+    memory stores with the same bucket name. Useful for tests and to
+    benchmark pipelines without network or disk i/o.
+    """
+
+    def __init__(self, bucket='memory', prefix=None, part_size=67108864,
+            workers=8, retry=None):
+        """
+        Examples:
+        mystor = memory()
+        mystor = memory('scratch', 'virtual/sub/directory')
+        """
+        if retry:
+            self.retry = retry
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = part_size
+        self.workers = workers
+        self.objects = _memory_buckets.setdefault(bucket, {})
 
+    def bucket_iter(self, prefix=None, delimiter=None, page_size=10000):
         if self.bucket == None:
-            return []
+            return
+
+        if prefix is None:
+            prefix = self.prefix
+        prefix = prefix or ''
+        subdir = None
+        for name, (content, etag, modified, meta) in sorted(self.objects.items()):
+            if not name.startswith(prefix) or name.endswith('/') or \
+                    name.startswith('.') or '/.' in name:
+                continue
+            i = name.find(delimiter, len(prefix)) if delimiter else -1
+            if i > -1:
+                if name[:i + len(delimiter)] != subdir:
+                    subdir = name[:i + len(delimiter)]
+                    yield {'subdir': subdir}
+                continue
+            yield {'name': name, 'size': len(content), 'etag': etag,
+                'last_modified': modified, 'content_type': None}
+
+    def _get(self, objname, etag=None):
+        content, newetag, modified, meta = self._entry(objname)
+        if etag == newetag:
+            return etag, None
+        return newetag, content
+
+    def _get_stream(self, objname, chunk_size):
+        content = self._entry(objname)[0]
+        for i in range(0, len(content), chunk_size):
+            yield content[i:i + chunk_size]
+
+    def _get_range(self, objname, start, end):
+        return self._entry(objname)[0][start:end]
+
+    def _size(self, objname):
+        return len(self._entry(objname)[0])
+
+    def _meta_get(self, objname):
+        return dict(self._entry(objname)[3])
+
+    def _meta_set(self, objname, metadict):
+        content, etag, modified, meta = self._entry(objname)
+        self.objects[objname] = (content, etag, modified, dict(metadict))
+        return metadict
+
+    def _writer(self, objname, metadict, part_size, workers):
+        """ parts are joined on close """
+        return _memwriter(self, objname, metadict, part_size, workers)
+
+    def _entry(self, objname):
+        """ return (content, etag, last_modified, metadata) of an object """
+        try:
+            return self.objects[objname]
+        except KeyError:
+            raise FileNotFoundError(objname)
 
+    def _store(self, objname, content, metadict):
+        """ add or replace an object """
+        import datetime, hashlib
+        etag = hashlib.md5(content).hexdigest()
+        modified = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.objects[objname] = (content, etag, modified, dict(metadict))
+        return {'etag': etag}
+
+
+def copy(src, dst, objnames, workers=4, part_workers=2):
+    """
+    Copy objects from one store to another without a local copy
+    Example:
+    archive = sci.store.swift('archive', 'lab/2019')
+    cloud = sci.store.s3('lab-archive')
+    copied = sci.store.copy(archive, cloud, 'lab/2019/', workers=16)
+    -------------------------
+    objnames is a list of object names (the prefix of src is prepended
+    as usual) or a string, then all objects in src whose name starts 
+    with it are copied. Objects keep their name and custom metadata.
+    Each object is streamed from src into an object writer of dst, so 
+    a transfer holds at most (part_workers + 1) * part_size of dst in 
+    memory and 'workers' objects are copied in parallel. The number of 
+    bytes copied and the throughput are printed when done.
+    returns a list of copied objects
+    """
+    import concurrent.futures, time
+
+    if isinstance(objnames, str):
+        objnames = [item['name'] for item in src.bucket_iter(objnames) 
+            if 'name' in item]
+    else:
+        objnames = src._fix_object_path(objnames)
+
+    def _copy(objname):
         try:
-            listing = self.s3conn.get_container(self.bucket,
-                                           prefix=self.prefix,
-                                           full_listing=True)
-        except:
-            return []
+            size = 0
+            meta = src._call('meta', src._meta_get, objname)
+            with dst._writer(objname, meta, dst.part_size, part_workers) as w:
+                for chunk in src._stream(objname, 1048576):
+                    w.write(chunk)
+                    size += len(chunk)
+            print("object '%s' copied." % objname)
+            return objname, size
+        except Exception as e:
+            print("object '%s' copy failed" % objname)
+            print("  Error: '%s'" % e)
+
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max(workers, 1)) as pool:
+        copied = [c for c in pool.map(_copy, objnames) if c]
+    seconds = max(time.time() - start, 0.001)
+    total = sum(size for objname, size in copied)
+    print("%s of %s objects, %s bytes copied in %.1f s (%.1f MB/s)" % (
+        len(copied), len(objnames), total, seconds, total / seconds / 1048576))
+    return [objname for objname, size in copied]
+
+
+class aio:
+    """
+    asyncio interface to a store, for services that keep thousands of
+    requests in flight in a single process
+    Example:
+    astor = sci.store.aio(sci.store.swift('the-bucket', 'virtual/dir'))
+    async def main():
+        async with astor:
+            async for item in astor.bucket_iter():
+                print(item['name'])
+            contents = await astor.object_get_many(['a.json', 'b.json'])
+            await astor.object_put_json('c.json', {'a': 1})
+    asyncio.run(main())
+    -------------------------
+    The methods have the same names and arguments as those of the store
+    and use its configuration (bucket, prefix, retry policy, metrics,
+    cache). At most 'concurrency' requests run at the same time, the 
+    *_many methods start one request per object and wait for all of 
+    them. With aiohttp installed (pip install sci[aio]) the requests of 
+    swift stores are sent by a single asyncio http client, otherwise and
+    for all other stores the blocking methods run in a pool of 'workers'
+    threads.
+    """
 
-        newlist=[]
-        for item in listing[1]:
-            if item['content_type'] != 'application/directory' and \
-                not item['name'].startswith('.') and not '/.' in item['name']:
-                    if not filter:
-                        newlist.append(item["name"])
-                    else:
-                        meta = self.object_meta_get(item['name'])
-                        # is filter a full subset of meta
-                        if filter.items() <= meta.items():
-                            newlist.append(item["name"])
+    def __init__(self, store, concurrency=256, workers=None):
+        """
+        Examples:
+        astor = aio(sci.store.posix('~/scratch'), concurrency=32)
+        """
+        import concurrent.futures
+        self.store = store
+        self.concurrency = concurrency
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            workers or min(concurrency, 32))
+        self.semaphore = None
+        self.native = None
+        if isinstance(store, swift):
+            try:
+                self.native = _swiftaio(store)
+            except ImportError:
+                pass
 
-        #return [item["name"] for item in listing[1]]
-        return newlist
+    async def __aenter__(self):
+        return self
 
-    def object_get(self, objname):
-        """ load the object into memory """
-        if self.bucket == None:
-            return None
-        raw = self.swiftconn.get_object(self.bucket, objname)[1]
-        return raw 
-        #raw = lzma.decompress(compressed)
-        #data = json.loads(raw.decode("utf-8"))
-        # do something with the data ...
-
-    def object_get_json(self, objname):
-        """ load object into memory and de-serialize json """
-        raw = self.object_get(objname)
-        return json.loads(raw.decode()) #json.loads(raw.decode("utf-8"))
-
-    def object_get_csv(self, objname):
-        """ load object into memory and convert to csv """
-        raw = self.object_get(objname)
-        return json.loads(raw.decode()) #json.loads(raw.decode("utf-8"))
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
 
-    def object_meta_get(self, objname):
-        """ retrieve custom metadata from object as a dictionary """
-        if self.bucket == None:
-            return None
-        head = self.s3conn.head_object(self.bucket,objname)
- 
-    def object_meta_set(self, objname, metadict):
-        """ set custom metadata on existing object using a dictionary """
+    async def close(self):
+        """
+        close the http client and the threads, the store stays open
+        Example:
+        await astor.close()
+        """
+        if self.native:
+            await self.native.close()
+        self.pool.shutdown(wait=False)
 
-        if self.bucket == None:
-            return None
+    async def bucket_iter(self, prefix=None, delimiter=None, page_size=10000):
+        """
+        iterate over the objects in the bucket page by page
+        Example:
+        async for item in astor.bucket_iter('virtual/dir/'):
+            print(item['name'], item['size'])
+        -------------------------
+        see _objstore.bucket_iter()
+        """
+        import itertools
+        if self.native:
+            if prefix is None:
+                prefix = self.store.prefix
+            marker = None
+            while True:
+                page = await self._native('list', self.native.list_page,
+                    prefix, delimiter, marker, page_size)
+                for item in self.store._listing_items(page):
+                    yield item
+                if len(page) < page_size:
+                    return
+                marker = page[-1].get('name', page[-1].get('subdir'))
+
+        items = iter(self.store.bucket_iter(prefix, delimiter, page_size))
+        while True:
+            page = await self._run(lambda: list(itertools.islice(items, page_size)))
+            for item in page:
+                yield item
+            if len(page) < page_size:
+                return
+
+    async def bucket_list(self, filter=None):
+        """ see _objstore.bucket_list() """
+        return await self._run(self.store.bucket_list, filter)
+
+    async def object_get(self, objname):
+        """
+        load object into memory
+        Example:
+        content = await astor.object_get('prefix/myobj.json')
+        """
+        if not self.native or self.store.cache:
+            return await self._run(self.store.object_get, objname)
+        objname = self.store._fix_object_path([objname])[0]
+        content = await self._native('get', self.native.get, objname)
+        self.store._metric('get', 'bytes', len(content))
+        return content
+
+    async def object_get_json(self, objname, codec=None):
+        """ load object and de-serialize json, see _objstore.object_get_json() """
+        import json
+        content = await self.object_get(objname)
+        # large documents are decoded without blocking the event loop
+        return await self._run(lambda: json.loads(
+            _decompress(objname, content, codec).decode('utf-8')))
 
-        ret = self.s3conn.post_object(self.bucket, "%s/%s" % (self.prefix,objname))        
+    async def object_get_many(self, objnames, return_exceptions=False):
+        """
+        load many objects concurrently
+        Example:
+        contents = await astor.object_get_many(['a.json', 'b.json'])
+        -------------------------
+        returns a list of contents in the same order as objnames. With 
+        return_exceptions=True the StoreError of a failed object is 
+        returned in its place instead of being raised.
+        """
+        return await self._gather(self.object_get, objnames, return_exceptions)
 
-    def object_put(self, objname, content, metadict=None):
-        """ save object to bucket and optionally set metadata using a dict """
+    async def object_meta_get(self, objname):
+        """ retrieve custom metadata of object as a dictionary """
+        if not self.native:
+            return await self._run(self.store.object_meta_get, objname)
+        objname = self.store._fix_object_path([objname])[0]
+        return await self._native('meta', self.native.meta_get, objname)
 
-        if self.bucket == None:
-            return None
+    async def object_meta_get_many(self, objnames, return_exceptions=False):
+        """ retrieve metadata of many objects, see object_get_many() """
+        return await self._gather(self.object_meta_get, objnames,
+            return_exceptions)
 
-        ret = self.s3conn.put_object(self.bucket, "%s/%s" % (self.prefix,objname), content, \
-            response_dict=resp, headers=metadict)
+    async def object_meta_set(self, objname, metadict):
+        """ see _objstore.object_meta_set() """
+        return await self._run(self.store.object_meta_set, objname, metadict)
 
-    def _object_ext(self, name):
-        """ get the object extention (like content type) """
-        ext = name.split(".")[-1]
-        if ext == name:
-            return ""
-        return ext
+    async def object_put(self, objname, content, metadict=None):
+        """
+        save object to bucket under prefix and optionally set metadata dict.
+        Example:
+        await astor.object_put('myobj.dat', x, {'key': 'val', 'a': 'b'})
+        -------------------------
+        content can be bytes, str or a binary file object, file objects
+        and objects too large for a single request are uploaded by the
+        store in a thread.
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        if not self.native or not isinstance(content, (bytes, bytearray)) or \
+                len(content) > self.store.part_size:
+            return await self._run(self.store.object_put, objname, content,
+                metadict)
+        objname = self.store._fix_object_path([objname])[0]
+        resp = await self._native('put', self.native.put, objname, content,
+            self.store._fix_metadict(metadict) or {})
+        self.store._metric('put', 'bytes', len(content))
+        return resp
+
+    async def object_put_json(self, objname, content, metadict=None,
+            indent=None):
+        """ 
+        save json object to bucket, see _objstore.object_put_json()
+        Compressed objects (*.gz, *.zst, *.lz4) are written by the store 
+        in a thread.
+        """
+        import json
+        if _codec(objname):
+            return await self._run(self.store.object_put_json, objname,
+                content, metadict, indent=indent)
+        content = json.dumps(content, indent=indent,
+            separators=None if indent else (',', ':'))
+        return await self.object_put(objname, content, metadict)
+
+    async def object_put_many(self, objects, metadict=None,
+            return_exceptions=False):
+        """
+        save many objects concurrently
+        Example:
+        await astor.object_put_many({'a.txt': b'A', 'b.txt': b'B'})
+        -------------------------
+        objects is a dictionary {objname: content}, all objects get the 
+        same metadata. returns the responses in the order of objects, see
+        object_get_many() for return_exceptions.
+        """
+        return await self._gather(lambda o: self.object_put(o, objects[o],
+            metadict), list(objects), return_exceptions)
+
+    async def _gather(self, method, objnames, return_exceptions):
+        """ await method(objname) for all objects, the semaphore limits them """
+        import asyncio
+        return await asyncio.gather(*[method(o) for o in objnames],
+            return_exceptions=return_exceptions)
+
+    async def _run(self, func, *args, **kwargs):
+        """ run a blocking function in the thread pool """
+        import asyncio, functools
+        async with self._limit():
+            return await asyncio.get_running_loop().run_in_executor(self.pool,
+                functools.partial(func, *args, **kwargs))
+
+    async def _native(self, op, func, *args, **kwargs):
+        """ await a request of the http client with the store's retry policy """
+        async with self._limit():
+            if self.store.metrics:
+                return await self.store.metrics.acall(self.store, op, func,
+                    *args, **kwargs)
+            return await self.store.retry.acall(op, func, *args, **kwargs)
+
+    def _limit(self):
+        """ 
+        semaphore of the running event loop, it is created on first use
+        because older python versions bind it to the loop
+        """
+        import asyncio
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.concurrency)
+        return self.semaphore
+
+
+class _swiftaio:
+    """ 
+    minimal asyncio client of the swift api used by aio, it shares the 
+    storage url and auth token of the swift store. Requires aiohttp.
+    """
+
+    def __init__(self, store):
+        import aiohttp
+        self.store = store
+        self.session = None
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def request(self, method, objname=None, params=None, headers=None,
+            data=None):
+        """ 
+        return (status, headers, body) of a request, a rejected token is renewed
+        once like swiftclient does
+        """
+        import aiohttp, asyncio, urllib.parse, swiftclient
+        if not self.session:
+            timeout = aiohttp.ClientTimeout(total=None,
+                sock_connect=self.store.retry.request_timeout,
+                sock_read=self.store.retry.request_timeout)
+            # the number of connections is limited by the semaphore of aio
+            self.session = aiohttp.ClientSession(timeout=timeout,
+                connector=aiohttp.TCPConnector(limit=0))
+        path = self.store.bucket
+        if objname:
+            path += '/' + objname
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        for renewed in (False, True):
+            url = '%s/%s' % (self.store.storageurl, urllib.parse.quote(path))
+            hdrs = dict(headers or {}, **{'X-Auth-Token': self.store.authtoken})
+            async with self.session.request(method, url, params=params,
+                    headers=hdrs, data=data) as resp:
+                body = await resp.read()
+                if resp.status == 401 and not renewed and \
+                        self.store.connargs.get('key'):
+                    await asyncio.get_running_loop().run_in_executor(None,
+                        self._renew, hdrs['X-Auth-Token'])
+                    continue
+                if resp.status >= 300:
+                    raise swiftclient.ClientException('%s %s failed' % (
+                        method, path), http_status=resp.status,
+                        http_reason=resp.reason, http_response_content=body)
+                return resp.status, {k.lower(): v for k, v in 
+                    resp.headers.items()}, body
+
+    def _renew(self, rejected):
+        """
+        get a new token through the token cache of the store, with the
+        swift connection of the executor thread that runs this
+        """
+        conn = self.store._thread_conn()
+        if self.store.tokens:
+            auth = conn.get_auth(stale=rejected)
+        else:
+            auth = conn.get_auth()
+        self.store.storageurl, self.store.authtoken = auth
+
+    async def list_page(self, prefix, delimiter, marker, limit):
+        import json
+        status, head, body = await self.request('GET', params={'format': 'json',
+            'prefix': prefix, 'delimiter': delimiter, 'marker': marker,
+            'limit': str(limit)})
+        return json.loads(body) if body else []
+
+    async def get(self, objname):
+        return (await self.request('GET', objname))[2]
+
+    async def meta_get(self, objname):
+        return self.store._head_meta((await self.request('HEAD', objname))[1])
+
+    async def put(self, objname, content, headers):
+        status, head, body = await self.request('PUT', objname,
+            headers=headers, data=bytes(content))
+        return {'status': status, 'headers': head}
@@ -74,6 +74,15 @@ setup(
         'python-swiftclient',
         'python-keystoneclient',
         ],
+    extras_require={
+        's3': ['boto3'],
+        'google': ['google-cloud-storage'],
+        'azure': ['azure-storage-blob'],
+        'zstd': ['zstandard'],
+        'lz4': ['lz4'],
+        'parquet': ['pyarrow'],
+        'aio': ['aiohttp'],
+        },
     cmdclass={'install': CustomInstall},
     #entry_points={
     #    # we use console_scripts here to allow virtualenv to rewrite shebangs
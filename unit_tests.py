@@ -1,5 +1,7 @@
 #!/usr/bin/env python3
 
+import os
+import threading
 import unittest
 from unittest.mock import Mock, patch
 
@@ -20,5 +22,1449 @@ class GetToolboxTestCase(unittest.TestCase):
         assert ret == '{"foo": "bar"}'
 
 
+class SwiftStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.stor = sci.store.swift.__new__(sci.store.swift)
+        self.stor.bucket = "bucket"
+        self.stor.prefix = "pre"
+        self.stor.metaindex = sci.store._metaindex(
+            self.tmpdir.name + "/metaindex.sqlite")
+        self.stor.swiftconn = Mock()
+        self.stor.connargs = {}
+        self.stor.workers = 1
+        self.stor.threadlocal = threading.local()
+        self.stor.threadconns = []
+        self.stor.threadlock = threading.Lock()
+        self.stor.swservice = None
+        self.stor.cache = None
+        self.stor.service_threads = {"segment_threads": 2}
+        self.stor.part_size = sci.store.SEGMENT_SIZE
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _listing(self, *items):
+        return ({}, [{"name": n, "hash": h, "last_modified": "2020",
+                      "bytes": 1, "content_type": "text/plain"}
+                     for n, h in items])
+
+    def test_bucket_list_filter_uses_index(self):
+        conn = self.stor.swiftconn
+        conn.head_object.side_effect = lambda b, o: {
+            "x-object-meta-tag": "new" if o == "pre/a" else "old"}
+        conn.get_container.return_value = self._listing(
+            ("pre/a", "1"), ("pre/b", "2"))
+        assert self.stor.bucket_list({"tag": "new"}) == ["pre/a"]
+        assert conn.head_object.call_count == 2
+
+        # only the object with a changed etag is retrieved again
+        conn.get_container.return_value = self._listing(
+            ("pre/a", "1"), ("pre/b", "3"))
+        assert self.stor.bucket_list({"tag": "old"}) == ["pre/b"]
+        assert conn.head_object.call_count == 3
+
+        # deleted objects are dropped from the index
+        conn.get_container.return_value = self._listing(("pre/b", "3"))
+        assert self.stor.bucket_list({"tag": "new"}) == []
+        assert list(self.stor.metaindex.get("bucket", "pre")) == ["pre/b"]
+
+    def test_metaindex_from_worker_thread(self):
+        import concurrent.futures
+        index = self.stor.metaindex
+        index.put("bucket", [("pre/a", "1", "2020", {"tag": "x"})])
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            futures = [pool.submit(index.get, "bucket", "pre") for i in range(8)]
+            futures.append(pool.submit(index.prune, "bucket", "pre", ["pre/a"]))
+            results = [f.result() for f in futures]
+        assert results[0] == {"pre/a": ("1", "2020", {"tag": "x"})}
+
+    def test_bucket_iter_pages(self):
+        pages = [[{"name": "pre/a", "hash": "1", "bytes": 1,
+                   "last_modified": "x", "content_type": "text/plain"},
+                  {"subdir": "pre/sub/"}], []]
+        self.stor.swiftconn.get_container.side_effect = \
+            lambda *a, **kw: ({}, pages.pop(0))
+        items = list(self.stor.bucket_iter(delimiter="/", page_size=2))
+        assert [i.get("name", i.get("subdir")) for i in items] == \
+            ["pre/a", "pre/sub/"]
+        markers = [c[1]["marker"] for c in
+                   self.stor.swiftconn.get_container.call_args_list]
+        assert markers == [None, "pre/sub/"]
+
+    def test_bucket_iter_in_worker_thread(self):
+        import concurrent.futures
+        conn = Mock()
+        conn.get_container.return_value = self._listing(("pre/a", "1"))
+        self.stor._connection = lambda **kwargs: conn
+        with concurrent.futures.ThreadPoolExecutor(1) as pool:
+            items = pool.submit(lambda: list(self.stor.bucket_iter())).result()
+        assert [i["name"] for i in items] == ["pre/a"]
+        self.stor.swiftconn.get_container.assert_not_called()
+
+    def test_object_meta_get_many_keeps_order(self):
+        import time
+        conns = []
+
+        def _conn(**kwargs):
+            conn = Mock()
+            conn.head_object.side_effect = lambda b, o: (time.sleep(
+                0.01 if o.endswith("0") else 0), {"x-object-meta-name": o})[1]
+            conns.append(conn)
+            return conn
+
+        names = ["o%s" % i for i in range(20)]
+        with patch("swiftclient.client.Connection", side_effect=_conn):
+            metas = self.stor.object_meta_get_many(names, workers=4)
+        assert [m["name"] for m in metas] == ["pre/%s" % n for n in names]
+        assert 1 < len(conns) <= 4
+
+    def test_thread_connections_reused_and_closed(self):
+        import concurrent.futures
+        self.stor.storageurl, self.stor.authtoken = "url", "token"
+        self.stor._connection = lambda **kwargs: Mock()
+        with concurrent.futures.ThreadPoolExecutor(2) as pool:
+            conns = list(pool.map(lambda i: self.stor._thread_conn(), range(20)))
+        assert len(set(conns)) == len(self.stor.threadconns) <= 2
+        assert self.stor._thread_conn() is self.stor.swiftconn
+        self.stor.close()
+        for conn in set(conns):
+            conn.close.assert_called_once_with()
+        self.stor.swiftconn.close.assert_called_once_with()
+        assert self.stor.threadconns == []
+        # a worker started after close() opens a new connection
+        with concurrent.futures.ThreadPoolExecutor(1) as pool:
+            assert pool.submit(self.stor._thread_conn).result() not in conns
+
+    def test_object_writer_segments(self):
+        import json
+        seg = Mock()
+        seg.put_object.side_effect = lambda c, o, data: "etag-%s" % data
+        self.stor._connection = lambda **kwargs: seg
+        with self.stor.object_writer("big.txt", {"a": "b"}, text=True,
+                                     part_size=4, workers=2) as f:
+            f.write("0123456789")
+        assert seg.put_object.call_count == 3
+        args, kwargs = self.stor.swiftconn.put_object.call_args
+        assert args[:2] == ("bucket", "pre/big.txt")
+        assert kwargs["query_string"] == "multipart-manifest=put"
+        assert kwargs["headers"] == {"x-object-meta-a": "b"}
+        manifest = json.loads(args[2])
+        assert [m["etag"] for m in manifest] == \
+            ["etag-b'0123'", "etag-b'4567'", "etag-b'89'"]
+        assert manifest[0]["path"].startswith("/.segments_bucket/pre/big.txt/")
+
+    def test_object_put_streams_as_segments(self):
+        import io
+        seg = Mock()
+        seg.put_object.return_value = "etag"
+        self.stor._connection = lambda **kwargs: seg
+        self.stor.part_size = 4
+        conn = self.stor.swiftconn
+        self.stor.object_put("small.txt", "0123")
+        assert conn.put_object.call_args[0][:3] == ("bucket", "pre/small.txt", b"0123")
+        self.stor.object_put("big.txt", "0123456789", {"a": "b"})
+        assert conn.put_object.call_args[1]["query_string"] == "multipart-manifest=put"
+        assert seg.put_object.call_count == 3
+        # a file object is read in parts instead of sent as one request
+        self.stor.object_put("file.txt", io.BytesIO(b"012345"))
+        assert conn.put_object.call_args[0][1] == "pre/file.txt"
+        assert seg.put_object.call_count == 5
+        self.stor.object_put("tiny.txt", io.BytesIO(b"01"))
+        assert conn.put_object.call_args[0][:3] == ("bucket", "pre/tiny.txt", b"01")
+
+    def test_object_put_from_threads(self):
+        import concurrent.futures
+        conns = []
+
+        def _conn(**kwargs):
+            conns.append(Mock())
+            conns[-1].put_object.return_value = "etag"
+            return conns[-1]
+
+        self.stor._connection = _conn
+        self.stor.part_size = 4
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            list(pool.map(lambda i: self.stor.object_put("o%s" % i, "0123456789"),
+                          range(8)))
+        # writers in worker threads never share the main connection
+        self.stor.swiftconn.put_object.assert_not_called()
+        self.stor.swiftconn.put_container.assert_not_called()
+        manifests = [c for conn in conns for c in conn.put_object.call_args_list
+                     if c[1].get("query_string") == "multipart-manifest=put"]
+        assert sorted(c[0][1] for c in manifests) == \
+            ["pre/o%s" % i for i in range(8)]
+
+    def test_object_writer_abort(self):
+        seg = Mock()
+        seg.put_object.return_value = "etag"
+        self.stor._connection = lambda **kwargs: seg
+        with self.assertRaises(RuntimeError):
+            with self.stor.object_writer("big.dat", part_size=2) as f:
+                f.write(b"0123")
+                raise RuntimeError()
+        self.stor.swiftconn.put_object.assert_not_called()
+        assert self.stor.swiftconn.delete_object.call_count == \
+            seg.put_object.call_count
+
+    def test_object_get_cache(self):
+        import swiftclient
+        self.stor.cache = sci.store._objcache(self.tmpdir.name + "/cache", 10)
+        conn = self.stor.swiftconn
+        conn.get_object.return_value = ({"etag": "e1"}, b"12345")
+        assert self.stor.object_get("a") == b"12345"
+        conn.get_object.side_effect = swiftclient.exceptions.ClientException(
+            "not modified", http_status=304)
+        assert self.stor.object_get("a") == b"12345"
+        assert conn.get_object.call_args[1]["headers"] == {"If-None-Match": "e1"}
+        assert self.stor.cache.stats() == {"hits": 1, "misses": 1, "evictions": 0}
+
+        # least recently used objects are evicted beyond the size limit
+        conn.get_object.side_effect = None
+        conn.get_object.return_value = ({"etag": "e2"}, b"678901")
+        assert self.stor.object_get("b") == b"678901"
+        assert self.stor.cache.etag("bucket", "pre/a") is None
+        assert self.stor.cache.stats()["evictions"] == 1
+
+    def test_sync_up_only_changed_files(self):
+        import hashlib, os
+        folder = self.tmpdir.name + "/data"
+        os.makedirs(folder + "/sub")
+        for name, content in (("a.txt", b"hello"), ("sub/b.txt", b"x" * 10),
+                              (".hidden", b"no")):
+            with open(os.path.join(folder, name), "wb") as f:
+                f.write(content)
+        self.stor.swiftconn.get_container.return_value = ({}, [
+            {"name": "pre/a.txt", "bytes": 5, "content_type": "text/plain",
+             "hash": hashlib.md5(b"hello").hexdigest(), "last_modified": "x"},
+            {"name": "pre/sub/b.txt", "bytes": 10, "content_type": "text/plain",
+             "hash": "changed", "last_modified": "x"}])
+        self.stor._upload_files = lambda targets: [o for p, o in targets]
+        with patch("sci.store._file_etags", wraps=sci.store._file_etags) as etags:
+            assert self.stor.sync_up(folder) == ["pre/sub/b.txt"]
+            assert etags.call_count == 2
+            # checksums of unchanged files are read from the manifest
+            self.stor.sync_up(folder)
+            assert etags.call_count == 2
+
+    def test_file_download_resume_and_segments(self):
+        import json, os
+        objects = {("bucket", "pre/small"): b"0123456789",
+                   ("seg", "s0"): b"abcd", ("seg", "s1"): b"efg"}
+        manifest = json.dumps([{"name": "/seg/s0", "bytes": 4},
+                               {"name": "/seg/s1", "bytes": 3}])
+
+        def _head(container, obj):
+            if obj == "pre/large":
+                return {"content-length": "7", "etag": "e",
+                        "x-static-large-object": "True"}
+            return {"content-length": "10", "etag": "e"}
+
+        def _get(container, obj, resp_chunk_size=None, headers=None,
+                 query_string=None):
+            if query_string == "multipart-manifest=get":
+                return {}, manifest
+            data = objects[(container, obj)]
+            if headers and "Range" in headers:
+                data = data[int(headers["Range"][6:-1]):]
+            return {}, [data]
+
+        conn = Mock()
+        conn.head_object.side_effect = _head
+        conn.get_object.side_effect = _get
+        self.stor._thread_conn = lambda: conn
+        folder = self.tmpdir.name
+        os.makedirs(folder + "/pre")
+        with open(folder + "/pre/small.part", "wb") as f:
+            f.write(b"0123")
+        files = self.stor.file_download(["small", "large"], folder)
+        assert files == [folder + "/pre/small", folder + "/pre/large"]
+        with open(folder + "/pre/small", "rb") as f:
+            assert f.read() == b"0123456789"
+        with open(folder + "/pre/large", "rb") as f:
+            assert f.read() == b"abcdefg"
+        ranges = [c[1]["headers"] for c in conn.get_object.call_args_list
+                  if c[0][1] == "pre/small"]
+        assert ranges == [{"Range": "bytes=4-", "If-Match": "e"}]
+        assert sorted(os.listdir(folder + "/pre")) == ["large", "small"]
+
+    def test_token_cache_shared_and_refreshed(self):
+        import os, stat
+        folder = self.tmpdir.name + "/swift"
+        auth = Mock(side_effect=[("url", "t1"), ("url", "t2"), ("url", "t3")])
+        tokens = sci.store._tokencache("https://keystone:5000/v2.0", "AUTH_x",
+                                       60, folder)
+        assert tokens.get(auth) == ("url", "t1")
+        # another process reuses the token without authenticating
+        other = sci.store._tokencache("https://keystone:5000/v2.0", "AUTH_x",
+                                      60, folder)
+        assert other.get(auth) == ("url", "t1")
+        assert auth.call_count == 1
+        assert stat.S_IMODE(os.stat(tokens.tokenfile).st_mode) == 0o600
+        # a rejected token is only replaced once
+        assert tokens.get(auth, stale="t1") == ("url", "t2")
+        assert other.get(auth, stale="t1") == ("url", "t2")
+        assert auth.call_count == 2
+        # expired tokens are refreshed
+        os.utime(tokens.tokenfile, (0, 0))
+        assert other.get(auth) == ("url", "t3")
+        assert auth.call_count == 3
+
+    def test_connection_reauth_on_401(self):
+        import swiftclient
+        self.stor.tokens = sci.store._tokencache(
+            "https://keystone:5000/v2.0", "AUTH_x", 60, self.tmpdir.name)
+        self.stor.tokens._write(self.stor.tokens.urlfile, "http://swift/v1")
+        self.stor.tokens._write(self.stor.tokens.tokenfile, "old")
+        self.stor.connargs = dict(authurl="https://keystone:5000/v2.0",
+                                  user="u", key="k", starting_backoff=0)
+
+        def _head(url, token, **kwargs):
+            if token != "new":
+                raise swiftclient.exceptions.ClientException("", http_status=401)
+            return {"x-account-object-count": "1"}
+
+        with patch("swiftclient.client.get_auth",
+                   return_value=("http://swift/v1", "new")) as get_auth, \
+                patch("swiftclient.client.head_account", side_effect=_head):
+            conn = self.stor._connection("http://swift/v1", "old")
+            assert conn.head_account() == {"x-account-object-count": "1"}
+            assert get_auth.call_count == 1
+            # new connections use the refreshed token from the cache
+            conn = self.stor._connection()
+            assert conn.head_account() == {"x-account-object-count": "1"}
+            assert get_auth.call_count == 1
+
+
+try:
+    import moto
+except ImportError:
+    moto = None
+try:
+    import zstandard, lz4.frame, pyarrow
+except ImportError:
+    zstandard = lz4 = pyarrow = None
+
+
+@unittest.skipUnless(moto, "moto is not installed")
+class S3StoreTestCase(unittest.TestCase):
+    def setUp(self):
+        import os
+        import boto3
+        env = {"AWS_ACCESS_KEY_ID": "test", "AWS_SECRET_ACCESS_KEY": "test",
+               "AWS_DEFAULT_REGION": "us-east-1"}
+        self.env = patch.dict(os.environ, env)
+        self.env.start()
+        self.mock = moto.mock_aws()
+        self.mock.start()
+        boto3.client("s3").create_bucket(Bucket="bucket")
+        self.stor = sci.store.s3("bucket", "pre", part_size=5242880)
+
+    def tearDown(self):
+        self.mock.stop()
+        self.env.stop()
+
+    def test_put_get_filter(self):
+        self.stor.object_put("a.txt", "hello", {"tag": "new"})
+        self.stor.object_put_json("b.json", [1, 2], {"tag": "old"})
+        assert self.stor.bucket_list() == ["pre/a.txt", "pre/b.json"]
+        assert self.stor.bucket_list({"tag": "new"}) == ["pre/a.txt"]
+        assert self.stor.object_get_range("a.txt", 1, 3) == b"el"
+        assert list(self.stor.object_iter_json("b.json")) == [1, 2]
+        self.stor.object_meta_set("a.txt", {"tag": "old"})
+        assert self.stor.object_meta_get("a.txt") == {"tag": "old"}
+
+    def test_second_sync_does_nothing(self):
+        import os, tempfile
+        with tempfile.TemporaryDirectory() as folder:
+            # larger than part_size, uploaded as multipart with etag md5-2
+            with open(folder + "/big.bin", "wb") as f:
+                f.write(os.urandom(6 * 1024 * 1024))
+            with open(folder + "/small.txt", "w") as f:
+                f.write("hello")
+            assert self.stor.sync_up(folder) == ["pre/big.bin", "pre/small.txt"]
+            etags = {i["name"]: i["etag"] for i in self.stor.bucket_iter()}
+            assert etags["pre/big.bin"].strip('"').endswith("-2")
+            assert self.stor.sync_up(folder) == []
+            assert self.stor.sync_down(folder) == []
+
+    def test_download_replaces_complete_files_only(self):
+        import os, tempfile
+        self.stor.object_put("a.txt", "new")
+        with tempfile.TemporaryDirectory() as folder:
+            path = folder + "/a.txt"
+            with open(path, "w") as f:
+                f.write("old")
+
+            def _fail(bucket, key, filename, Config=None):
+                with open(filename, "w") as f:
+                    f.write("n")
+                raise IOError("connection reset")
+
+            with patch.object(self.stor.s3conn, "download_file", side_effect=_fail):
+                with self.assertRaises(IOError):
+                    self.stor._download_file("pre/a.txt", path)
+            with open(path) as f:
+                assert f.read() == "old"
+            self.stor._download_file("pre/a.txt", path)
+            with open(path) as f:
+                assert f.read() == "new"
+            assert os.listdir(folder) == ["a.txt"]
+
+    def test_multipart_writer(self):
+        import os
+        data = os.urandom(11 * 1024 * 1024)
+        with self.stor.object_writer("big.bin") as f:
+            for i in range(0, len(data), 1000000):
+                f.write(data[i:i + 1000000])
+        assert self.stor.object_get("big.bin") == data
+        assert self.stor.object_open("big.bin").read() == data
+
+
+class LocalStoreTestCase(unittest.TestCase):
+    """ the same calls run against the posix and the memory backend """
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        sci.store._memory_buckets.pop("test", None)
+        self.stores = [sci.store.posix(self.tmpdir.name + "/root", "pre",
+                                       part_size=4),
+                       sci.store.memory("test", "pre", part_size=4)]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_put_get_list(self):
+        for stor in self.stores:
+            stor.object_put_json("a.json", [1, 2, 3], {"tag": "new"})
+            stor.object_put_csv("pre/sub/b.csv", [["x", "y"], [1, 2]])
+            stor.object_put("c.txt", "0123456789")
+            assert stor.object_get_json("a.json") == [1, 2, 3]
+            assert list(stor.object_iter_json("a.json")) == [1, 2, 3]
+            assert list(stor.object_get_csv("pre/sub/b.csv")) == [{"x": "1", "y": "2"}]
+            assert stor.object_get_range("c.txt", 2, 5) == b"234"
+            assert stor.object_get_range("c.txt", -3) == b"789"
+            assert stor.object_get_range("c.txt", -3, 9) == b"78"
+            with stor.object_open("c.txt", blocksize=3) as f:
+                f.seek(7)
+                assert f.read() == b"789"
+            assert stor.bucket_list() == ["pre/a.json", "pre/c.txt", "pre/sub/b.csv"]
+            assert stor.bucket_list({"tag": "new"}) == ["pre/a.json"]
+            items = list(stor.bucket_iter("pre/", delimiter="/"))
+            assert [i.get("name", i.get("subdir")) for i in items] == \
+                ["pre/a.json", "pre/c.txt", "pre/sub/"]
+            stor.object_meta_set("a.json", {"tag": "old"})
+            assert stor.object_meta_get("a.json") == {"tag": "old"}
+
+    def test_writer_abort_and_transfers(self):
+        import os
+        for i, stor in enumerate(self.stores):
+            with self.assertRaises(RuntimeError):
+                with stor.object_writer("big.dat") as f:
+                    f.write(b"0123456789")
+                    raise RuntimeError()
+            assert stor.bucket_list() == []
+            folder = "%s/files%s" % (self.tmpdir.name, i)
+            os.makedirs(folder + "/sub")
+            with open(folder + "/sub/f.txt", "wb") as f:
+                f.write(b"abcdefghij")
+            assert stor.sync_up(folder) == ["pre/sub/f.txt"]
+            assert stor.object_get("pre/sub/f.txt") == b"abcdefghij"
+            assert stor.file_download(["pre/sub/f.txt"], folder) == \
+                [folder + "/pre/sub/f.txt"]
+            with open(folder + "/pre/sub/f.txt", "rb") as f:
+                assert f.read() == b"abcdefghij"
+
+    def test_second_sync_does_nothing(self):
+        import os, time
+        for i, stor in enumerate(self.stores):
+            folder = "%s/sync%s" % (self.tmpdir.name, i)
+            os.makedirs(folder + "/sub")
+            for name in ("a.txt", "sub/b.txt"):
+                with open(os.path.join(folder, name), "w") as f:
+                    f.write(name)
+            assert stor.sync_up(folder) == ["pre/a.txt", "pre/sub/b.txt"]
+            assert stor.sync_up(folder) == []
+            time.sleep(0.01)
+            with open(folder + "/a.txt", "w") as f:
+                f.write("changed")
+            assert stor.sync_up(folder) == ["pre/a.txt"]
+            down = folder + "_down"
+            assert len(stor.sync_down(down)) == 2
+            assert stor.sync_down(down) == []
+            assert stor.sync_up(folder) == []
+
+    def test_copy_between_stores(self):
+        src, dst = self.stores[1], self.stores[0]
+        src.object_put("a.txt", b"x" * 10, {"tag": "a"})
+        src.object_put("sub/b.txt", b"y")
+        src.object_put("other/c.txt", b"z")
+        assert sci.store.copy(src, dst, "pre/") == ["pre/a.txt"]
+        assert sci.store.copy(src, dst, ["sub/b.txt", "missing"]) == ["sub/b.txt"]
+        assert dst.object_get("a.txt") == b"x" * 10
+        assert dst.object_meta_get("a.txt") == {"tag": "a"}
+        assert dst.object_get("sub/b.txt") == b"y"
+
+    def test_gzip_codec(self):
+        import gzip, json
+        stor = self.stores[1]
+        stor.object_put_json("a.json.gz", [{"x": 1}] * 100)
+        raw = stor.object_get("a.json.gz")
+        assert raw[:2] == b"\x1f\x8b"
+        assert json.loads(gzip.decompress(raw)) == [{"x": 1}] * 100
+        assert stor.object_get_json("a.json.gz") == [{"x": 1}] * 100
+        # the codec is detected from the first bytes without extension
+        stor.object_put_csv("b.csv", [["x"], ["1"]], codec="gzip")
+        assert list(stor.object_iter_csv("b.csv")) == [{"x": "1"}]
+        assert list(stor.object_get_csv("b.csv")) == [{"x": "1"}]
+        stor.object_put_pickle("c.dat", {"a": 1})
+        assert stor.object_get_pickle("c.dat") == {"a": 1}
+
+
+class RetryPolicyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        sci.store._memory_buckets.pop("retry", None)
+        self.events = []
+        self.policy = sci.store.retrypolicy(attempts=3, backoff=0,
+            hook=lambda *args: self.events.append(args[:3]))
+        self.stor = sci.store.memory("retry", "pre", part_size=4,
+                                     retry=self.policy)
+        self.stor.object_put("a.txt", "0123456789")
+
+    def _flaky(self, func, errors):
+        """ func that raises the errors first, then works """
+        errors = list(errors)
+
+        def _call(*args, **kwargs):
+            if errors:
+                raise errors.pop(0)
+            return func(*args, **kwargs)
+        return _call
+
+    def test_transient_errors_are_retried(self):
+        import swiftclient
+        busy = swiftclient.ClientException("busy", http_status=503)
+        self.stor._get = self._flaky(self.stor._get, [busy, ConnectionResetError()])
+        assert self.stor.object_get("a.txt") == b"0123456789"
+        self.stor._get_stream = self._flaky(self.stor._get_stream, [TimeoutError()])
+        assert b"".join(self.stor.object_get_stream("a.txt", 4)) == b"0123456789"
+        assert self.events == [("retry", "get", 1), ("retry", "get", 2),
+                               ("retry", "get", 1)]
+        assert self.policy.stats()["get"] == {"calls": 2, "retries": 3, "failures": 0}
+
+    def test_failures_raise_store_error(self):
+        import swiftclient
+        with self.assertRaises(sci.store.StoreError) as ctx:
+            self.stor.object_get("missing.txt")
+        assert (ctx.exception.status, ctx.exception.attempts) == (404, 1)
+        busy = swiftclient.ClientException("busy", http_status=503)
+        self.stor._meta_get = self._flaky(self.stor._meta_get, [busy] * 3)
+        with self.assertRaises(sci.store.StoreError) as ctx:
+            self.stor.object_meta_get("a.txt")
+        assert (ctx.exception.status, ctx.exception.attempts) == (503, 3)
+        assert ctx.exception.__cause__ is busy
+        # a consumed stream cannot be uploaded again
+        put = Mock(side_effect=[busy, None])
+        with self.assertRaises(sci.store.StoreError):
+            self.policy.call("put", put, idempotent=False)
+        assert put.call_count == 1
+        assert self.policy.stats()["meta"]["failures"] == 1
+        assert self.events[-1][:2] == ("failure", "put")
+
+    def test_metrics(self):
+        import json, os, tempfile
+        traces = []
+        m = sci.store.metrics(callback=lambda *args: traces.append(args))
+        self.stor.metrics = m
+        self.stor._get = self._flaky(self.stor._get, [TimeoutError()])
+        assert self.stor.object_get("a.txt") == b"0123456789"
+        self.stor.object_put("b.txt", b"x" * 10)
+        with self.assertRaises(sci.store.StoreError):
+            self.stor.object_meta_get("missing.txt")
+        stats = {s["op"]: s for s in m.stats()}
+        assert (stats["get"]["requests"], stats["get"]["retries"],
+                stats["get"]["bytes"]) == (1, 1, 10)
+        # start, 3 parts of 4 bytes and finish
+        assert (stats["put"]["requests"], stats["put"]["bytes"]) == (5, 10)
+        assert stats["meta"]["errors"] == 1
+        assert sum(stats["get"]["histogram"]) == 1
+        assert traces[0][:3] == ("memory", "retry", "get")
+        text = m.to_prometheus()
+        assert 'sci_store_bytes_total{backend="memory",bucket="retry",op="put"} 10' in text
+        assert 'sci_store_request_seconds_bucket{backend="memory",bucket="retry",' \
+            'op="get",le="+Inf"} 1' in text
+        with tempfile.TemporaryDirectory() as tmpdir:
+            m.dump(os.path.join(tmpdir, "m.json"))
+            with open(os.path.join(tmpdir, "m.json")) as f:
+                assert len(json.load(f)["operations"]) == 3
+
+
+class AioTestCase(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        sci.store._memory_buckets.pop("aio", None)
+        self.stores = [sci.store.posix(self.tmpdir.name, "pre"),
+                       sci.store.memory("aio", "pre")]
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_roundtrip(self):
+        import asyncio
+
+        async def _main(astor):
+            async with astor:
+                await astor.object_put_many({"a.txt": b"A", "b.txt": "B"},
+                                            {"tag": "x"})
+                await astor.object_put_json("c.json", {"c": 1})
+                names = [i["name"] async for i in astor.bucket_iter(page_size=2)]
+                contents = await astor.object_get_many(["a.txt", "b.txt", "nope"],
+                                                       return_exceptions=True)
+                return (names, contents, await astor.object_get_json("c.json"),
+                        await astor.object_meta_get("a.txt"))
+
+        for stor in self.stores:
+            names, contents, j, meta = asyncio.run(_main(sci.store.aio(stor)))
+            assert names == ["pre/a.txt", "pre/b.txt", "pre/c.json"]
+            assert contents[:2] == [b"A", b"B"]
+            assert isinstance(contents[2], sci.store.StoreError)
+            assert j == {"c": 1} and meta == {"tag": "x"}
+
+    def test_bucket_list_filter_with_index(self):
+        import asyncio
+        stor = self.stores[1]
+        # the index is opened here and queried from the executor threads
+        stor.metaindex = sci.store._metaindex(self.tmpdir.name + "/index.sqlite")
+        stor.object_put("a.txt", b"A", {"tag": "x"})
+        stor.object_put("b.txt", b"B", {"tag": "y"})
+
+        async def _main(astor):
+            async with astor:
+                return [await astor.bucket_list({"tag": "x"}) for i in range(2)]
+
+        assert asyncio.run(_main(sci.store.aio(stor))) == [["pre/a.txt"]] * 2
+        assert list(stor.metaindex.get("aio", "pre")) == ["pre/a.txt", "pre/b.txt"]
+
+    def test_concurrency_limit(self):
+        import asyncio, time
+        stor = self.stores[1]
+        stor.object_put("a.txt", b"A")
+        running, peak = [0], [0]
+        get = stor._get
+
+        def _get(*args):
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            running[0] -= 1
+            return get(*args)
+
+        stor._get = _get
+        astor = sci.store.aio(stor, concurrency=3, workers=8)
+        contents = asyncio.run(astor.object_get_many(["a.txt"] * 12))
+        assert contents == [b"A"] * 12
+        assert peak[0] <= 3
+
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class _swiftserver(object):
+    """ a swift store against the swift stand-in of the benchmarks """
+
+    def setUp(self):
+        import sys, tempfile
+        sys.path.insert(0, os.path.join(os.path.dirname(
+            os.path.abspath(__file__)), "benchmarks"))
+        import swiftserver
+        self.swiftserver = swiftserver
+        self.server = swiftserver.start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.env = patch.dict(os.environ, {
+            "OS_STORAGE_URL": self.server.storageurl,
+            "OS_AUTH_TOKEN": swiftserver.TOKEN, "OS_TENANT_NAME": "test",
+            "OS_PASSWORD": "", "HOME": self.tmpdir.name})
+        self.env.start()
+        self.stor = sci.store.swift("bucket", "pre")
+        self.stor.swiftconn.put_container("bucket")
+
+    def tearDown(self):
+        self.stor.close()
+        self.env.stop()
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+
+class SwiftServerTestCase(_swiftserver, unittest.TestCase):
+
+    def test_upload_files_with_retry_policy(self):
+        self.stor.retry = sci.store.retrypolicy(backoff=0.01)
+        put = self.swiftserver.SwiftHandler._put
+        failed = []
+
+        def _put(handler, container, objname, body):
+            # the first upload of a.txt fails, b.txt is always rejected
+            if objname == "pre/a.txt" and objname not in failed or \
+                    objname == "pre/b.txt":
+                failed.append(objname)
+                return handler._send(503 if objname == "pre/a.txt" else 403)
+            return put(handler, container, objname, body)
+
+        paths = []
+        for name in ("a.txt", "b.txt"):
+            paths.append(os.path.join(self.tmpdir.name, name))
+            with open(paths[-1], "w") as f:
+                f.write(name)
+        with patch.object(self.swiftserver.SwiftHandler, "_put", _put):
+            assert self.stor.file_upload(paths, "pre/") == ["pre/a.txt"]
+        assert self.stor.object_get("a.txt") == b"a.txt"
+        assert self.stor.object_meta_get("a.txt")["uploaded-by"]
+        stats = self.stor.retry.stats()["upload"]
+        assert stats["retries"] == 1 and stats["failures"] == 1
+        assert sorted(failed) == ["pre/a.txt", "pre/b.txt"]
+
+
+    def test_get_range_negative_start(self):
+        self.stor.object_put("c.txt", "0123456789")
+        assert self.stor.object_get_range("c.txt", -3) == b"789"
+        assert self.stor.object_get_range("c.txt", -3, 9) == b"78"
+        assert self.stor.object_get_range("c.txt", -20, 2) == b"01"
+        assert sci.store._range_header(-3) == "bytes=-3"
+        with self.assertRaises(ValueError):
+            sci.store._range_header(-3, 9)
+
+
+@unittest.skipUnless(aiohttp, "aiohttp required")
+class AioSwiftTestCase(_swiftserver, unittest.TestCase):
+    """ the aiohttp client of aio against the swift stand-in """
+
+    def test_native_requests(self):
+        import asyncio
+
+        async def _main(astor):
+            async with astor:
+                await astor.object_put_many({"a.txt": b"A", "b.txt": "B"},
+                                            {"tag": "x"})
+                names = [i["name"] async for i in astor.bucket_iter(page_size=1)]
+                contents = await astor.object_get_many(["a.txt", "b.txt", "nope"],
+                                                       return_exceptions=True)
+                return names, contents, await astor.object_meta_get("a.txt")
+
+        astor = sci.store.aio(self.stor)
+        assert isinstance(astor.native, sci.store._swiftaio)
+        names, contents, meta = asyncio.run(_main(astor))
+        assert names == ["pre/a.txt", "pre/b.txt"]
+        assert contents[:2] == [b"A", b"B"]
+        assert isinstance(contents[2], sci.store.StoreError)
+        assert meta == {"tag": "x"}
+        assert self.server.containers["bucket"]["pre/a.txt"]["meta"] == \
+            {"x-object-meta-tag": "x"}
+
+    def test_rejected_token_is_renewed(self):
+        import asyncio, swiftclient
+        self.stor.object_put("a.txt", b"A")
+        threads = []
+
+        async def _get(astor):
+            async with astor:
+                return await astor.object_get("a.txt")
+
+        def _auth(conn):
+            threads.append(threading.current_thread())
+            return self.server.storageurl, "renewed"
+
+        # the token expired, with a password swiftclient can get a new one
+        self.stor.connargs["key"] = "secret"
+        with patch.object(self.swiftserver, "TOKEN", "renewed"), \
+                patch.object(swiftclient.client.Connection, "get_auth", _auth):
+            assert asyncio.run(_get(sci.store.aio(self.stor))) == b"A"
+        assert self.stor.authtoken == "renewed"
+        assert len(threads) == 1 and threads[0] is not threading.main_thread()
+        assert self.stor.tokens.read()[1] == "renewed"
+
+
+@unittest.skipUnless(zstandard and lz4 and pyarrow,
+                     "zstandard, lz4 or pyarrow is not installed")
+class CodecTableTestCase(unittest.TestCase):
+    def setUp(self):
+        sci.store._memory_buckets.pop("codec", None)
+        self.stor = sci.store.memory("codec", "pre", part_size=64)
+
+    def test_zstd_lz4_streaming(self):
+        items = [{"n": i, "s": "x" * i} for i in range(200)]
+        self.stor.object_put_json("a.json.zst", items)
+        assert self.stor.object_get("a.json.zst")[:4] == b"\x28\xb5\x2f\xfd"
+        assert list(self.stor.object_iter_json("a.json.zst", 16)) == items
+        self.stor.object_put_pickle("b.pkl.lz4", items)
+        assert self.stor.object_get_pickle("b.pkl.lz4") == items
+        with self.stor.object_writer("c.csv", codec="lz4", text=True) as f:
+            f.write("a,b\r\n1,2\r\n")
+        assert list(self.stor.object_iter_csv("c.csv")) == [{"a": "1", "b": "2"}]
+
+    def test_table_roundtrip(self):
+        table = pyarrow.table({"id": list(range(1000)),
+                               "name": ["n%s" % i for i in range(1000)]})
+        for name in ("t.parquet", "t.arrow"):
+            self.stor.object_put_table(name, table)
+            got = self.stor.object_get_table(name, ["name"])
+            assert got.column_names == ["name"]
+            assert got.column("name").to_pylist() == table.column("name").to_pylist()
+
+
+class CloudWriterTestCase(unittest.TestCase):
+
+    def test_google_writer_composes_in_groups(self):
+        blobs = {}
+        store = Mock(gsbucket=Mock(), _call=sci.store.retrypolicy().call)
+        store.gsbucket.blob.side_effect = lambda name: blobs.setdefault(name, Mock())
+        with sci.store._gswriter(store, "pre/big", {"k": "v"}, 4, 3) as w:
+            w.write(b"x" * 4 * 40)
+        parts = [blobs[n] for n in sorted(blobs) if n != "pre/big"]
+        final = blobs["pre/big"]
+        # 40 parts need two compose calls, the second appends to the first
+        self.assertEqual(final.compose.call_count, 2)
+        self.assertEqual(final.compose.call_args_list[0][0][0], parts[:32])
+        self.assertEqual(final.compose.call_args_list[1][0][0], [final] + parts[32:])
+        self.assertEqual(final.metadata, {"k": "v"})
+        self.assertEqual(store.gsbucket.delete_blobs.call_args[0][0], parts)
+
+    def test_azure_writer_commits_blocks_in_order(self):
+        client = Mock()
+        store = Mock(_call=sci.store.retrypolicy().call)
+        store.container.get_blob_client.return_value = client
+        w = sci.store._azwriter(store, "pre/big", {"k": "v"}, 4, 2)
+        w.write(b"abcdefghij")
+        w.close()
+        staged = [c[0][0] for c in client.stage_block.call_args_list]
+        self.assertEqual(len(staged), 3)
+        blocks = client.commit_block_list.call_args[0][0]
+        self.assertEqual([b.id for b in blocks], sorted(staged))
+        self.assertEqual(client.commit_block_list.call_args[1]["metadata"], {"k": "v"})
+
+
+def _google_store(handler):
+    """ a google store whose client sends json api requests to handler """
+    from google.cloud import storage
+    stor = sci.store.google.__new__(sci.store.google)
+    stor.gsconn = storage.Client.create_anonymous_client()
+    stor.gsconn._connection.api_request = \
+        lambda method, path, query_params=None, **kw: handler(
+            method, path, dict(query_params or {}), **kw)
+    stor.gsbucket = stor.gsconn.bucket("bucket")
+    stor.bucket, stor.prefix, stor.part_size, stor.workers = \
+        "bucket", "pre", 4, 1
+    return stor
+
+
+def _azure_session(handler):
+    """ a requests session that answers azure blob requests with handler """
+    import io, urllib.parse, requests, requests.adapters, urllib3
+
+    class adapter(requests.adapters.BaseAdapter):
+        def send(self, request, **kwargs):
+            url = urllib.parse.urlsplit(request.url)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            status, headers, body = handler(request.method, url.path,
+                query, request.headers, request.body)
+            headers.setdefault("x-ms-version", "2021-08-06")
+            r = requests.Response()
+            r.status_code = status
+            r.headers.update(headers)
+            r.raw = urllib3.HTTPResponse(io.BytesIO(body),
+                headers=headers, status=status, preload_content=False,
+                request_method=request.method)
+            r.request, r.url = request, request.url
+            return r
+
+        def close(self):
+            pass
+
+    session = requests.Session()
+    session.mount("http://", adapter())
+    return session
+
+
+def _azure_store(handler):
+    """ an azure store whose container client sends requests to handler """
+    from azure.storage.blob import ContainerClient
+    from azure.core.pipeline.transport import RequestsTransport
+    stor = sci.store.azure.__new__(sci.store.azure)
+    stor.container = ContainerClient("http://acct.blob.local", "bucket",
+        credential=None, max_chunk_get_size=4, max_single_get_size=4,
+        retry_total=0,
+        transport=RequestsTransport(session=_azure_session(handler)))
+    stor.bucket, stor.prefix, stor.part_size, stor.workers = \
+        "bucket", "pre", 4, 1
+    return stor
+
+
+def _azure_listing(blobs, marker=""):
+    """ the xml body of a blob listing, blobs are (name, md5, metadict) """
+    entries = "".join(
+        "<Blob><Name>%s</Name><Properties>"
+        "<Last-Modified>Wed, 01 Jan 2020 00:00:00 GMT</Last-Modified>"
+        "<Etag>\"0x1\"</Etag><Content-Length>5</Content-Length>"
+        "<Content-Type>text/plain</Content-Type>"
+        "<Content-MD5>%s</Content-MD5><BlobType>BlockBlob</BlobType>"
+        "</Properties><Metadata>%s</Metadata></Blob>" % (name, md5,
+            "".join("<%s>%s</%s>" % (k, v, k) for k, v in meta.items()))
+        for name, md5, meta in blobs)
+    return ('<?xml version="1.0" encoding="utf-8"?><EnumerationResults '
+            'ServiceEndpoint="http://acct.blob.local/" ContainerName="bucket">'
+            '<Blobs>%s</Blobs><NextMarker>%s</NextMarker>'
+            '</EnumerationResults>' % (entries, marker)).encode()
+
+
+class CloudSyncTestCase(unittest.TestCase):
+    """ sync compares local files to the checksums the sdk lists """
+
+    def setUp(self):
+        import tempfile
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+        for name, content in (("a.txt", b"hello"), ("b.txt", b"world")):
+            with open(os.path.join(self.folder, name), "wb") as f:
+                f.write(content)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_google_md5_and_crc32c(self):
+        import base64, google_crc32c
+        # b.txt is a composite object listed with a crc32c only
+        items = [{"name": "pre/a.txt", "size": "5", "etag": "e1",
+                  "updated": "2020-01-01T00:00:00Z", "contentType": "text/plain",
+                  "md5Hash": "XUFAKrxLKna5cZ2REBfFkg==", "crc32c": "mnG7TA=="},
+                 {"name": "pre/b.txt", "size": "5", "etag": "e2",
+                  "updated": "2020-01-01T00:00:00Z", "contentType": "text/plain",
+                  "crc32c": "MhEKbw=="}]
+        stor = _google_store(lambda method, path, query, **kw: {"items": items})
+        stor._upload_files = lambda targets: [o for p, o in targets]
+        assert stor.sync_up(self.folder) == ["pre/b.txt"]
+        items[1]["crc32c"] = base64.b64encode(
+            google_crc32c.Checksum(b"world").digest()).decode()
+        assert stor.sync_up(self.folder) == []
+
+    def test_azure_content_md5(self):
+        import base64, hashlib
+        blobs = [("pre/a.txt", "XUFAKrxLKna5cZ2REBfFkg==", {}),
+                 ("pre/b.txt", "", {})]
+        stor = _azure_store(lambda method, path, query, headers, body:
+            (200, {"Content-Type": "application/xml"}, _azure_listing(blobs)))
+        stor._upload_files = lambda targets: [o for p, o in targets]
+        assert stor.sync_up(self.folder) == ["pre/b.txt"]
+        md5 = base64.b64encode(hashlib.md5(b"world").digest()).decode()
+        blobs[1] = ("pre/b.txt", md5, {})
+        assert stor.sync_up(self.folder) == []
+
+
+class GoogleStoreTestCase(unittest.TestCase):
+
+    def test_download_replaces_complete_files_only(self):
+        import tempfile
+        blob = Mock(size=3)
+
+        def _download(filename):
+            with open(filename, "wb") as f:
+                f.write(b"n")
+            raise IOError("connection reset")
+
+        blob.download_to_filename.side_effect = _download
+        stor = _google_store(None)
+        stor._blob = lambda objname: blob
+        with tempfile.TemporaryDirectory() as folder:
+            path = folder + "/a"
+            with open(path, "wb") as f:
+                f.write(b"old")
+            with self.assertRaises(IOError):
+                stor._download_file("pre/a", path)
+            with open(path, "rb") as f:
+                assert f.read() == b"old"
+            blob.download_to_filename.side_effect = \
+                lambda filename: open(filename, "wb").close()
+            stor._download_file("pre/a", path)
+            assert os.listdir(folder) == ["a"] and os.path.getsize(path) == 0
+
+
+class AzureStoreTestCase(unittest.TestCase):
+    """ the azure store against the sdk with a fake blob service """
+
+    def setUp(self):
+        self.blobs = {"pre/a": [b"0123456789", {"uploaded_2dby": "x"}],
+                      "pre/b": [b"hello", {"uploaded_by": "old"}]}
+        self.requests = []
+        self.stor = _azure_store(self._handle)
+
+    def _handle(self, method, path, query, headers, body):
+        import re
+        self.requests.append((method, path, query, headers))
+        name = path.split("/", 2)[2] if path.count("/") > 1 else None
+        if query.get("comp") == "list":
+            names = sorted(n for n in self.blobs if n > query.get("marker", ""))
+            size = int(query.get("maxresults", 1000))
+            marker = names[size - 1] if len(names) > size else ""
+            return 200, {"Content-Type": "application/xml"}, _azure_listing(
+                [(n, "", {}) for n in names[:size]], marker)
+        if query.get("comp") == "metadata":
+            self.blobs[name][1] = {k[10:]: v for k, v in headers.items()
+                                   if k.lower().startswith("x-ms-meta-")}
+            return 200, {"ETag": '"0x2"'}, b""
+        data, meta = self.blobs[name]
+        props = {"ETag": '"0x1"', "x-ms-blob-type": "BlockBlob",
+                 "Last-Modified": "Wed, 01 Jan 2020 00:00:00 GMT"}
+        props.update(("x-ms-meta-" + k, v) for k, v in meta.items())
+        if method == "HEAD":
+            props["Content-Length"] = str(len(data))
+            return 200, props, b""
+        start, end = map(int, re.findall(r"\d+", headers["x-ms-range"]))
+        chunk = data[start:end + 1]
+        props["Content-Length"] = str(len(chunk))
+        props["Content-Range"] = "bytes %s-%s/%s" % (
+            start, start + len(chunk) - 1, len(data))
+        return 206, props, chunk
+
+    def test_metadata_keys_round_trip(self):
+        meta = {"uploaded-by": "me", "run_id": "1", "tag": "a"}
+        self.stor.object_meta_set("a", meta)
+        assert self.blobs["pre/a"][1] == \
+            {"uploaded_2dby": "me", "run_5fid": "1", "tag": "a"}
+        assert self.stor.object_meta_get("a") == meta
+        # keys set by other tools are returned unchanged
+        assert self.stor.object_meta_get("b") == {"uploaded_by": "old"}
+
+    def test_bucket_list_pages_and_filter(self):
+        items = list(self.stor.bucket_iter(page_size=1))
+        assert [i["name"] for i in items] == ["pre/a", "pre/b"]
+        assert [r[2].get("marker") for r in self.requests] == [None, "pre/a"]
+        assert items[0]["last_modified"] == "2020-01-01T00:00:00+00:00"
+        assert self.stor.bucket_list({"uploaded-by": "x"}) == ["pre/a"]
+
+    def test_get_stream_chunk_size(self):
+        chunks = list(self.stor.object_get_stream("a", chunk_size=3))
+        assert chunks == [b"012", b"345", b"678", b"9"]
+        ranges = [r[3]["x-ms-range"] for r in self.requests]
+        assert ranges == ["bytes=0-2", "bytes=3-5", "bytes=6-8", "bytes=9-11"]
+        # the later ranges fail if the blob was replaced meanwhile
+        assert [r[3].get("If-Match") for r in self.requests] == \
+            [None] + ['"0x1"'] * 3
+
+    def test_download_replaces_complete_files_only(self):
+        import tempfile
+        handle = self._handle
+
+        def _fail(method, path, query, headers, body):
+            # the second range of the blob fails
+            if headers.get("x-ms-range", "").startswith("bytes=4"):
+                return 500, {}, b""
+            return handle(method, path, query, headers, body)
+
+        self.stor = _azure_store(_fail)
+        with tempfile.TemporaryDirectory() as folder:
+            path = folder + "/a"
+            with open(path, "wb") as f:
+                f.write(b"old")
+            with self.assertRaises(Exception):
+                self.stor._download_file("pre/a", path)
+            with open(path, "rb") as f:
+                assert f.read() == b"old"
+            self.stor = _azure_store(handle)
+            self.stor._download_file("pre/a", path)
+            with open(path, "rb") as f:
+                assert f.read() == b"0123456789"
+            assert os.listdir(folder) == ["a"]
+
+
+class StreamingDecodeTestCase(unittest.TestCase):
+    def _chunks(self, data, size=3):
+        return iter([data[i:i + size] for i in range(0, len(data), size)])
+
+    def test_iter_json_small_chunks(self):
+        import json
+        items = [{"a": i, "b": "x,]" * i} for i in range(20)] + [12345, []]
+        handle = sci.store._texthandle(self._chunks(json.dumps(items).encode()))
+        assert list(sci.store._iter_json(handle, 2)) == items
+
+    def test_texthandle_csv_multibyte(self):
+        import csv
+        data = 'a,b\n1,"x\ny"\n\u00e4,2\n'.encode("utf-8")
+        rows = list(csv.reader(sci.store._texthandle(self._chunks(data, 1))))
+        assert rows == [["a", "b"], ["1", "x\ny"], ["\u00e4", "2"]]
+
+    def test_rangereader_block_cache(self):
+        data = bytes(range(256)) * 4
+        calls = []
+
+        def _get_range(start, end):
+            calls.append((start, end))
+            return data[start:end]
+
+        f = sci.store._rangereader(_get_range, len(data), 100, 4, 2)
+        assert f.read(150) == data[:150]
+        assert calls == [(0, 100), (100, 400)]
+        f.seek(-24, 2)
+        assert f.read() == data[-24:]
+        f.seek(120)
+        assert f.read(10) == data[120:130]
+        assert len(calls) == 3
+
+
+class SqliteTestCase(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = sci.db.sqlite(os.path.join(self.tmp.name, "test.sqlite"))
+        self.db.execute("create table t (id integer, name text)")
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_execute_fetch(self):
+        n = self.db.execute("insert into t values (1, 'a'), (2, 'b')")
+        assert n == 2
+        rows = self.db.fetch("select * from t order by id")
+        assert rows == [{"id": 1, "name": "a"}, {"id": 2, "name": "b"}]
+
+    def test_fetch_stream(self):
+        self.db.execute("insert into t values " +
+            ",".join("(%d, 'x')" % i for i in range(25)))
+        rows = self.db.fetch("select id from t", stream=True, batch_size=10)
+        assert not isinstance(rows, list)
+        assert [r["id"] for r in rows] == list(range(25))
+        assert self.db.pool.stats()["idle"] == self.db.pool.stats()["size"]
+
+    def test_failed_execute_rolls_back(self):
+        with self.assertRaises(Exception):
+            with self.db.pool.connection() as conn:
+                conn.execute("insert into t values (1, 'a')")
+                raise ValueError("fail")
+        assert self.db.fetch("select * from t") == []
+
+    def test_params(self):
+        assert self.db.executemany("insert into t values (?, ?)",
+                                   [(1, "a'b"), (2, None)]) == 2
+        assert self.db.execute("update t set name = ? where id = ?", ("c", 2)) == 1
+        assert self.db.fetch("select name from t where id = ?", (1,)) == \
+            [{"name": "a'b"}]
+        rows = self.db.fetch("select id from t where id > ?", (0,), stream=True)
+        assert [r["id"] for r in rows] == [1, 2]
+
+    def test_bulk_insert(self):
+        import io
+        assert self.db.bulk_insert("t", [(i, "n%d" % i) for i in range(25)],
+                                   batch_size=10) == 25
+        assert self.db.bulk_insert("t", [{"name": "d", "id": 100}]) == 1
+        csvfile = io.BytesIO(b"id,name\n200,c1\n201,c2\n")
+        assert self.db.bulk_insert("t", csvfile) == 2
+        assert self.db.bulk_insert("t", []) == 0
+        rows = self.db.fetch("select count(*) as n, max(id) as m from t")
+        assert rows == [{"n": 28, "m": 201}]
+        assert self.db.fetch("select name from t where id = 100") == [{"name": "d"}]
+        # the pragmas are restored
+        assert self.db.fetch("pragma synchronous") == [{"synchronous": 2}]
+
+    def test_bulk_insert_temp_table(self):
+        with self.db.pool.connection() as conn:
+            conn.execute("create temp table tmp (id integer)")
+        assert self.db.bulk_insert("tmp", [(i,) for i in range(5)]) == 5
+        assert self.db.fetch("select count(*) as n from tmp") == [{"n": 5}]
+
+    def test_bulk_insert_failure_rolls_back(self):
+        with self.assertRaises(Exception):
+            self.db.bulk_insert("t", [(1, "a"), (2, "b", "c")], batch_size=1)
+        assert self.db.fetch("select * from t") == []
+
+    @unittest.skipUnless(zstandard and pyarrow, "zstandard and pyarrow required")
+    def test_object_roundtrip(self):
+        stor = sci.store.memory("bucket", "pre")
+        rows = [(i, "name %d" % i if i % 3 else None) for i in range(25)]
+        self.db.bulk_insert("t", rows)
+        self.db.execute("create table u (id integer, name text)")
+        for objname in ("t.csv.zst", "t.jsonl", "t.parquet"):
+            assert self.db.fetch_to_object("select * from t order by id", stor,
+                                           objname, batch_size=10) == 25
+            assert self.db.insert_from_object("u", stor, objname,
+                                              batch_size=7) == 25
+            result = self.db.fetch("select * from u order by id")
+            assert [(r["id"], r["name"]) for r in result] == rows
+            self.db.execute("delete from u")
+        assert stor.object_get("t.csv.zst")[:4] == b"\x28\xb5\x2f\xfd"
+        assert self.db.pool.stats()["idle"] == self.db.pool.stats()["size"]
+        with self.assertRaises(ValueError):
+            self.db.fetch_to_object("select * from t", stor, "t.xml")
+
+    @unittest.skipUnless(pyarrow, "pyarrow required")
+    def test_object_empty_result(self):
+        import pyarrow.parquet
+        stor = sci.store.memory("bucket", "pre")
+        for objname in ("t.csv", "t.parquet"):
+            assert self.db.fetch_to_object("select id, name from t", stor,
+                                           objname) == 0
+        assert stor.object_get("t.csv") == b"id,name\r\n"
+        with stor.object_open("t.parquet") as f:
+            table = pyarrow.parquet.read_table(f)
+        assert table.column_names == ["id", "name"] and table.num_rows == 0
+        assert self.db.insert_from_object("t", stor, "t.parquet") == 0
+
+    @unittest.skipUnless(pyarrow, "pyarrow required")
+    def test_object_parquet_null_batches(self):
+        import pyarrow.parquet
+        stor = sci.store.memory("bucket", "pre")
+        rows = [(i, "name %d" % i if i >= 12 else None) for i in range(25)]
+        self.db.bulk_insert("t", rows)
+        assert self.db.fetch_to_object("select id, name, null as x from t "
+            "order by id", stor, "t.parquet", batch_size=5) == 25
+        with stor.object_open("t.parquet") as f:
+            table = pyarrow.parquet.read_table(f)
+        assert str(table.schema.field("name").type) == "string"
+        assert str(table.schema.field("x").type) == "null"
+        assert list(zip(table.column("id").to_pylist(),
+                        table.column("name").to_pylist())) == rows
+
+    def test_prefetch(self):
+        def _items():
+            yield 1
+            yield 2
+            raise KeyError("x")
+
+        items = sci.db._prefetch(_items())
+        assert next(items) == 1 and next(items) == 2
+        with self.assertRaises(KeyError):
+            next(items)
+        closed = threading.Event()
+
+        def _endless():
+            try:
+                while True:
+                    yield 0
+            finally:
+                closed.set()
+
+        items = sci.db._prefetch(_endless())
+        next(items)
+        items.close()
+        assert closed.wait(2)
+
+
+class DbCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "test.sqlite")
+        self.db = sci.db.sqlite(self.path, cache=self.tmp.name + "/cache")
+        self.db.execute("create table t (id integer)")
+        self.db.execute("insert into t values (1)")
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_hits_and_invalidation(self):
+        db = self.db
+        assert db.fetch("select * from t") == [{"id": 1}]
+        db.pool.connect().execute("insert into t values (2)").connection.commit()
+        assert db.fetch("select *\n  from t ;") == [{"id": 1}]
+        assert db.fetch("select * from t", cache=False) == [{"id": 1}, {"id": 2}]
+        assert db.cache.stats()["hits"] == 1
+        db.invalidate("T")
+        assert len(db.fetch("select * from t")) == 2
+        db.execute("delete from t where id = ?", (2,))
+        assert db.fetch("select * from t") == [{"id": 1}]
+        db.bulk_insert("t", [(3,)])
+        assert len(db.fetch("select * from t")) == 2
+        assert db.cache.stats()["misses"] == 4
+
+    def test_cte_keeps_cache(self):
+        db = self.db
+        assert db.fetch("select * from t") == [{"id": 1}]
+        db.execute("with\tx as (select id from t) select * from x")
+        db.execute("WITH x AS (select 1) select * from x, t")
+        assert db.fetch("select * from t") == [{"id": 1}]
+        assert db.cache.stats()["hits"] == 1
+
+    def test_data_modifying_cte_invalidates(self):
+        db = self.db
+        db.execute("create table j (id integer)")
+        db.execute("insert into j values (1), (2)")
+        assert db.fetch("select count(*) as n from j") == [{"n": 2}]
+        db.execute("with old as (select 1) delete from j")
+        assert db.fetch("select count(*) as n from j") == [{"n": 0}]
+        # only the target of the statement is invalidated
+        assert db.fetch("select * from t") == [{"id": 1}]
+        db.execute("with new as (select 5 as id) insert into j select id from new")
+        assert db.fetch("select * from t") == [{"id": 1}]
+        assert db.fetch("select count(*) as n from j") == [{"n": 1}]
+        assert db.cache.stats()["hits"] == 1
+
+    def test_disk_tier_and_ttl(self):
+        import time
+        assert self.db.fetch("select id from t") == [{"id": 1}]
+        other = sci.db.sqlite(self.path, cache=self.tmp.name + "/cache")
+        other.pool.connect().execute("insert into t values (2)").connection.commit()
+        # rows of the first object come from the shared file
+        assert other.fetch("select id from t") == [{"id": 1}]
+        assert other.cache.stats()["hits"] == 1
+        other.cache.ttl = 0
+        other.invalidate()
+        other.fetch("select id from t")
+        time.sleep(0.01)
+        assert len(other.fetch("select id from t")) == 2
+        assert other.cache.stats()["misses"] == 2
+
+    def test_size_eviction(self):
+        cache = sci.db._resultcache("x", 60, 80)
+        for i in range(5):
+            cache.put(str(i), ["t"], [{"id": i}])
+        assert cache.get("0") is None and cache.get("4") == [{"id": 4}]
+        assert cache.stats()["size"] <= 80
+        assert cache.stats()["evictions"] > 0
+
+
+class DbPoolTestCase(unittest.TestCase):
+    def test_postgres_copy_batch(self):
+        import io
+        cur = Mock()
+        cur.copy_expert.side_effect = lambda sql, f: setattr(cur, "data", f.read())
+        sci.db.postgres._insert_batch(None, cur, "t", ["id", "name"],
+                                      [(1, 'a,"b"'), (2, None), (3, ""), (4.5, True)])
+        assert cur.copy_expert.call_args[0][0] == \
+            "COPY t (id, name) FROM STDIN WITH (FORMAT csv)"
+        assert cur.data == '1,"a,""b"""\n2,\n3,""\n4.5,"True"\n'
+
+    def test_postgres_copy_bytes_and_json(self):
+        cur = Mock()
+        cur.copy_expert.side_effect = lambda sql, f: setattr(cur, "data", f.read())
+        sci.db.postgres._insert_batch(None, cur, "t", ["data", "doc"],
+                                      [(b"\x00hi", {"a": "b", "n": [1, None]}),
+                                       (bytearray(b""), [1, "x"])])
+        assert cur.data == '\\x006869,"{""a"": ""b"", ""n"": [1, null]}"\n' \
+            '\\x,"[1, ""x""]"\n'
+
+    def test_postgres_prepared_statements(self):
+        db = sci.db.postgres.__new__(sci.db.postgres)
+        db.statement_cache = 2
+        db.pool = sci.db._pool(Mock, Mock(), 1, 1, 30)
+        conn, cur = db.pool.acquire(), Mock()
+        for sql in ("select %s", "select %s", "select %s, %s", "select 1"):
+            db._execute(conn, cur, sql, (1,) * sql.count("%s"))
+        sqls = [c[0][0] for c in cur.execute.call_args_list]
+        assert sqls.pop(0) == "DEALLOCATE ALL"
+        prepares = [s for s in sqls if s.startswith("PREPARE")]
+        assert len(prepares) == 3 and prepares[1].endswith("AS select $1, $2")
+        assert sqls[1].startswith("EXECUTE") and sqls[2] == sqls[1]
+        assert sqls[-2].startswith("DEALLOCATE") and sqls[-1].startswith("EXECUTE")
+        assert cur.execute.call_args_list[2][0][1] == (1,)
+        db._execute(conn, cur, "select %(a)s", {"a": 1})
+        cur.execute.assert_called_with("select %(a)s", {"a": 1})
+        for sql in ("create table t (id int)", "set work_mem = %s",
+                    "copy t from stdin"):
+            db._execute(conn, cur, sql, ())
+            cur.execute.assert_called_with(sql, ())
+        db._execute(conn, cur, "insert into t values (%s)", (1,))
+        sqls = [c[0][0] for c in cur.execute.call_args_list]
+        assert sqls[-1].startswith("EXECUTE")
+        assert any(s.endswith("AS insert into t values ($1)") for s in sqls)
+
+    def test_postgres_statements_after_rollback(self):
+        db = sci.db.postgres.__new__(sci.db.postgres)
+        db.statement_cache = 4
+        ping = Mock()
+        db.pool = sci.db._pool(Mock, ping, 1, 1, 0)
+
+        def _run():
+            with db.pool.connection() as conn:
+                cur = conn.cursor()
+                cur.reset_mock()
+                db._execute(conn, cur, "select %s", (1,))
+                return [c[0][0].split()[0] for c in cur.execute.call_args_list]
+
+        assert _run() == ["DEALLOCATE", "PREPARE", "EXECUTE"]
+        assert _run() == ["EXECUTE"]
+        # statements prepared in a rolled back transaction may be gone
+        with self.assertRaises(KeyError):
+            with db.pool.connection() as conn:
+                raise KeyError()
+        conn.rollback.assert_called_once_with()
+        assert _run() == ["DEALLOCATE", "PREPARE", "EXECUTE"]
+        # the new connection that replaces a broken one prepares them too
+        ping.side_effect = Exception("gone")
+        assert _run() == ["DEALLOCATE", "PREPARE", "EXECUTE"]
+        assert db.pool.stats()["broken"] == 1
+
+    def test_mssql_cursor_cache(self):
+        db = sci.db.mssql.__new__(sci.db.mssql)
+        db.statement_cache = 1
+        db.pool = sci.db._pool(Mock, Mock(), 1, 1, 30)
+        conn = db.pool.acquire()
+        conn.cursor.side_effect = Mock
+        with db._cursor(conn, "select ?") as first:
+            pass
+        with db._cursor(conn, "select ?") as cur:
+            assert cur is first
+        first.close.assert_not_called()
+        with db._cursor(conn, "select 1") as cur:
+            assert cur is not first
+        first.close.assert_called_once_with()
+        # a rollback forgets the cursors and closes them
+        db.pool.reset(conn)
+        cur.close.assert_called_once_with()
+        with db._cursor(conn, "select 1") as other:
+            assert other is not cur
+
+    def test_reuse_and_limit(self):
+        pool = sci.db._pool(Mock, Mock(), 1, 2, 30)
+        first = pool.acquire()
+        pool.release(first)
+        assert pool.acquire() is first
+        other = threading.Thread(target=pool.acquire)
+        other.start()
+        other.join()
+        with self.assertRaises(TimeoutError):
+            pool.acquire(timeout=0.01)
+        pool.release(first)
+        assert pool.acquire(timeout=0.01) is first
+        assert pool.stats()["opened"] == 2
+
+    def test_nested_query_in_stream_raises(self):
+        db = sci.db.sqlite(":memory:")
+        db.execute("create table t (id integer)")
+        db.bulk_insert("t", [(1,), (2,)])
+        rows = db.fetch("select * from t", stream=True)
+        assert next(rows) == {"id": 1}
+        # the only connection is used by the stream of this thread
+        with self.assertRaises(RuntimeError):
+            db.fetch("select count(*) from t")
+        assert list(rows) == [{"id": 2}]
+        assert db.fetch("select count(*) as n from t") == [{"n": 2}]
+
+    def test_health_check_replaces_broken(self):
+        ping = Mock(side_effect=Exception("gone"))
+        pool = sci.db._pool(Mock, ping, 1, 1, 0)
+        old = pool.idle[0][0]
+        new = pool.acquire()
+        assert new is not old
+        old.close.assert_called_once_with()
+        assert pool.stats()["broken"] == 1
+
+    def test_getdbpasswd(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as home:
+            os.mkdir(os.path.join(home, ".sci"))
+            with open(os.path.join(home, ".sci", ".dbpasswd"), "w") as f:
+                f.write("other:5432:db:me:no\n*:5432:db:me:pw:with:colon\n")
+            with patch.dict(os.environ, {"HOME": home}):
+                assert sci.db._getdbpasswd("h", 5432, "db", "me") == "pw:with:colon"
+                assert sci.db._getdbpasswd("h", 3306, "db", "me") is None
+
+
 if __name__ == "__main__":
     unittest.main()